@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк доступа к SQLite из бота RUУчебник
+Сравнивает прежний подход (sqlite3.connect на каждый запрос внутри цикла
+событий) с AsyncSQLiteEngine: запросы в секунду и задержки цикла событий
+
+Запуск: python bench_database.py [--users 50] [--requests 200]
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from simple_database import DatabaseManager
+
+
+class LegacyDatabaseManager:
+    """Прежняя реализация: новое синхронное соединение на каждый вызов"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    async def get_or_create_user(self, telegram_id: int, username: str = None,
+                                 first_name: str = None, last_name: str = None):
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
+        user = cursor.fetchone()
+        if not user:
+            cursor.execute(
+                "INSERT INTO users (telegram_id, username, first_name, last_name) VALUES (?, ?, ?, ?)",
+                (telegram_id, username, first_name, last_name)
+            )
+            conn.commit()
+        conn.close()
+        return {'is_new': not bool(user)}
+
+    async def is_user_blocked(self, telegram_id: int) -> bool:
+        conn = sqlite3.connect(self.db_path)
+        result = conn.execute("SELECT is_blocked FROM users WHERE telegram_id = ?", (telegram_id,)).fetchone()
+        conn.close()
+        return bool(result and result[0])
+
+    async def get_textbooks_by_class_and_subject(self, class_name: str, subject: str):
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute(
+            "SELECT id, title, author, class_name, subject, downloads FROM textbooks "
+            "WHERE class_name = ? AND subject = ?", (class_name, subject)
+        ).fetchall()
+        conn.close()
+        return rows
+
+    async def increment_download_count(self, textbook_id: int):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("UPDATE textbooks SET downloads = downloads + 1 WHERE id = ?", (textbook_id,))
+        conn.commit()
+        conn.close()
+
+
+async def seed(db_path: str):
+    """Создание схемы и тестовых учебников"""
+    manager = DatabaseManager(db_path)
+    await manager.initialize()
+    rows = [
+        (f"Учебник {i}", f"Автор {i % 17}", f"{i % 11 + 1} класс", "math", f"/tmp/{i}.pdf")
+        for i in range(500)
+    ]
+    await manager.engine.executemany(
+        "INSERT INTO textbooks (title, author, class_name, subject, file_path) VALUES (?, ?, ?, ?, ?)",
+        rows
+    )
+    await manager.close()
+
+
+async def monitor_loop(stop: asyncio.Event, lags: list, interval: float = 0.001):
+    """Замер задержек цикла событий (насколько позже планового просыпаемся)"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+async def user_session(db, user_id: int, requests: int):
+    """Типичная последовательность запросов одного пользователя"""
+    for i in range(requests // 4):
+        await db.is_user_blocked(user_id)
+        await db.get_or_create_user(user_id, f"user{user_id}", "Имя", "Фамилия")
+        await db.get_textbooks_by_class_and_subject(f"{i % 11 + 1} класс", "math")
+        await db.increment_download_count(i % 500 + 1)
+
+
+async def run_case(name: str, db, users: int, requests: int):
+    stop = asyncio.Event()
+    lags: list = []
+    monitor = asyncio.create_task(monitor_loop(stop, lags))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user_session(db, 1000 + u, requests) for u in range(users)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await monitor
+    total = users * (requests // 4) * 4
+    lags.sort()
+    p99 = lags[int(len(lags) * 0.99)] if lags else 0.0
+    print(f"{name:<22} {total / elapsed:>10.0f} запр/с   "
+          f"задержка цикла: p99 {p99 * 1000:7.2f} мс, макс {max(lags, default=0) * 1000:7.2f} мс")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        await seed(db_path)
+
+        print(f"Пользователей: {args.users}, запросов на пользователя: {args.requests}")
+        await run_case("sqlite3.connect/запрос", LegacyDatabaseManager(db_path), args.users, args.requests)
+
+        manager = DatabaseManager(db_path)
+        await manager.initialize()
+        try:
+            await run_case("AsyncSQLiteEngine", manager, args.users, args.requests)
+        finally:
+            await manager.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк хранилища состояний FSM RUУчебник
+Сравнивает MemoryStorage aiogram с SQLiteStorage (кеш вмещает всех
+пользователей и кеш на 10% пользователей): задержка get_state/set_state/
+update_data, память, сохранение состояний после перезапуска и истечение TTL
+
+Запуск: python bench_fsm_storage.py [--users 20000] [--steps 100000]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from fsm_storage import SQLiteStorage
+
+BOT_ID = 123456
+STATES = ["BotStates:main_menu", "BotStates:selecting_class", "BotStates:selecting_subject",
+          "BotStates:viewing_textbooks"]
+
+
+def storage_key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=BOT_ID, chat_id=user_id, user_id=user_id)
+
+
+def percentile(values, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1e6
+
+
+async def measure(storage, users: int, steps: int):
+    """
+    Шаг обработчика: get_state, set_state, update_data (как при нажатии кнопки)
+
+    Returns: (мкс на операцию по видам, пиковая память в МБ)
+    """
+    random.seed(users)
+    keys = [storage_key(user_id) for user_id in range(users)]
+    # Прогрев: у каждого пользователя уже есть состояние
+    for key in keys:
+        await storage.set_state(key, STATES[0])
+        await storage.set_data(key, {'class': 5})
+
+    timings = {'get_state': [], 'set_state': [], 'update_data': []}
+    perf = time.perf_counter
+    tracemalloc.start()
+    for step in range(steps):
+        key = keys[random.randrange(users)]
+        started = perf()
+        await storage.get_state(key)
+        after_get = perf()
+        await storage.set_state(key, STATES[step % len(STATES)])
+        after_set = perf()
+        await storage.update_data(key, {"subject": f"subject_{step % 12}"})
+        finished = perf()
+        timings['get_state'].append(after_get - started)
+        timings['set_state'].append(after_set - after_get)
+        timings['update_data'].append(finished - after_set)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return timings, peak / 1024 / 1024
+
+
+async def check_restart(path: str) -> None:
+    """Состояния, записанные до закрытия, читаются после открытия заново"""
+    storage = SQLiteStorage(path)
+    await storage.set_state(storage_key(1), "BotStates:viewing_textbooks")
+    await storage.set_data(storage_key(1), {'class': 7, 'subject': 'Алгебра'})
+    await storage.set_state(storage_key(2), None)
+    await storage.close()
+
+    reopened = SQLiteStorage(path, cache_size=16)
+    state = await reopened.get_state(storage_key(1))
+    data = await reopened.get_data(storage_key(1))
+    restored = sum([
+        state == "BotStates:viewing_textbooks",
+        data == {'class': 7, 'subject': 'Алгебра'},
+    ])
+    stored = await reopened.engine.fetchone("SELECT COUNT(*) AS n FROM fsm_states")
+    await reopened.close()
+    print(f"Перезапуск: состояние и данные восстановлены ({restored}/2), строк в базе {stored['n']}")
+
+
+async def check_ttl(path: str) -> None:
+    """Состояние без изменений дольше ttl читается пустым и удаляется очисткой"""
+    storage = SQLiteStorage(path, ttl=0.2)
+    await storage.set_state(storage_key(1), "BotStates:main_menu")
+    await storage.flush()
+    await asyncio.sleep(0.3)
+    removed = await storage.purge_expired()
+    state = await storage.get_state(storage_key(1))
+    await storage.close()
+    print(f"TTL: удалено истекших {removed}, состояние после истечения {state!r}")
+
+
+async def run(args) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        variants = [
+            ("MemoryStorage", lambda: MemoryStorage()),
+            ("SQLite, кеш 100%", lambda: SQLiteStorage(os.path.join(tmp, "hot.db"), cache_size=args.users)),
+            ("SQLite, кеш 10%", lambda: SQLiteStorage(os.path.join(tmp, "cold.db"),
+                                                       cache_size=max(1, args.users // 10))),
+        ]
+        print(f"Пользователей: {args.users}, шагов: {args.steps}")
+        print(f"{'хранилище':<18} {'get p50/p99, мкс':>18} {'set p50/p99, мкс':>18} "
+              f"{'update p50/p99, мкс':>20} {'память, МБ':>11} {'попадания':>10}")
+        for name, factory in variants:
+            storage = factory()
+            timings, memory_mb = await measure(storage, args.users, args.steps)
+            hit_ratio = "-"
+            if isinstance(storage, SQLiteStorage):
+                stats = storage.stats()
+                hit_ratio = f"{stats['hit_ratio']:.0%}"
+                started = time.perf_counter()
+                await storage.close()
+                print(f"  ({name}: закрытие с записью последней пачки {(time.perf_counter() - started) * 1000:.0f} мс, "
+                      f"записано изменений {stats['flushed'] + stats['pending']})")
+            else:
+                await storage.close()
+            columns = [
+                f"{percentile(timings[op], 0.5):.1f}/{percentile(timings[op], 0.99):.1f}"
+                for op in ('get_state', 'set_state', 'update_data')
+            ]
+            print(f"{name:<18} {columns[0]:>18} {columns[1]:>18} {columns[2]:>20} "
+                  f"{memory_mb:>11.1f} {hit_ratio:>10}")
+
+        await check_restart(os.path.join(tmp, "hot.db"))
+        await check_ttl(os.path.join(tmp, "ttl.db"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=20_000)
+    parser.add_argument('--steps', type=int, default=100_000)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк ограничителя частоты запросов RUУчебник
+Сравнивает прежний подход (список времен запросов на пользователя,
+пересобираемый при каждой проверке) с TokenBucketLimiter:
+время одной проверки и память при разном числе активных пользователей
+
+Запуск: python bench_rate_limiter.py [--checks 300000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from rate_limiter import TokenBucketLimiter
+
+
+class LegacyRateLimiter:
+    """Прежняя реализация: список времен запросов в окне для каждого пользователя"""
+
+    def __init__(self, max_requests: int, window_seconds: float):
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self.storage = {}
+
+    def is_limited(self, user_id: int) -> bool:
+        current_time = time.time()
+        user_requests = self.storage.get(user_id, [])
+        cutoff_time = current_time - self.window_seconds
+        user_requests = [req_time for req_time in user_requests if req_time > cutoff_time]
+        if len(user_requests) >= self.max_requests:
+            return True
+        user_requests.append(current_time)
+        self.storage[user_id] = user_requests
+        return False
+
+
+def measure(limiter, users: int, checks: int):
+    """Среднее время проверки (нс) и прирост памяти (МБ)"""
+    user_ids = [random.randrange(users) for _ in range(checks)]
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    for user_id in user_ids:
+        limiter.is_limited(user_id)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Повторный прогон без tracemalloc - чистое время проверки
+    started = time.perf_counter()
+    for user_id in user_ids:
+        limiter.is_limited(user_id)
+    elapsed = time.perf_counter() - started
+
+    return elapsed / checks * 1e9, peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--checks', type=int, default=300_000)
+    parser.add_argument('--requests', type=int, default=10, help="Запросов в окне")
+    parser.add_argument('--window', type=float, default=60.0, help="Окно в секундах")
+    args = parser.parse_args()
+
+    print(f"Проверок на прогон: {args.checks}, лимит {args.requests} за {args.window:.0f} с")
+    print(f"{'пользователей':>14} {'список, нс':>12} {'список, МБ':>11} {'bucket, нс':>12} {'bucket, МБ':>11}")
+    for users in (1_000, 10_000, 100_000):
+        random.seed(users)
+        legacy_ns, legacy_mb = measure(LegacyRateLimiter(args.requests, args.window), users, args.checks)
+        random.seed(users)
+        bucket = TokenBucketLimiter(rate=args.requests / args.window, capacity=args.requests)
+        bucket_ns, bucket_mb = measure(bucket, users, args.checks)
+        print(f"{users:>14} {legacy_ns:>12.0f} {legacy_mb:>11.1f} {bucket_ns:>12.0f} {bucket_mb:>11.1f}")
+
+    # Горячий пользователь: прежняя проверка пересобирает список из 10 элементов,
+    # token bucket делает те же несколько операций
+    bucket = TokenBucketLimiter(rate=1000.0, capacity=1000.0)
+    legacy = LegacyRateLimiter(1000, args.window)
+    for name, limiter in (("список", legacy), ("bucket", bucket)):
+        started = time.perf_counter()
+        for _ in range(20_000):
+            limiter.is_limited(42)
+        print(f"Один активный пользователь, лимит 1000 ({name}): "
+              f"{(time.perf_counter() - started) / 20_000 * 1e9:.0f} нс/проверка")
+
+
+if __name__ == "__main__":
+    main()
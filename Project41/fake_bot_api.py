@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Локальная замена Telegram Bot API для нагрузочных испытаний RUУчебник
+Реализует getUpdates, setWebhook, sendMessage, editMessageText, sendPhoto,
+sendDocument, answerCallbackQuery, deleteMessage и служебные методы запуска,
+с настраиваемой задержкой ответа и искусственными ошибками 429
+
+Бот подключается к серверу через переменную TELEGRAM_API_URL:
+    python fake_bot_api.py --port 8081 --latency-ms 30 --flood-rate 0.01
+    TELEGRAM_API_URL=http://127.0.0.1:8081 BOT_TOKEN=123456:FAKE python src/enhanced_bot.py
+
+Обновления для бота добавляются через POST /fake/updates (JSON объекта Update
+без update_id), счетчики вызовов - GET /fake/stats.
+Нагрузочный сценарий целиком - load_generator.py.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+from aiohttp import web
+
+BOT_USER = {"id": 4242, "is_bot": True, "first_name": "RUУчебник", "username": "fake_ruuchebnik_bot"}
+
+# Методы, на которые не действуют задержка и искусственные 429
+SERVICE_METHODS = {
+    "getme", "getupdates", "setwebhook", "deletewebhook", "getwebhookinfo",
+    "setmycommands", "deletemycommands", "close", "logout",
+}
+
+# Методы, создающие сообщение в чате
+SEND_METHODS = {"sendmessage", "sendphoto", "senddocument"}
+
+
+class FakeBotAPI:
+    """
+    Сервер, отвечающий как api.telegram.org
+
+    Хранит сообщения каждого чата с их клавиатурами (редактирование
+    меняет сохраненное сообщение), поэтому имитатор пользователя видит
+    то же, что увидел бы человек. Каждый вызов API публикуется в очередь
+    событий своего чата (events(chat_id)); ответ на callback относится
+    к чату, из которого пришло нажатие.
+
+    Обновления выдаются через getUpdates (долгий опрос) или, если бот
+    вызвал setWebhook, отправляются POST-запросом на его адрес.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 upload_ms_per_mb: float = 0.0, flood_rate: float = 0.0,
+                 retry_after: int = 1, max_rps: float = 0.0, seed: Optional[int] = None):
+        """
+        Args:
+            latency_ms: Задержка ответа на каждый вызов
+            jitter_ms: Случайный разброс задержки (+-)
+            upload_ms_per_mb: Дополнительная задержка на мегабайт загружаемого файла
+            flood_rate: Доля вызовов, получающих 429 Too Many Requests
+            retry_after: retry_after в ответах 429
+            max_rps: Предел вызовов в секунду на весь бот (0 - без предела)
+            seed: Зерно генератора случайных чисел
+        """
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.upload_per_mb = upload_ms_per_mb / 1000
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.max_rps = max_rps
+        self.random = random.Random(seed)
+
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1000)
+        self._file_ids = itertools.count(1)
+        self._pending: List[Dict[str, Any]] = []
+        self._new_updates = asyncio.Event()
+        self.webhook: Optional[Tuple[str, str]] = None
+        self._webhook_session: Optional[aiohttp.ClientSession] = None
+        self._webhook_tasks = set()
+        self.connected = asyncio.Event()
+
+        # Время появления обновления и выдачи его боту
+        self.created_at: Dict[int, float] = {}
+        self.delivered_at: Dict[int, float] = {}
+
+        self.calls = Counter()
+        self.flooded = Counter()
+        # Вызовы, на которые Telegram ответил бы 400: метод -> число
+        self.bad_requests = Counter()
+        self.chat_calls: Dict[Any, Counter] = defaultdict(Counter)
+        self.messages: Dict[Any, Dict[int, Dict[str, Any]]] = defaultdict(dict)
+        self._callback_chats: Dict[str, Any] = {}
+        self._events: Dict[Any, asyncio.Queue] = {}
+
+        self._tokens = max_rps
+        self._tokens_updated = time.monotonic()
+
+    # ------------------------------------------------------------------
+    # Обновления
+    # ------------------------------------------------------------------
+
+    def push_update(self, update: Dict[str, Any]) -> int:
+        """Новое обновление для бота; возвращает его update_id"""
+        update_id = next(self._update_ids)
+        update = dict(update, update_id=update_id)
+        self.created_at[update_id] = time.perf_counter()
+
+        callback = update.get("callback_query")
+        if callback:
+            self._callback_chats[callback["id"]] = callback["message"]["chat"]["id"]
+
+        if self.webhook is not None:
+            task = asyncio.create_task(self._post_webhook(update))
+            self._webhook_tasks.add(task)
+            task.add_done_callback(self._webhook_tasks.discard)
+        else:
+            self._pending.append(update)
+            self._new_updates.set()
+        return update_id
+
+    async def _post_webhook(self, update: Dict[str, Any]) -> None:
+        url, secret = self.webhook
+        if self._webhook_session is None:
+            self._webhook_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0))
+        headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+        self.delivered_at[update["update_id"]] = time.perf_counter()
+        try:
+            async with self._webhook_session.post(url, json=update, headers=headers) as response:
+                body = await response.read()
+            # Бот может ответить вызовом метода прямо в ответе на webhook
+            if body and response.content_type == "application/json":
+                reply = json.loads(body)
+                if isinstance(reply, dict) and reply.get("method"):
+                    self._call(reply.pop("method").lower(), reply)
+        except aiohttp.ClientError as e:
+            print(f"⚠️ Webhook недоступен: {e}")
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        self.connected.set()
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+
+        if offset:
+            # Обновления с меньшим id подтверждены ботом
+            self._pending = [update for update in self._pending if update["update_id"] >= offset]
+        if not self._pending and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        batch = self._pending[:limit]
+        now = time.perf_counter()
+        for update in batch:
+            self.delivered_at.setdefault(update["update_id"], now)
+        return batch
+
+    # ------------------------------------------------------------------
+    # События для имитатора пользователей
+    # ------------------------------------------------------------------
+
+    def events(self, chat_id: Any) -> asyncio.Queue:
+        """Очередь вызовов API, относящихся к чату: (метод, параметры, время)"""
+        queue = self._events.get(chat_id)
+        if queue is None:
+            queue = self._events[chat_id] = asyncio.Queue()
+        return queue
+
+    def keyboard_message(self, chat_id: Any) -> Optional[Dict[str, Any]]:
+        """Последнее сообщение бота в чате, у которого есть клавиатура"""
+        for message in reversed(list(self.messages[chat_id].values())):
+            if message.get("reply_markup"):
+                return message
+        return None
+
+    def _publish(self, chat_id: Any, method: str, params: Dict[str, Any]) -> None:
+        if chat_id is None:
+            return
+        self.chat_calls[chat_id][method] += 1
+        queue = self._events.get(chat_id)
+        if queue is not None:
+            queue.put_nowait((method, params, time.perf_counter()))
+
+    # ------------------------------------------------------------------
+    # Методы Bot API
+    # ------------------------------------------------------------------
+
+    def _message(self, chat_id: Any, params: Dict[str, Any], **content) -> Dict[str, Any]:
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if int(chat_id) > 0 else "group"},
+            "from": BOT_USER,
+            **content,
+        }
+        if params.get("reply_markup"):
+            message["reply_markup"] = params["reply_markup"]
+        self.messages[chat_id][message["message_id"]] = message
+        return message
+
+    def _file(self, prefix: str) -> Dict[str, Any]:
+        number = next(self._file_ids)
+        return {"file_id": f"{prefix}{number}", "file_unique_id": f"u{prefix}{number}"}
+
+    def _call(self, method: str, params: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """Выполнение метода; возвращает (HTTP статус, тело ответа)"""
+        chat_id = params.get("chat_id")
+        if isinstance(chat_id, str) and chat_id.lstrip("-").isdigit():
+            chat_id = int(chat_id)
+        if method == "answercallbackquery":
+            chat_id = self._callback_chats.pop(params.get("callback_query_id"), None)
+
+        result: Any = True
+        if method == "getme":
+            result = BOT_USER
+        elif method == "setwebhook":
+            self.webhook = (params["url"], params.get("secret_token") or "")
+            self.connected.set()
+        elif method == "deletewebhook":
+            self.webhook = None
+            if str(params.get("drop_pending_updates")).lower() == "true":
+                self._pending.clear()
+        elif method == "getwebhookinfo":
+            result = {"url": self.webhook[0] if self.webhook else "",
+                      "has_custom_certificate": False, "pending_update_count": len(self._pending)}
+        elif method == "sendmessage":
+            result = self._message(chat_id, params, text=params.get("text", ""))
+        elif method == "sendphoto":
+            photo = self._file("photo")
+            result = self._message(chat_id, params, caption=params.get("caption"),
+                                   photo=[dict(photo, width=1280, height=720)])
+        elif method == "senddocument":
+            result = self._message(chat_id, params, caption=params.get("caption"),
+                                   document=self._file("doc"))
+        elif method in ("editmessagetext", "editmessagecaption", "editmessagereplymarkup"):
+            message_id = int(params.get("message_id") or 0)
+            message = self.messages[chat_id].pop(message_id, None)
+            if message is None:
+                # Как Telegram: правка удаленного или чужого сообщения - ошибка
+                return self._bad_request(chat_id, method, "message to edit not found")
+            # Измененное сообщение становится последним: пользователь смотрит на него
+            self.messages[chat_id][message_id] = message
+            for field in ("text", "caption"):
+                if field in params:
+                    message[field] = params[field]
+            message.pop("reply_markup", None)
+            if params.get("reply_markup"):
+                message["reply_markup"] = params["reply_markup"]
+            result = message
+        elif method == "deletemessage":
+            self.messages[chat_id].pop(int(params.get("message_id") or 0), None)
+        elif method not in ("answercallbackquery", "setmycommands", "deletemycommands", "close", "logout"):
+            return 404, {"ok": False, "error_code": 404, "description": "Not Found"}
+
+        self._publish(chat_id, method, params)
+        return 200, {"ok": True, "result": result}
+
+    def _bad_request(self, chat_id: Any, method: str, reason: str) -> Tuple[int, Dict[str, Any]]:
+        """Ответ 400; имитатор пользователя узнает об ошибке в своем чате"""
+        description = f"Bad Request: {reason}"
+        self.bad_requests[method] += 1
+        if chat_id is not None:
+            self.chat_calls[chat_id][method] += 1
+            queue = self._events.get(chat_id)
+            if queue is not None:
+                queue.put_nowait(("error", {"method": method, "description": description}, time.perf_counter()))
+        return 400, {"ok": False, "error_code": 400, "description": description}
+
+    # ------------------------------------------------------------------
+    # HTTP
+    # ------------------------------------------------------------------
+
+    def _flood(self, method: str) -> bool:
+        """Нужно ли ответить 429 на этот вызов"""
+        if method in SERVICE_METHODS:
+            return False
+        if self.max_rps:
+            now = time.monotonic()
+            self._tokens = min(self.max_rps, self._tokens + (now - self._tokens_updated) * self.max_rps)
+            self._tokens_updated = now
+            if self._tokens < 1:
+                return True
+            self._tokens -= 1
+        return self.flood_rate > 0 and self.random.random() < self.flood_rate
+
+    @staticmethod
+    async def _read_params(request: web.Request) -> Tuple[Dict[str, Any], int]:
+        """Параметры вызова (JSON, форма или multipart) и объем загруженных файлов"""
+        params: Dict[str, Any] = dict(request.query)
+        uploaded = 0
+        if request.content_type == "application/json":
+            params.update(await request.json())
+            return params, uploaded
+
+        form = await request.post()
+        for key, value in form.items():
+            if isinstance(value, web.FileField):
+                data = value.file.read()
+                uploaded += len(data)
+                params[key] = f"attach://{value.filename}"
+                continue
+            if key in ("reply_markup", "media", "entities", "caption_entities"):
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    pass
+            params[key] = value
+        return params, uploaded
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        params, uploaded = await self._read_params(request)
+        self.calls[method] += 1
+
+        if method == "getupdates":
+            return web.json_response({"ok": True, "result": await self._get_updates(params)})
+
+        if method not in SERVICE_METHODS:
+            delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+            delay += uploaded / (1024 * 1024) * self.upload_per_mb
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        if self._flood(method):
+            self.flooded[method] += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+
+        status, body = self._call(method, params)
+        return web.json_response(body, status=status)
+
+    async def handle_push(self, request: web.Request) -> web.Response:
+        update_id = self.push_update(await request.json())
+        return web.json_response({"ok": True, "update_id": update_id})
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "calls": dict(self.calls),
+            "flooded": dict(self.flooded),
+            "bad_requests": dict(self.bad_requests),
+            "pending_updates": len(self._pending),
+            "webhook": self.webhook[0] if self.webhook else None,
+        })
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=100 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.router.add_get("/bot{token}/{method}", self.handle)
+        app.router.add_post("/fake/updates", self.handle_push)
+        app.router.add_get("/fake/stats", self.handle_stats)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8081) -> web.AppRunner:
+        """Запуск сервера; остановка - await runner.cleanup() и close()"""
+        runner = web.AppRunner(self.make_app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+    async def close(self) -> None:
+        for task in list(self._webhook_tasks):
+            task.cancel()
+        await asyncio.gather(*self._webhook_tasks, return_exceptions=True)
+        if self._webhook_session is not None:
+            await self._webhook_session.close()
+
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    """Параметры сервера (общие с load_generator.py)"""
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Задержка ответа на вызов")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="Разброс задержки")
+    parser.add_argument('--upload-ms-per-mb', type=float, default=0.0, help="Задержка на МБ загрузки")
+    parser.add_argument('--flood-rate', type=float, default=0.0, help="Доля вызовов с ответом 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="retry_after в ответах 429")
+    parser.add_argument('--max-rps', type=float, default=0.0, help="Предел вызовов в секунду (сверх него - 429)")
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def server_from_args(args) -> FakeBotAPI:
+    return FakeBotAPI(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        upload_ms_per_mb=args.upload_ms_per_mb, flood_rate=args.flood_rate,
+        retry_after=args.retry_after, max_rps=args.max_rps, seed=args.seed,
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Локальная замена Telegram Bot API")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    api = server_from_args(args)
+    runner = await api.start(args.host, args.port)
+    print(f"🤖 Fake Bot API: http://{args.host}:{args.port} "
+          f"(TELEGRAM_API_URL=http://{args.host}:{args.port})")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await api.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный генератор RUУчебник: N пользователей проходят путь
+/start -> класс -> предмет -> учебник -> скачивание через локальную замену
+Bot API (fake_bot_api.py) и отчет: обновлений в секунду, задержка обработки
+p50/p99 по шагам и число вызовов Bot API на один путь пользователя
+
+Пользователь нажимает кнопки из клавиатур, которые бот действительно
+прислал, поэтому генератор работает с любым ботом RUУчебник на aiogram.
+
+Запуск:
+    python load_generator.py --local --users 500             # EnhancedRUUchebnikBot в процессе
+    python load_generator.py --local --mode webhook --scheduler --latency-ms 40
+    python load_generator.py --local --fsm-sqlite            # состояния FSM в SQLite
+    python load_generator.py --port 8081 --users 200         # внешний бот, например:
+        TELEGRAM_API_URL=http://127.0.0.1:8081 BOT_TOKEN=123456:FAKE python main.py
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from fake_bot_api import SEND_METHODS, FakeBotAPI, add_server_arguments, server_from_args
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+# Шаги пути пользователя: (название, шаблон callback_data нужной кнопки).
+# Шаг пропускается, если бот сразу показал кнопки следующего
+JOURNEY = [
+    ("rules", re.compile(r"^agree_rules$")),
+    ("menu", re.compile(r"^(menu_textbooks|inline_search)$")),
+    ("class", re.compile(r"^class_")),
+    ("subject", re.compile(r"^subject_")),
+    ("textbook", re.compile(r"^textbook_")),
+    ("download", re.compile(r"^(download_|book_)")),
+]
+
+# Дальше этого числа нажатий путь считается зациклившимся
+MAX_STEPS = 12
+
+_callback_ids = itertools.count(1)
+
+
+class JourneyStats:
+    """Задержки и исходы путей всех пользователей"""
+
+    def __init__(self):
+        # Шаг -> задержки обработки (от выдачи обновления боту до ответа)
+        self.handler: Dict[str, List[float]] = defaultdict(list)
+        # Шаг -> задержки с учетом ожидания в очереди обновлений
+        self.end_to_end: Dict[str, List[float]] = defaultdict(list)
+        self.outcomes = Counter()
+        # "шаг: ошибка Bot API" -> число путей, оборванных этой ошибкой
+        self.errors = Counter()
+        self.updates = 0
+
+
+class SimulatedUser:
+    """Пользователь, проходящий путь до скачивания учебника"""
+
+    def __init__(self, api: FakeBotAPI, user_id: int, rng: random.Random,
+                 stats: JourneyStats, timeout: float, think_time: float):
+        self.api = api
+        self.user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}",
+                     "username": f"user{user_id}", "language_code": "ru"}
+        self.chat = {"id": user_id, "type": "private", "first_name": f"User{user_id}"}
+        self.rng = rng
+        self.stats = stats
+        self.timeout = timeout
+        self.think_time = think_time
+        self.events = api.events(user_id)
+        # Ошибка Bot API в чате пользователя (ответ 400 на вызов бота)
+        self.error: Optional[str] = None
+
+    async def run(self) -> str:
+        """Путь пользователя; возвращает исход (complete, error, stuck, timeout)"""
+        step_name = "start"
+        if not await self._send_text("/start"):
+            return self._failed(step_name, "timeout")
+
+        stage = 0
+        for _ in range(MAX_STEPS):
+            step = await self._next_button(stage)
+            if step is None:
+                return self._failed(step_name, "stuck")
+            index, data, message = step
+            step_name = JOURNEY[index][0]
+            if self.think_time:
+                await asyncio.sleep(self.rng.uniform(0, self.think_time * 2))
+            if not await self._press(step_name, data, message):
+                return self._failed(step_name, "timeout")
+            if step_name == "download":
+                return "complete"
+            stage = index + 1
+        return "stuck"
+
+    def _failed(self, step: str, outcome: str) -> str:
+        """Исход оборванного пути: ошибка Bot API важнее таймаута"""
+        if self.error is None:
+            return outcome
+        self.stats.errors[f"{step}: {self.error}"] += 1
+        return "error"
+
+    def _check_error(self, method: str, params: Dict[str, Any]) -> bool:
+        if method != "error":
+            return False
+        self.error = f"{params['method']} - {params['description']}"
+        return True
+
+    def _record(self, step: str, update_id: int, answered_at: float) -> None:
+        delivered = self.api.delivered_at.get(update_id, answered_at)
+        self.stats.handler[step].append(answered_at - delivered)
+        self.stats.end_to_end[step].append(answered_at - self.api.created_at[update_id])
+
+    async def _wait_event(self, matches) -> Optional[float]:
+        """Ожидание вызова API в чате пользователя; возвращает его время"""
+        deadline = time.perf_counter() + self.timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return None
+            try:
+                method, params, at = await asyncio.wait_for(self.events.get(), remaining)
+            except asyncio.TimeoutError:
+                return None
+            if self._check_error(method, params):
+                return None
+            if matches(method, params):
+                return at
+
+    async def _send_text(self, text: str) -> bool:
+        message = {"message_id": next(_callback_ids), "date": int(time.time()),
+                   "chat": self.chat, "from": self.user, "text": text}
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        update_id = self.api.push_update({"message": message})
+        self.stats.updates += 1
+        answered_at = await self._wait_event(lambda method, params: method in SEND_METHODS)
+        if answered_at is None:
+            return False
+        self._record("start", update_id, answered_at)
+        return True
+
+    async def _press(self, step: str, data: str, message: Dict[str, Any]) -> bool:
+        callback_id = f"{self.user['id']}-{next(_callback_ids)}"
+        update_id = self.api.push_update({"callback_query": {
+            "id": callback_id,
+            "from": self.user,
+            "chat_instance": str(self.user["id"]),
+            "data": data,
+            "message": dict(message, chat=self.chat),
+        }})
+        self.stats.updates += 1
+        answered_at = await self._wait_event(
+            lambda method, params: method == "answercallbackquery" and params.get("callback_query_id") == callback_id
+        )
+        if answered_at is None:
+            return False
+        self._record(step, update_id, answered_at)
+        return True
+
+    def _find_button(self, stage: int) -> Optional[Tuple[int, str, Dict[str, Any]]]:
+        """Кнопка самого дальнего шага пути, доступная в последней клавиатуре"""
+        message = self.api.keyboard_message(self.user["id"])
+        if message is None:
+            return None
+        buttons = [button.get("callback_data") for row in message["reply_markup"].get("inline_keyboard", [])
+                   for button in row if button.get("callback_data")]
+        for index in range(len(JOURNEY) - 1, stage - 1, -1):
+            matching = [data for data in buttons if JOURNEY[index][1].match(data)]
+            if matching:
+                return index, self.rng.choice(matching), message
+        return None
+
+    async def _next_button(self, stage: int) -> Optional[Tuple[int, str, Dict[str, Any]]]:
+        """Ожидание клавиатуры со следующим шагом (ответ на callback может прийти раньше правки)"""
+        deadline = time.perf_counter() + self.timeout
+        while True:
+            found = self._find_button(stage)
+            if found is not None:
+                return found
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return None
+            try:
+                method, params, _ = await asyncio.wait_for(self.events.get(), remaining)
+            except asyncio.TimeoutError:
+                return None
+            if self._check_error(method, params):
+                return None
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000
+
+
+async def run_users(api: FakeBotAPI, args) -> Tuple[JourneyStats, float, List[int]]:
+    """Запуск пользователей; возвращает статистику, время и id пользователей"""
+    stats = JourneyStats()
+    rng = random.Random(args.seed)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    user_ids = [200000 + i for i in range(args.users)]
+
+    async def run_one(index: int, user_id: int):
+        if args.ramp:
+            await asyncio.sleep(args.ramp * index / max(args.users, 1))
+        async with semaphore:
+            user = SimulatedUser(api, user_id, random.Random(rng.random()), stats,
+                                 args.timeout, args.think_ms / 1000)
+            stats.outcomes[await user.run()] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_one(index, user_id) for index, user_id in enumerate(user_ids)))
+    return stats, time.perf_counter() - started, user_ids
+
+
+def report(api: FakeBotAPI, stats: JourneyStats, elapsed: float, user_ids: List[int]) -> None:
+    complete = stats.outcomes["complete"]
+    print(f"Пользователей: {len(user_ids)}, дошли до скачивания: {complete}, "
+          f"исходы: {dict(stats.outcomes)}")
+    print(f"Обновлений: {stats.updates} за {elapsed:.2f} с -> {stats.updates / elapsed:.0f} обн/с, "
+          f"{complete / elapsed:.1f} путей/с")
+
+    all_handler = [value for values in stats.handler.values() for value in values]
+    all_e2e = [value for values in stats.end_to_end.values() for value in values]
+    print(f"Задержка обработки: p50 {percentile(all_handler, 0.5):.1f} мс, "
+          f"p99 {percentile(all_handler, 0.99):.1f} мс "
+          f"(с очередью обновлений: p50 {percentile(all_e2e, 0.5):.1f}, p99 {percentile(all_e2e, 0.99):.1f} мс)")
+    for step in ["start"] + [name for name, _ in JOURNEY]:
+        values = stats.handler.get(step)
+        if values:
+            print(f"  {step:<9} n={len(values):<6} p50 {percentile(values, 0.5):7.1f} мс  "
+                  f"p99 {percentile(values, 0.99):7.1f} мс")
+
+    calls = Counter()
+    for user_id in user_ids:
+        calls.update(api.chat_calls.get(user_id, {}))
+    journeys = max(len(user_ids), 1)
+    print(f"Вызовов Bot API на путь: {sum(calls.values()) / journeys:.1f}")
+    for method, count in calls.most_common():
+        print(f"  {method:<22} {count / journeys:.2f}")
+    if api.flooded:
+        print(f"Ответов 429: {sum(api.flooded.values())} {dict(api.flooded)}")
+    if api.bad_requests:
+        print(f"⚠️ Ответов 400: {sum(api.bad_requests.values())} {dict(api.bad_requests)}")
+    for error, count in stats.errors.most_common():
+        print(f"  оборвано путей {count}: {error}")
+
+
+async def seed_catalog(db_manager, per_subject: int) -> None:
+    """Учебники для каждого класса и предмета меню"""
+    from catalog_snapshot import CLASS_NUMBERS, SUBJECTS_MENU
+
+    rows = [
+        (f"Учебник {subject} {class_num}-{i}", f"Автор {i}", f"{class_num} класс", subject, f"/tmp/{subject}{class_num}-{i}.pdf")
+        for class_num in CLASS_NUMBERS for _, subject in SUBJECTS_MENU for i in range(per_subject)
+    ]
+    await db_manager.engine.executemany(
+        "INSERT INTO textbooks (title, author, class_name, subject, file_path) VALUES (?, ?, ?, ?, ?)",
+        rows
+    )
+
+
+async def run_local(api: FakeBotAPI, args) -> None:
+    """EnhancedRUUchebnikBot в этом процессе с временной базой"""
+    from aiogram import Bot, Dispatcher
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.enums import ParseMode
+    from aiogram.fsm.storage.memory import MemoryStorage
+    from aiohttp import web
+
+    from api_scheduler import create_default_scheduler
+    from bot_session import create_bot_session
+    from catalog_snapshot import CatalogStore
+    from config import BOT_CONFIG
+    from enhanced_bot import EnhancedRUUchebnikBot
+    from fsm_storage import SQLiteStorage
+    from simple_database import DatabaseManager
+
+    BOT_CONFIG['api_server_url'] = f"http://{args.host}:{args.port}"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        app_bot = EnhancedRUUchebnikBot()
+        app_bot.db_manager = DatabaseManager(os.path.join(tmp, "load.db"))
+        await app_bot.db_manager.initialize()
+        await seed_catalog(app_bot.db_manager, args.books)
+        app_bot.catalog = CatalogStore(app_bot.db_manager)
+        await app_bot.catalog.load()
+
+        app_bot.bot = Bot(
+            token="123456:LOAD",
+            session=create_bot_session(),
+            default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+        )
+        if args.scheduler:
+            app_bot.api_scheduler = create_default_scheduler()
+            app_bot.bot.session.middleware(app_bot.api_scheduler)
+        if args.fsm_sqlite:
+            app_bot.fsm_storage = SQLiteStorage(os.path.join(tmp, "fsm.db"))
+        app_bot.dp = Dispatcher(storage=app_bot.fsm_storage or MemoryStorage())
+        app_bot.register_handlers()
+
+        runner = None
+        polling = None
+        try:
+            if args.mode == "webhook":
+                secret = "load-secret"
+                runner = web.AppRunner(app_bot.create_webhook_app(secret), access_log=None)
+                await runner.setup()
+                await web.TCPSite(runner, args.host, args.webhook_port).start()
+                await app_bot.bot.set_webhook(
+                    url=f"http://{args.host}:{args.webhook_port}{BOT_CONFIG['webhook_path']}",
+                    secret_token=secret
+                )
+            else:
+                polling = asyncio.create_task(
+                    app_bot.dp.start_polling(app_bot.bot, handle_signals=False, polling_timeout=10)
+                )
+                await api.connected.wait()
+
+            report(api, *await run_users(api, args))
+            if app_bot.api_scheduler:
+                print(f"Планировщик API: {app_bot.api_scheduler.stats()}")
+            if app_bot.fsm_storage:
+                print(f"Хранилище FSM: {app_bot.fsm_storage.stats()}")
+            session_stats = app_bot.bot.session.stats()['light']
+            print(f"HTTP: переиспользовано соединений {session_stats['reuse_ratio']:.0%}, "
+                  f"p50 {session_stats['p50_ms']:.1f} мс, p99 {session_stats['p99_ms']:.1f} мс")
+        finally:
+            if polling is not None:
+                await app_bot.dp.stop_polling()
+                await asyncio.gather(polling, return_exceptions=True)
+            if runner is not None:
+                await runner.cleanup()
+            if app_bot.api_scheduler:
+                await app_bot.api_scheduler.close()
+            if app_bot.fsm_storage:
+                await app_bot.fsm_storage.close()
+            await app_bot.bot.session.close()
+            await app_bot.db_manager.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный генератор пользователей RUУчебник")
+    add_server_arguments(parser)
+    parser.add_argument('--local', action='store_true', help="Запустить EnhancedRUUchebnikBot в этом процессе")
+    parser.add_argument('--mode', choices=['polling', 'webhook'], default='polling', help="Режим бота в --local")
+    parser.add_argument('--webhook-port', type=int, default=8090)
+    parser.add_argument('--scheduler', action='store_true', help="Включить планировщик исходящих запросов (--local)")
+    parser.add_argument('--fsm-sqlite', action='store_true', help="Хранить состояния FSM в SQLite вместо памяти (--local)")
+    parser.add_argument('--books', type=int, default=3, help="Учебников на класс и предмет (--local)")
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=100, help="Одновременно активных пользователей")
+    parser.add_argument('--ramp', type=float, default=0.0, help="Секунд на подключение всех пользователей")
+    parser.add_argument('--think-ms', type=float, default=0.0, help="Средняя пауза пользователя между нажатиями")
+    parser.add_argument('--timeout', type=float, default=15.0, help="Ожидание ответа бота на шаг, с")
+    args = parser.parse_args()
+
+    api = server_from_args(args)
+    server = await api.start(args.host, args.port)
+    try:
+        if args.local:
+            await run_local(api, args)
+        else:
+            print(f"🤖 Fake Bot API: http://{args.host}:{args.port}. Запустите бота с "
+                  f"TELEGRAM_API_URL=http://{args.host}:{args.port} и любым BOT_TOKEN вида 123456:FAKE")
+            await api.connected.wait()
+            print("🔗 Бот подключился, запуск пользователей...")
+            report(api, *await run_users(api, args))
+    finally:
+        await api.close()
+        await server.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""
+Планировщик исходящих запросов к Telegram Bot API
+Middleware сессии aiogram: темп отправки в каждый чат, общий бюджет запросов
+с приоритетами, автоматический повтор после TelegramRetryAfter и метрики очереди
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import BOT_CONFIG
+from rate_limiter import TokenBucketLimiter
+
+# Приоритеты: меньше - раньше
+PRIORITY_CALLBACK = 0     # ответы на нажатия кнопок (пользователь ждет "часики")
+PRIORITY_INTERACTIVE = 1  # ответы пользователю
+PRIORITY_BULK = 2         # рассылки и фоновые отправки
+
+PRIORITY_NAMES = {
+    PRIORITY_CALLBACK: 'callback',
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_BULK: 'bulk',
+}
+
+# Ответы на callback и inline-запросы: без чата, общий бюджет не расходуют
+_CALLBACK_METHODS = {'answerCallbackQuery', 'answerInlineQuery'}
+
+# Методы, создающие или меняющие сообщения в чате (на них действуют лимиты чата)
+_MESSAGE_PREFIXES = ('send', 'edit', 'copy', 'forward')
+
+# Методы, создающие новые сообщения (на них действует общий лимит бота)
+_NEW_MESSAGE_PREFIXES = ('send', 'copy', 'forward')
+
+# Приоритет исходящих запросов текущей задачи (см. outbound_priority)
+_current_priority: ContextVar[Optional[int]] = ContextVar('outbound_priority', default=None)
+
+
+@contextmanager
+def outbound_priority(priority: int) -> Iterator[None]:
+    """
+    Приоритет всех запросов к API внутри блока
+
+    Пример:
+        with outbound_priority(PRIORITY_BULK):
+            await bot.send_message(user_id, text)
+    """
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class _WaitStats:
+    """Счетчики ожидания в очереди для одного приоритета"""
+
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, waited: float) -> None:
+        self.count += 1
+        self.total += waited
+        if waited > self.max:
+            self.max = waited
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'avg_ms': self.total / self.count * 1000 if self.count else 0.0,
+            'max_ms': self.max * 1000,
+        }
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """
+    Единая точка выхода запросов бота к Telegram
+
+    Подключается к сессии бота (bot.session.middleware(scheduler)),
+    поэтому через нее проходят все вызовы - answer(), edit_text(),
+    delete(), callback.answer() и любые методы Bot - без изменений
+    в обработчиках.
+
+    - Каждый чат получает сообщения не чаще chat_rate в секунду
+      (группы - group_rate) с допустимым всплеском chat_burst; запросы
+      одного чата выходят в порядке поступления.
+    - Новые сообщения (send*, copy*, forward*) всех чатов вместе
+      укладываются в global_rate в секунду. Когда бюджет исчерпан,
+      первыми выходят ответы пользователям, затем рассылки
+      (outbound_priority(PRIORITY_BULK)). Ответы на callback, правки
+      и удаления общий бюджет не расходуют: Telegram ограничивает
+      рассылку сообщений, а не эти вызовы.
+    - TelegramRetryAfter приостанавливает чат на указанное время, и
+      запрос повторяется до max_retries раз - обработчик исключения
+      не видит. Запрос без чата (ответ на callback) повторяется сам
+      по себе, остальные запросы бота не ждут.
+
+    Служебные методы без чата (getUpdates, getMe, setWebhook...) идут
+    напрямую: долгий опрос getUpdates не должен занимать очередь.
+    """
+
+    def __init__(self, global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: float = 3.0,
+                 group_rate: float = 20 / 60, max_retries: int = 3, max_chats: int = 100_000):
+        """
+        Args:
+            global_rate: Новых сообщений в секунду на весь бот
+            chat_rate: Сообщений в секунду в личный чат
+            chat_burst: Допустимый всплеск сообщений в чат
+            group_rate: Сообщений в секунду в группу
+            max_retries: Повторов после TelegramRetryAfter
+            max_chats: Сколько чатов хранят лимитеры (LRU)
+        """
+        self.max_retries = max_retries
+        self.logger = logging.getLogger(__name__)
+
+        self._global = TokenBucketLimiter(rate=global_rate, capacity=global_rate, max_keys=1)
+        self._private = TokenBucketLimiter(rate=chat_rate, capacity=chat_burst, max_keys=max_chats)
+        self._groups = TokenBucketLimiter(rate=group_rate, capacity=chat_burst, max_keys=max_chats)
+
+        # Ожидающие общего бюджета: (приоритет, номер, future)
+        self._heap: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+        # Очередь каждого чата: (блокировка, число ожидающих)
+        self._chat_locks: Dict[Any, List] = {}
+        self._chat_paused_until: Dict[Any, float] = {}
+
+        self._waits = {priority: _WaitStats() for priority in PRIORITY_NAMES}
+        self._requests = 0
+        self._retries = 0
+        self._failed_retries = 0
+        self._direct = 0
+
+    # ------------------------------------------------------------------
+    # Классификация запросов
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _api_name(method) -> str:
+        return getattr(method, '__api_method__', type(method).__name__)
+
+    def _priority(self, api_name: str) -> int:
+        priority = _current_priority.get()
+        if priority is not None:
+            return priority
+        if api_name in _CALLBACK_METHODS:
+            return PRIORITY_CALLBACK
+        return PRIORITY_INTERACTIVE
+
+    @staticmethod
+    def _cost(method) -> int:
+        """Альбом расходует лимит чата по числу вложений"""
+        media = getattr(method, 'media', None)
+        return len(media) if isinstance(media, list) else 1
+
+    # ------------------------------------------------------------------
+    # Middleware
+    # ------------------------------------------------------------------
+
+    async def __call__(self, make_request, bot, method):
+        api_name = self._api_name(method)
+        chat_id = getattr(method, 'chat_id', None)
+
+        if chat_id is None and api_name not in _CALLBACK_METHODS:
+            self._direct += 1
+            return await make_request(bot, method)
+
+        paced_chat = chat_id if api_name.startswith(_MESSAGE_PREFIXES) else None
+        budgeted = api_name.startswith(_NEW_MESSAGE_PREFIXES)
+        priority = self._priority(api_name)
+        attempts = 0
+        while True:
+            started = time.monotonic()
+            if paced_chat is not None:
+                await self._wait_chat(paced_chat, self._cost(method))
+            elif chat_id is not None:
+                # deleteMessage и другие методы без темпа тоже ждут паузу чата после RetryAfter
+                await self._wait_chat_pause(chat_id)
+            if budgeted:
+                await self._wait_global(priority)
+            self._waits[priority].add(time.monotonic() - started)
+            self._requests += 1
+
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempts += 1
+                self._retries += 1
+                if chat_id is not None:
+                    self._pause_chat(chat_id, e.retry_after)
+                if attempts > self.max_retries:
+                    self._failed_retries += 1
+                    raise
+                self.logger.warning(f"⏳ {api_name}: Telegram просит подождать {e.retry_after} с "
+                                    f"(чат {chat_id}, попытка {attempts})")
+                if chat_id is None:
+                    # Ответ на callback ждет только сам: пауза не касается других запросов
+                    await asyncio.sleep(e.retry_after)
+
+    # ------------------------------------------------------------------
+    # Очередь чата
+    # ------------------------------------------------------------------
+
+    async def _wait_chat(self, chat_id: Any, cost: int) -> None:
+        """Ожидание своей очереди и права на сообщение в чат"""
+        entry = self._chat_locks.get(chat_id)
+        if entry is None:
+            entry = self._chat_locks[chat_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            # Блокировка asyncio выдается по порядку: сообщения чата не обгоняют друг друга
+            async with entry[0]:
+                limiter = self._groups if isinstance(chat_id, int) and chat_id < 0 else self._private
+                cost = min(cost, limiter.capacity)
+                while True:
+                    await self._wait_chat_pause(chat_id)
+                    wait = limiter.consume(chat_id, cost)
+                    if not wait:
+                        return
+                    await asyncio.sleep(wait)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chat_locks[chat_id]
+
+    async def _wait_chat_pause(self, chat_id: Any) -> None:
+        """Ожидание конца паузы, назначенной чату через TelegramRetryAfter"""
+        while True:
+            paused = self._chat_paused_until.get(chat_id, 0.0) - time.monotonic()
+            if paused <= 0:
+                return
+            await asyncio.sleep(paused)
+
+    def _pause_chat(self, chat_id: Any, seconds: float) -> None:
+        """Пауза чата; запись удаляется, когда пауза истекает"""
+        until = time.monotonic() + seconds
+        if until <= self._chat_paused_until.get(chat_id, 0.0):
+            return
+        self._chat_paused_until[chat_id] = until
+        asyncio.get_running_loop().call_later(seconds, self._expire_chat_pause, chat_id, until)
+
+    def _expire_chat_pause(self, chat_id: Any, until: float) -> None:
+        if self._chat_paused_until.get(chat_id) == until:
+            del self._chat_paused_until[chat_id]
+
+    # ------------------------------------------------------------------
+    # Общий бюджет
+    # ------------------------------------------------------------------
+
+    async def _wait_global(self, priority: int) -> None:
+        """Ожидание права на новое сообщение из общего бюджета"""
+        if not self._heap and self._global.consume(None) == 0.0:
+            return
+
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), future))
+        self._wakeup.set()
+        await future
+
+    async def _dispatch(self) -> None:
+        """Выдача бюджета ожидающим в порядке приоритета"""
+        heap = self._heap
+        while True:
+            while heap and heap[0][2].done():
+                heapq.heappop(heap)  # ожидавший запрос отменен
+            if not heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            wait = self._global.consume(None)
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+            _, _, future = heapq.heappop(heap)
+            if not future.done():
+                future.set_result(None)
+
+    # ------------------------------------------------------------------
+    # Метрики
+    # ------------------------------------------------------------------
+
+    def queue_depth(self) -> Dict[str, int]:
+        """Запросы, ожидающие общего бюджета, по приоритетам"""
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, future in self._heap:
+            if not future.done():
+                depth[PRIORITY_NAMES.get(priority, str(priority))] += 1
+        return depth
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики планировщика"""
+        return {
+            'requests': self._requests,
+            'direct': self._direct,
+            'retry_after': self._retries,
+            'retry_after_failed': self._failed_retries,
+            'queue_depth': self.queue_depth(),
+            'chats_waiting': sum(entry[1] for entry in self._chat_locks.values()),
+            'chats_paused': len(self._chat_paused_until),
+            'wait': {PRIORITY_NAMES[priority]: stats.as_dict() for priority, stats in self._waits.items()},
+        }
+
+    async def log_stats_periodically(self, interval: float) -> None:
+        """Периодическая запись метрик в лог"""
+        while True:
+            await asyncio.sleep(interval)
+            stats = self.stats()
+            waits = ", ".join(
+                f"{name} {wait['avg_ms']:.0f}/{wait['max_ms']:.0f} мс"
+                for name, wait in stats['wait'].items() if wait['count']
+            )
+            self.logger.info(
+                f"📤 API: запросов {stats['requests']}, в очереди {stats['queue_depth']}, "
+                f"ждут очереди чата {stats['chats_waiting']}, RetryAfter {stats['retry_after']}; "
+                f"ожидание (сред/макс) {waits or '-'}"
+            )
+
+    async def close(self) -> None:
+        """Остановка диспетчера; ожидающие запросы отменяются"""
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+        for _, _, future in self._heap:
+            future.cancel()
+        self._heap.clear()
+
+
+def create_default_scheduler() -> OutboundScheduler:
+    """Планировщик с параметрами из BOT_CONFIG"""
+    return OutboundScheduler(
+        global_rate=BOT_CONFIG.get('api_global_rate', 30.0),
+        chat_rate=BOT_CONFIG.get('api_chat_rate', 1.0),
+        chat_burst=BOT_CONFIG.get('api_chat_burst', 3.0),
+        group_rate=BOT_CONFIG.get('api_group_rate', 20 / 60),
+        max_retries=BOT_CONFIG.get('api_max_retries', 3),
+    )
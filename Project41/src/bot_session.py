@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP-сессия клиента Telegram Bot API
+Отдельные пулы соединений для загрузки файлов и легких запросов, keep-alive,
+кеш DNS, таймауты по методам и метрики переиспользования соединений и задержек
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, TraceConfig
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+
+from aiogram import __version__ as aiogram_version
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramNetworkError
+from aiogram.types import InputFile, TelegramObject
+
+from config import BOT_CONFIG
+
+# Таймауты по умолчанию (секунды) для отдельных методов; остальные -
+# request_timeout, запросы с файлами - upload_timeout
+DEFAULT_METHOD_TIMEOUTS = {
+    'answerCallbackQuery': 5,
+    'deleteMessage': 10,
+    'editMessageText': 10,
+    'editMessageReplyMarkup': 10,
+    'sendMessage': 15,
+}
+
+# Сколько последних задержек хранится для перцентилей
+LATENCY_WINDOW = 2048
+
+
+def _contains_upload(value: Any, depth: int = 0) -> bool:
+    """Есть ли в значении файл для загрузки (в том числе внутри InputMedia)"""
+    if isinstance(value, InputFile):
+        return True
+    if depth > 2:
+        return False
+    if isinstance(value, (list, tuple)):
+        return any(_contains_upload(item, depth + 1) for item in value)
+    if isinstance(value, TelegramObject):
+        return any(_contains_upload(item, depth + 1) for item in vars(value).values())
+    return False
+
+
+def is_upload(method) -> bool:
+    """Запрос передает файл (фото, документ, альбом), а не file_id или ссылку"""
+    return any(_contains_upload(value) for value in vars(method).values())
+
+
+class PoolStats:
+    """Метрики одного пула: соединения, DNS и задержки запросов"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.dns_hits = 0
+        self.dns_misses = 0
+        self.requests = 0
+        self.errors = 0
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        # Метод -> [запросов, суммарное время, максимум]
+        self.methods: Dict[str, List[float]] = {}
+
+    def trace_config(self) -> TraceConfig:
+        """Подписка на события соединений aiohttp"""
+        trace = TraceConfig()
+
+        async def on_create(session, context, params):
+            self.new_connections += 1
+
+        async def on_reuse(session, context, params):
+            self.reused_connections += 1
+
+        async def on_dns_hit(session, context, params):
+            self.dns_hits += 1
+
+        async def on_dns_miss(session, context, params):
+            self.dns_misses += 1
+
+        trace.on_connection_create_end.append(on_create)
+        trace.on_connection_reuseconn.append(on_reuse)
+        trace.on_dns_cache_hit.append(on_dns_hit)
+        trace.on_dns_cache_miss.append(on_dns_miss)
+        return trace
+
+    def record(self, api_method: str, elapsed: float, error: bool = False) -> None:
+        self.requests += 1
+        if error:
+            self.errors += 1
+        self.latencies.append(elapsed)
+        entry = self.methods.get(api_method)
+        if entry is None:
+            self.methods[api_method] = [1, elapsed, elapsed]
+        else:
+            entry[0] += 1
+            entry[1] += elapsed
+            if elapsed > entry[2]:
+                entry[2] = elapsed
+
+    def as_dict(self) -> Dict[str, Any]:
+        connections = self.new_connections + self.reused_connections
+        ordered = sorted(self.latencies)
+
+        def percentile(p: float) -> float:
+            if not ordered:
+                return 0.0
+            return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000
+
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'new_connections': self.new_connections,
+            'reused_connections': self.reused_connections,
+            'reuse_ratio': self.reused_connections / connections if connections else 0.0,
+            'dns_hits': self.dns_hits,
+            'dns_misses': self.dns_misses,
+            'p50_ms': percentile(0.50),
+            'p99_ms': percentile(0.99),
+            'methods': {
+                name: {'count': int(count), 'avg_ms': total / count * 1000, 'max_ms': peak * 1000}
+                for name, (count, total, peak) in self.methods.items()
+            },
+        }
+
+
+class TunedAiohttpSession(AiohttpSession):
+    """
+    Сессия aiogram с двумя пулами соединений
+
+    Загрузки файлов (запросы с InputFile и скачивание файлов) идут
+    через небольшой отдельный пул и не занимают соединения, нужные
+    быстрым ответам на кнопки и редактированию сообщений. Соединения
+    держатся открытыми keepalive_timeout секунд, адрес api.telegram.org
+    кешируется на dns_ttl секунд, таймаут запроса зависит от метода.
+
+    Метрики (stats()): доля переиспользованных соединений, попадания
+    в кеш DNS, p50/p99 задержки по пулу и средняя задержка по методам.
+    """
+
+    def __init__(self, pool_size: int = 100, upload_pool_size: int = 8,
+                 keepalive_timeout: float = 60.0, dns_ttl: int = 600,
+                 connect_timeout: float = 5.0, request_timeout: float = 15.0,
+                 upload_timeout: float = 300.0,
+                 method_timeouts: Optional[Dict[str, float]] = None, **kwargs):
+        """
+        Args:
+            pool_size: Соединений в пуле легких запросов
+            upload_pool_size: Соединений в пуле загрузок
+            keepalive_timeout: Сколько секунд держать простаивающее соединение
+            dns_ttl: Время жизни записи в кеше DNS в секундах
+            connect_timeout: Таймаут установки соединения
+            request_timeout: Таймаут легкого запроса по умолчанию
+            upload_timeout: Таймаут запроса с файлом
+            method_timeouts: Таймауты отдельных методов (имя метода Bot API -> секунды)
+            **kwargs: Параметры AiohttpSession (api, proxy, timeout...)
+        """
+        super().__init__(limit=pool_size, **kwargs)
+        self.pool_size = pool_size
+        self.upload_pool_size = upload_pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_ttl = dns_ttl
+        self.connect_timeout = connect_timeout
+        self.request_timeout = request_timeout
+        self.upload_timeout = upload_timeout
+        self.method_timeouts = dict(DEFAULT_METHOD_TIMEOUTS if method_timeouts is None else method_timeouts)
+
+        self._upload_session: Optional[ClientSession] = None
+        self.light_stats = PoolStats('light')
+        self.upload_stats = PoolStats('upload')
+        self.logger = logging.getLogger(__name__)
+
+    def _new_client(self, limit: int, stats: PoolStats) -> ClientSession:
+        connector_init = dict(
+            self._connector_init,
+            limit=limit,
+            limit_per_host=limit,
+            keepalive_timeout=self.keepalive_timeout,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_ttl,
+        )
+        return ClientSession(
+            connector=self._connector_type(**connector_init),
+            headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{aiogram_version}"},
+            trace_configs=[stats.trace_config()],
+        )
+
+    async def create_session(self) -> ClientSession:
+        """Пул легких запросов (пул загрузок создается вместе с ним)"""
+        if self._should_reset_connector:
+            await self.close()
+
+        if self._session is None or self._session.closed:
+            self._session = self._new_client(self.pool_size, self.light_stats)
+        if self._upload_session is None or self._upload_session.closed:
+            self._upload_session = self._new_client(self.upload_pool_size, self.upload_stats)
+        self._should_reset_connector = False
+        return self._session
+
+    async def close(self) -> None:
+        sessions = [session for session in (self._session, self._upload_session)
+                    if session is not None and not session.closed]
+        if not sessions:
+            return
+        for session in sessions:
+            await session.close()
+        # Ожидание закрытия SSL-соединений, как в AiohttpSession
+        await asyncio.sleep(0.25)
+
+    def timeout_for(self, api_method: str, upload: bool) -> float:
+        if upload:
+            return self.method_timeouts.get(api_method, self.upload_timeout)
+        return self.method_timeouts.get(api_method, self.request_timeout)
+
+    async def make_request(self, bot, method, timeout: Optional[int] = None):
+        light_session = await self.create_session()
+        upload = is_upload(method)
+        session, stats = (self._upload_session, self.upload_stats) if upload else (light_session, self.light_stats)
+
+        api_method = method.__api_method__
+        url = self.api.api_url(token=bot.token, method=api_method)
+        form = self.build_form_data(bot=bot, method=method)
+        # Явный таймаут (например, у долгого опроса getUpdates) важнее настроек
+        total = timeout if timeout is not None else self.timeout_for(api_method, upload)
+
+        started = time.perf_counter()
+        try:
+            async with session.post(
+                url,
+                data=form,
+                timeout=ClientTimeout(total=total, connect=self.connect_timeout),
+            ) as resp:
+                raw_result = await resp.text()
+        except asyncio.TimeoutError as e:
+            stats.record(api_method, time.perf_counter() - started, error=True)
+            raise TelegramNetworkError(method=method, message="Request timeout error") from e
+        except ClientError as e:
+            stats.record(api_method, time.perf_counter() - started, error=True)
+            raise TelegramNetworkError(method=method, message=f"{type(e).__name__}: {e}") from e
+        stats.record(api_method, time.perf_counter() - started)
+
+        response = self.check_response(
+            bot=bot,
+            method=method,
+            status_code=resp.status,
+            content=raw_result,
+        )
+        return response.result
+
+    async def stream_content(self, url: str, headers: Optional[Dict[str, Any]] = None,
+                             timeout: int = 30, chunk_size: int = 65536,
+                             raise_for_status: bool = True):
+        """Скачивание файлов идет через пул загрузок"""
+        await self.create_session()
+        async with self._upload_session.get(
+            url,
+            timeout=ClientTimeout(total=timeout, connect=self.connect_timeout),
+            headers=headers or {},
+            raise_for_status=raise_for_status,
+        ) as resp:
+            async for chunk in resp.content.iter_chunked(chunk_size):
+                yield chunk
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики обоих пулов"""
+        return {'light': self.light_stats.as_dict(), 'upload': self.upload_stats.as_dict()}
+
+    def log_stats(self) -> None:
+        for name, pool in self.stats().items():
+            if not pool['requests']:
+                continue
+            self.logger.info(
+                f"🌐 HTTP {name}: запросов {pool['requests']} (ошибок {pool['errors']}), "
+                f"переиспользовано соединений {pool['reuse_ratio']:.0%} "
+                f"({pool['new_connections']} новых), p50 {pool['p50_ms']:.0f} мс, p99 {pool['p99_ms']:.0f} мс"
+            )
+
+    async def log_stats_periodically(self, interval: float) -> None:
+        """Периодическая запись метрик в лог"""
+        while True:
+            await asyncio.sleep(interval)
+            self.log_stats()
+
+
+def create_bot_session() -> TunedAiohttpSession:
+    """Сессия с параметрами из BOT_CONFIG"""
+    # Другой сервер Bot API: локальный telegram-bot-api или fake_bot_api.py для испытаний
+    api_url = BOT_CONFIG.get('api_server_url')
+    kwargs = {'api': TelegramAPIServer.from_base(api_url)} if api_url else {}
+    return TunedAiohttpSession(
+        pool_size=BOT_CONFIG.get('http_pool_size', 100),
+        upload_pool_size=BOT_CONFIG.get('http_upload_pool_size', 8),
+        keepalive_timeout=BOT_CONFIG.get('http_keepalive_timeout', 60),
+        dns_ttl=BOT_CONFIG.get('http_dns_ttl', 600),
+        connect_timeout=BOT_CONFIG.get('http_connect_timeout', 5),
+        request_timeout=BOT_CONFIG.get('http_request_timeout', 15),
+        upload_timeout=BOT_CONFIG.get('http_upload_timeout', 300),
+        method_timeouts=BOT_CONFIG.get('http_method_timeouts'),
+        **kwargs
+    )
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+Снимок каталога учебников в памяти
+Готовые клавиатуры и тексты для навигации класс -> предмет -> учебники,
+чтобы нажатия кнопок обслуживались без обращения к базе данных
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from config import BOT_CONFIG
+from keyboards import get_pagination_keyboard
+
+# Классы, доступные в меню
+CLASS_NUMBERS = [str(i) for i in range(1, 12)]
+
+# Предметы меню: (текст кнопки, код предмета в базе)
+SUBJECTS_MENU = [
+    ("📐 Математика", "math"),
+    ("📝 Русский язык", "russian"),
+    ("📖 Литература", "literature"),
+    ("⚗️ Физика", "physics"),
+    ("🧪 Химия", "chemistry"),
+    ("🌱 Биология", "biology"),
+    ("🌍 География", "geography"),
+    ("🏛️ История", "history"),
+    ("🇬🇧 Английский", "english")
+]
+
+# Сколько учебников показывать на одной странице списка
+TEXTBOOKS_LIMIT = 10
+
+# Префикс callback страницы списка: tbp_<класс>_<предмет>_<страница>_<a|b><id>
+# a<id> - страница после учебника id, b<id> - страница перед ним
+PAGE_CALLBACK_PREFIX = "tbp_"
+
+
+def build_classes_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура выбора класса"""
+    keyboard = []
+
+    # Создаем кнопки для классов по 3 в ряду
+    row = []
+    for class_num in CLASS_NUMBERS:
+        row.append(InlineKeyboardButton(text=f"{class_num} класс", callback_data=f"class_{class_num}"))
+        if len(row) == 3:
+            keyboard.append(row)
+            row = []
+
+    # Добавляем оставшиеся классы
+    if row:
+        keyboard.append(row)
+
+    # Кнопка назад
+    keyboard.append([InlineKeyboardButton(text="◀️ Назад", callback_data="back_main")])
+
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+def build_subjects_keyboard(class_num: str) -> InlineKeyboardMarkup:
+    """Клавиатура выбора предмета"""
+    keyboard = []
+    for name, code in SUBJECTS_MENU:
+        keyboard.append([InlineKeyboardButton(text=name, callback_data=f"subject_{class_num}_{code}")])
+
+    keyboard.append([InlineKeyboardButton(text="◀️ Назад к классам", callback_data="back_classes")])
+
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+def build_subjects_text(class_num: str) -> str:
+    """Текст экрана выбора предмета"""
+    return f"""
+📚 <b>Выбор предмета для {class_num} класса</b>
+
+Выберите предмет для поиска учебников:
+        """
+
+
+def page_callback(class_num: str, subject: str, page: int, direction: str, book_id: Any) -> str:
+    """callback_data страницы списка с курсором (укладывается в 64 байта)"""
+    return f"{PAGE_CALLBACK_PREFIX}{class_num}_{subject}_{page}_{direction}{book_id}"
+
+
+def parse_page_callback(data: str) -> Optional[Tuple[str, str, int, bool, Optional[int]]]:
+    """
+    Разбор callback страницы списка
+
+    Returns:
+        (класс, предмет, страница, назад ли, id курсора) или None
+    """
+    try:
+        class_subject, page, cursor = data[len(PAGE_CALLBACK_PREFIX):].rsplit('_', 2)
+        class_num, subject = class_subject.split('_', 1)
+        return class_num, subject, int(page), cursor[0] == 'b', int(cursor[1:])
+    except (ValueError, IndexError):
+        return None
+
+
+def build_textbooks_view(class_num: str, textbooks: List[Dict[str, Any]],
+                         subject: str = "", page: int = 1, total: Optional[int] = None,
+                         has_prev: bool = False, has_next: bool = False) -> Tuple[str, InlineKeyboardMarkup]:
+    """
+    Текст и клавиатура одной страницы списка учебников по предмету
+
+    Args:
+        class_num: Номер класса
+        textbooks: Учебники страницы (не больше TEXTBOOKS_LIMIT)
+        subject: Код предмета (для кнопок перелистывания)
+        page: Номер страницы для подписи
+        total: Всего учебников по предмету (по умолчанию - размер страницы)
+        has_prev: Есть ли предыдущая страница
+        has_next: Есть ли следующая страница
+    """
+    if textbooks:
+        total = len(textbooks) if total is None else total
+        textbooks_text = f"""
+📖 <b>Учебники по предмету для {class_num} класса</b>
+
+Найдено учебников: {total}
+
+Выберите автора или воспользуйтесь помощью:
+            """
+
+        # Создаем клавиатуру с учебниками
+        keyboard = []
+        for book in textbooks[:TEXTBOOKS_LIMIT]:
+            keyboard.append([InlineKeyboardButton(
+                text=f"📖 {book['author']} - {book['title'][:30]}...",
+                callback_data=f"book_{book['id']}"
+            )])
+
+        # Перелистывание: курсор - крайний учебник текущей страницы
+        # Номер страницы из callback мог разойтись с курсором после изменения
+        # каталога: кнопки определяются только has_prev/has_next, иначе
+        # клавиатура покажет кнопку без курсора на несуществующую страницу
+        if has_prev or has_next:
+            page = max(page, 2) if has_prev else 1
+            total_pages = max(-(-total // TEXTBOOKS_LIMIT), page + 1) if has_next else page
+            pagination = get_pagination_keyboard(
+                page, total_pages, PAGE_CALLBACK_PREFIX,
+                prev_data=page_callback(class_num, subject, page - 1, 'b', textbooks[0]['id']) if has_prev else None,
+                next_data=page_callback(class_num, subject, page + 1, 'a', textbooks[-1]['id']) if has_next else None
+            )
+            keyboard.extend(pagination.inline_keyboard)
+
+        # Добавляем кнопку помощи
+        keyboard.append([InlineKeyboardButton(text="❓ Где посмотреть автора?", callback_data="help_author")])
+        keyboard.append([InlineKeyboardButton(text="◀️ Назад к предметам", callback_data=f"back_subjects_{class_num}")])
+
+        return textbooks_text, InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+    textbooks_text = f"""
+📖 <b>Учебники по предмету для {class_num} класса</b>
+
+К сожалению, учебники для данного предмета пока не найдены.
+
+Попробуйте выбрать другой предмет или обратитесь к администратору.
+            """
+
+    return textbooks_text, InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="◀️ Назад к предметам", callback_data=f"back_subjects_{class_num}")]
+    ])
+
+
+class CatalogSnapshot:
+    """
+    Неизменяемый снимок каталога (класс -> предмет -> учебники)
+
+    Все клавиатуры и тексты строятся один раз при создании снимка.
+    При изменении каталога создается новый снимок, старый не меняется.
+    """
+
+    def __init__(self, textbooks: List[Dict[str, Any]], version: Optional[int] = None):
+        self.version = version
+        self.classes_keyboard = build_classes_keyboard()
+        self.subjects = {
+            class_num: (build_subjects_text(class_num), build_subjects_keyboard(class_num))
+            for class_num in CLASS_NUMBERS
+        }
+
+        grouped: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        for book in textbooks:
+            class_num = str(book.get('class_name') or '').split(' ')[0]
+            grouped.setdefault((class_num, book.get('subject')), []).append(book)
+
+        self.nodes: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for class_num in CLASS_NUMBERS:
+            for _, subject in SUBJECTS_MENU:
+                self.nodes[(class_num, subject)] = self._build_node(
+                    class_num, subject, grouped.get((class_num, subject), [])
+                )
+        # Учебники по предметам вне меню тоже доступны по прямому callback
+        for (class_num, subject), books in grouped.items():
+            if (class_num, subject) not in self.nodes:
+                self.nodes[(class_num, subject)] = self._build_node(class_num, subject, books)
+
+    @staticmethod
+    def _build_node(class_num: str, subject: str, textbooks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Узел каталога: учебники в порядке (title, id) и готовая первая страница"""
+        books = tuple(sorted(textbooks, key=lambda book: (book.get('title') or '', book['id'])))
+        text, keyboard = build_textbooks_view(
+            class_num, list(books[:TEXTBOOKS_LIMIT]), subject,
+            total=len(books), has_next=len(books) > TEXTBOOKS_LIMIT
+        )
+        return {
+            'textbooks': books,
+            'positions': {book['id']: index for index, book in enumerate(books)},
+            'text': text,
+            'keyboard': keyboard
+        }
+
+    def get_subjects_view(self, class_num: str) -> Tuple[str, InlineKeyboardMarkup]:
+        """Текст и клавиатура выбора предмета для класса"""
+        view = self.subjects.get(class_num)
+        if view is None:
+            return build_subjects_text(class_num), build_subjects_keyboard(class_num)
+        return view
+
+    def get_node(self, class_num: str, subject: str) -> Dict[str, Any]:
+        """Узел класс/предмет (пустой, если учебников нет)"""
+        node = self.nodes.get((class_num, subject))
+        if node is None:
+            node = self._build_node(class_num, subject, [])
+        return node
+
+    def get_page(self, class_num: str, subject: str, page: int,
+                 cursor: Optional[int], backward: bool = False) -> Tuple[str, InlineKeyboardMarkup]:
+        """
+        Текст и клавиатура страницы списка после (или перед) учебником cursor
+
+        Курсор - id учебника, а не смещение: если каталог обновился между
+        нажатиями, страница продолжается с того же места без пропусков
+        и повторов. Если учебник с таким id удален, страница берется
+        по номеру.
+        """
+        node = self.get_node(class_num, subject)
+        books = node['textbooks']
+        position = node['positions'].get(cursor)
+
+        if position is None:
+            start = max(page - 1, 0) * TEXTBOOKS_LIMIT
+        elif backward:
+            start = max(position - TEXTBOOKS_LIMIT, 0)
+        else:
+            start = position + 1
+
+        if start == 0 or start >= len(books):
+            if start:
+                start = max(len(books) - TEXTBOOKS_LIMIT, 0)
+            else:
+                return node['text'], node['keyboard']
+
+        page_books = list(books[start:start + TEXTBOOKS_LIMIT])
+        page = max(page, 2)
+        return build_textbooks_view(
+            class_num, page_books, subject, page=page, total=len(books),
+            has_prev=start > 0, has_next=start + TEXTBOOKS_LIMIT < len(books)
+        )
+
+
+class CatalogStore:
+    """
+    Хранилище текущего снимка каталога
+
+    Снимок загружается при старте и заменяется целиком (одним присваиванием),
+    когда меняется версия каталога в базе. Версию увеличивают триггеры
+    на таблице textbooks, поэтому проверка - один короткий запрос.
+    """
+
+    def __init__(self, db_manager, check_interval: Optional[float] = None):
+        self.db_manager = db_manager
+        self.check_interval = check_interval or BOT_CONFIG.get('catalog_refresh_interval', 30)
+        self.snapshot = CatalogSnapshot([])
+        self.logger = logging.getLogger(__name__)
+        self._watch_task: Optional[asyncio.Task] = None
+
+    async def load(self):
+        """Построение нового снимка из базы данных"""
+        version = await self.db_manager.get_catalog_version()
+        textbooks = await self.db_manager.get_all_textbooks()
+        self.snapshot = CatalogSnapshot(textbooks, version)
+        self.logger.info(f"📚 Снимок каталога загружен: {len(textbooks)} учебников (версия {version})")
+
+    async def refresh_if_changed(self):
+        """Перезагрузка снимка, если каталог изменился"""
+        version = await self.db_manager.get_catalog_version()
+        if version != self.snapshot.version:
+            await self.load()
+
+    async def _watch(self):
+        """Периодическая проверка версии каталога"""
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self.refresh_if_changed()
+            except Exception as e:
+                self.logger.error(f"❌ Ошибка обновления снимка каталога: {e}")
+
+    def start_watching(self):
+        """Запуск фоновой проверки изменений"""
+        if self._watch_task is None:
+            self._watch_task = asyncio.create_task(self._watch())
+
+    async def stop_watching(self):
+        """Остановка фоновой проверки"""
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
@@ -25,6 +25,65 @@ BOT_CONFIG = {
     'max_file_size_mb': 50,  # Максимальный размер файла в МБ
     'rate_limit_requests': 10,  # Максимум запросов в минуту на пользователя
     'rate_limit_window': 60,  # Окно времени для лимитов в секундах
+    'rate_limit_max_users': 100000,  # Сколько пользователей хранит лимитер (LRU)
+    
+    # Стоимость действий в запросах: ключ - префикс callback_data,
+    # 'default' - все остальные апдейты (навигация)
+    'rate_limit_costs': {
+        'default': 0.2,
+        'book_': 1.0,
+    },
+    
+    # Исходящие запросы к Telegram (планировщик api_scheduler)
+    'api_global_rate': 30,  # Новых сообщений в секунду на весь бот (send/copy/forward)
+    'api_chat_rate': 1.0,  # Сообщений в секунду в личный чат
+    'api_chat_burst': 3,  # Допустимый всплеск сообщений в чат
+    'api_group_rate': 20 / 60,  # Сообщений в секунду в группу
+    'api_max_retries': 3,  # Повторов после TelegramRetryAfter
+    'api_metrics_interval': 300,  # Период записи метрик в лог в секундах (0 - не писать)
+    
+    # Хранилище состояний FSM (fsm_storage): файл SQLite, размер кеша в памяти,
+    # срок жизни неактивного состояния (сек), период и порог пакетной записи
+    'fsm_storage_path': os.getenv('FSM_STORAGE_PATH', 'fsm_storage.db'),
+    'fsm_cache_size': 10000,
+    'fsm_state_ttl': 7 * 24 * 3600,
+    'fsm_flush_interval': 0.5,
+    'fsm_flush_batch': 500,
+    
+    # Адрес сервера Bot API, если не api.telegram.org (например, fake_bot_api.py)
+    'api_server_url': os.getenv('TELEGRAM_API_URL', ''),
+    
+    # HTTP-сессия Bot API (bot_session): пулы соединений, keep-alive, DNS, таймауты
+    'http_pool_size': 100,  # Соединений для легких запросов (кнопки, тексты)
+    'http_upload_pool_size': 8,  # Соединений для загрузки и скачивания файлов
+    'http_keepalive_timeout': 60,  # Сколько секунд держать простаивающее соединение
+    'http_dns_ttl': 600,  # Время жизни записи кеша DNS в секундах
+    'http_connect_timeout': 5,  # Таймаут установки соединения
+    'http_request_timeout': 15,  # Таймаут легкого запроса
+    'http_upload_timeout': 300,  # Таймаут запроса с файлом
+    'http_method_timeouts': {  # Таймауты отдельных методов Bot API
+        'answerCallbackQuery': 5,
+        'deleteMessage': 10,
+        'editMessageText': 10,
+        'editMessageReplyMarkup': 10,
+        'sendMessage': 15,
+    },
+    
+    # Режим получения обновлений: 'polling' или 'webhook'
+    'mode': os.getenv('BOT_MODE', 'polling').lower(),
+    
+    # Удалять ли накопившиеся обновления при перезапуске
+    'drop_pending_updates': os.getenv('DROP_PENDING_UPDATES', 'False').lower() == 'true',
+    
+    # Настройки webhook (используются при mode = 'webhook')
+    'webhook_url': os.getenv('WEBHOOK_URL', ''),  # Публичный HTTPS адрес, например https://example.com
+    'webhook_path': os.getenv('WEBHOOK_PATH', '/webhook'),
+    'webhook_secret': os.getenv('WEBHOOK_SECRET', ''),  # Если пусто - генерируется при запуске
+    'webhook_host': os.getenv('WEBHOOK_HOST', '0.0.0.0'),
+    'webhook_port': int(os.getenv('WEBHOOK_PORT', '8080')),
+    
+    # Интервал проверки изменений каталога учебников в секундах
+    'catalog_refresh_interval': 30,
     
     # Настройки базы данных
     'database_url': os.getenv('DATABASE_URL', 'sqlite:///bot_database.db'),
@@ -279,6 +338,13 @@ def validate_config() -> List[str]:
     if not BOT_CONFIG['admin_id']:
         errors.append("ADMIN_ID не установлен или некорректен")
     
+    # Проверка режима работы
+    if BOT_CONFIG['mode'] not in ('polling', 'webhook'):
+        errors.append("BOT_MODE должен быть 'polling' или 'webhook'")
+    
+    if BOT_CONFIG['mode'] == 'webhook' and not BOT_CONFIG['webhook_url']:
+        errors.append("WEBHOOK_URL не установлен для режима webhook")
+    
     # Проверка размеров файлов
     if BOT_CONFIG['max_file_size_mb'] <= 0:
         errors.append("max_file_size_mb должен быть больше 0")
@@ -10,21 +10,31 @@ import logging
 import os
 import sys
 import json
+import secrets
 from pathlib import Path
 from datetime import datetime
 
 from aiogram import Bot, Dispatcher, F
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram.types import Message, CallbackQuery, FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 
 from config import BOT_CONFIG, MESSAGES
 from simple_database import DatabaseManager
+from media_cache import MediaCache
+from image_catalog import get_image_catalog
+from catalog_snapshot import CatalogStore, PAGE_CALLBACK_PREFIX, parse_page_callback
 from simple_utils import setup_logging
+from rate_limiter import RateLimitMiddleware
+from api_scheduler import create_default_scheduler
+from bot_session import create_bot_session
+from fsm_storage import create_fsm_storage
 
 
 class BotStates(StatesGroup):
@@ -42,10 +52,16 @@ class BotStates(StatesGroup):
 class EnhancedRUUchebnikBot:
     def __init__(self):
         self.db_manager = None
+        self.catalog = None
         self.bot = None
         self.dp = None
+        self.api_scheduler = None
+        self.fsm_storage = None
+        self.api_metrics_tasks = []
         self.images_dir = "images"
+        self.media_cache = MediaCache()
         self.ensure_images_directory()
+        self.image_catalog = get_image_catalog(self.images_dir)
         
     def ensure_images_directory(self):
         """Создание директории для изображений если её нет"""
@@ -59,12 +75,23 @@ class EnhancedRUUchebnikBot:
     
     def get_image_path(self, image_type: str) -> str:
         """Получение пути к изображению определенного типа"""
-        image_dir = os.path.join(self.images_dir, image_type)
-        if os.path.exists(image_dir):
-            for file in os.listdir(image_dir):
-                if file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-                    return os.path.join(image_dir, file)
-        return None
+        return self.image_catalog.get_image_path(image_type)
+    
+    async def answer_photo_cached(self, message: Message, image_path: str, **kwargs) -> Message:
+        """Отправка изображения с повторным использованием file_id из реестра"""
+        file_id = self.media_cache.get_file_id(image_path)
+        if file_id:
+            try:
+                return await message.answer_photo(photo=file_id, **kwargs)
+            except TelegramBadRequest as e:
+                # file_id устарел - загружаем файл заново
+                logging.getLogger(__name__).warning(f"⚠️ file_id для {image_path} отклонен: {e}")
+                self.media_cache.invalidate(image_path)
+        
+        sent = await message.answer_photo(photo=FSInputFile(image_path), **kwargs)
+        if sent.photo:
+            self.media_cache.store(image_path, sent.photo[-1].file_id)
+        return sent
     
     def get_main_menu_keyboard(self) -> InlineKeyboardMarkup:
         """Создание главного меню с изображениями"""
@@ -88,47 +115,8 @@ class EnhancedRUUchebnikBot:
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
     
     def get_classes_keyboard(self) -> InlineKeyboardMarkup:
-        """Клавиатура выбора класса"""
-        keyboard = []
-        
-        # Создаем кнопки для классов по 3 в ряду
-        row = []
-        for i in range(1, 12):
-            row.append(InlineKeyboardButton(text=f"{i} класс", callback_data=f"class_{i}"))
-            if len(row) == 3:
-                keyboard.append(row)
-                row = []
-        
-        # Добавляем оставшиеся классы
-        if row:
-            keyboard.append(row)
-        
-        # Кнопка назад
-        keyboard.append([InlineKeyboardButton(text="◀️ Назад", callback_data="back_main")])
-        
-        return InlineKeyboardMarkup(inline_keyboard=keyboard)
-    
-    def get_subjects_keyboard(self, class_num: str) -> InlineKeyboardMarkup:
-        """Клавиатура выбора предмета"""
-        subjects = [
-            ("📐 Математика", "math"),
-            ("📝 Русский язык", "russian"),
-            ("📖 Литература", "literature"),
-            ("⚗️ Физика", "physics"),
-            ("🧪 Химия", "chemistry"),
-            ("🌱 Биология", "biology"),
-            ("🌍 География", "geography"),
-            ("🏛️ История", "history"),
-            ("🇬🇧 Английский", "english")
-        ]
-        
-        keyboard = []
-        for name, code in subjects:
-            keyboard.append([InlineKeyboardButton(text=name, callback_data=f"subject_{class_num}_{code}")])
-        
-        keyboard.append([InlineKeyboardButton(text="◀️ Назад к классам", callback_data="back_classes")])
-        
-        return InlineKeyboardMarkup(inline_keyboard=keyboard)
+        """Клавиатура выбора класса (из снимка каталога)"""
+        return self.catalog.snapshot.classes_keyboard
     
     def get_author_help_keyboard(self) -> InlineKeyboardMarkup:
         """Клавиатура помощи по выбору автора"""
@@ -147,21 +135,20 @@ class EnhancedRUUchebnikBot:
         logger = logging.getLogger(__name__)
         
         try:
-            # Проверяем, заблокирован ли пользователь
-            if await self.db_manager.is_user_blocked(user.id):
-                await message.answer("❌ Ваш аккаунт заблокирован. Обратитесь к администратору.")
-                return
-            
-            # Получаем или создаем пользователя
-            user_data = await self.db_manager.get_or_create_user(
+            # Регистрация и проверка блокировки - одно обращение к базе
+            access = await self.db_manager.get_user_access(
                 telegram_id=user.id,
                 username=user.username,
                 first_name=user.first_name,
                 last_name=user.last_name
             )
             
+            if access['is_blocked']:
+                await message.answer("❌ Ваш аккаунт заблокирован. Обратитесь к администратору.")
+                return
+            
             # Если пользователь новый, показываем правила
-            if user_data.get('is_new', False):
+            if access['is_new']:
                 await self.show_rules(message, state)
             else:
                 await self.show_main_menu(message, state)
@@ -189,9 +176,9 @@ class EnhancedRUUchebnikBot:
         
         if rules_image_path:
             # Отправляем изображение с правилами
-            photo = FSInputFile(rules_image_path)
-            await message.answer_photo(
-                photo=photo,
+            await self.answer_photo_cached(
+                message,
+                rules_image_path,
                 caption=rules_text,
                 parse_mode=ParseMode.HTML,
                 reply_markup=self.get_rules_keyboard()
@@ -212,8 +199,8 @@ class EnhancedRUUchebnikBot:
             # Удаляем сообщение с правилами
             await callback.message.delete()
             
-            # Показываем главное меню
-            await self.show_main_menu_from_callback(callback, state)
+            # Показываем главное меню новым сообщением: удаленное уже не изменить
+            await self.show_main_menu(callback.message, state)
             await callback.answer("Добро пожаловать в RUУчебник! 🎓")
     
     async def show_main_menu(self, message: Message, state: FSMContext):
@@ -283,10 +270,10 @@ class EnhancedRUUchebnikBot:
         ])
         
         if solver_image_path:
-            photo = FSInputFile(solver_image_path)
             await callback.message.delete()
-            await callback.message.answer_photo(
-                photo=photo,
+            await self.answer_photo_cached(
+                callback.message,
+                solver_image_path,
                 caption=solver_text,
                 parse_mode=ParseMode.HTML,
                 reply_markup=back_keyboard
@@ -319,10 +306,10 @@ class EnhancedRUUchebnikBot:
         """
         
         if textbooks_image_path:
-            photo = FSInputFile(textbooks_image_path)
             await callback.message.delete()
-            await callback.message.answer_photo(
-                photo=photo,
+            await self.answer_photo_cached(
+                callback.message,
+                textbooks_image_path,
                 caption=textbooks_text,
                 parse_mode=ParseMode.HTML,
                 reply_markup=self.get_classes_keyboard()
@@ -339,18 +326,16 @@ class EnhancedRUUchebnikBot:
     
     async def handle_class_selection(self, callback: CallbackQuery, state: FSMContext):
         """Обработка выбора класса"""
-        class_num = callback.data.split("_")[1]
+        # class_N или back_subjects_N - номер класса всегда последний
+        class_num = callback.data.split("_")[-1]
         
-        subjects_text = f"""
-📚 <b>Выбор предмета для {class_num} класса</b>
-
-Выберите предмет для поиска учебников:
-        """
+        # Текст и клавиатура берутся из снимка каталога без запроса к БД
+        subjects_text, subjects_keyboard = self.catalog.snapshot.get_subjects_view(class_num)
         
         await callback.message.edit_text(
             subjects_text,
             parse_mode=ParseMode.HTML,
-            reply_markup=self.get_subjects_keyboard(class_num)
+            reply_markup=subjects_keyboard
         )
         
         await state.update_data(selected_class=class_num)
@@ -361,46 +346,10 @@ class EnhancedRUUchebnikBot:
         """Обработка выбора предмета"""
         _, class_num, subject = callback.data.split("_", 2)
         
-        # Получаем учебники из базы данных
-        textbooks = await self.db_manager.get_textbooks_by_class_and_subject(
-            class_name=f"{class_num} класс",
-            subject=subject
-        )
-        
-        if textbooks:
-            textbooks_text = f"""
-📖 <b>Учебники по предмету для {class_num} класса</b>
-
-Найдено учебников: {len(textbooks)}
-
-Выберите автора или воспользуйтесь помощью:
-            """
-            
-            # Создаем клавиатуру с учебниками
-            keyboard = []
-            for book in textbooks[:10]:  # Показываем первые 10
-                keyboard.append([InlineKeyboardButton(
-                    text=f"📖 {book['author']} - {book['title'][:30]}...",
-                    callback_data=f"book_{book['id']}"
-                )])
-            
-            # Добавляем кнопку помощи
-            keyboard.append([InlineKeyboardButton(text="❓ Где посмотреть автора?", callback_data="help_author")])
-            keyboard.append([InlineKeyboardButton(text="◀️ Назад к предметам", callback_data=f"back_subjects_{class_num}")])
-            
-            reply_markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
-        else:
-            textbooks_text = f"""
-📖 <b>Учебники по предмету для {class_num} класса</b>
-
-К сожалению, учебники для данного предмета пока не найдены.
-
-Попробуйте выбрать другой предмет или обратитесь к администратору.
-            """
-            
-            reply_markup = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="◀️ Назад к предметам", callback_data=f"back_subjects_{class_num}")]
-            ])
+        # Готовый узел каталога: без обращения к базе данных
+        node = self.catalog.snapshot.get_node(class_num, subject)
+        textbooks_text = node['text']
+        reply_markup = node['keyboard']
         
         await callback.message.edit_text(
             textbooks_text,
@@ -412,6 +361,27 @@ class EnhancedRUUchebnikBot:
         await state.set_state(BotStates.viewing_textbooks)
         await callback.answer()
     
+    async def handle_textbooks_page(self, callback: CallbackQuery, state: FSMContext):
+        """Перелистывание списка учебников (курсор - крайний учебник страницы)"""
+        parsed = parse_page_callback(callback.data)
+        if parsed is None:
+            await callback.answer()
+            return
+        class_num, subject, page, backward, cursor = parsed
+
+        textbooks_text, reply_markup = self.catalog.snapshot.get_page(
+            class_num, subject, page, cursor, backward
+        )
+        await callback.message.edit_text(
+            textbooks_text,
+            parse_mode=ParseMode.HTML,
+            reply_markup=reply_markup
+        )
+
+        await state.update_data(selected_class=class_num, selected_subject=subject)
+        await state.set_state(BotStates.viewing_textbooks)
+        await callback.answer()
+    
     async def handle_author_help(self, callback: CallbackQuery, state: FSMContext):
         """Показ помощи по выбору автора"""
         help_image_path = self.get_image_path("help")
@@ -436,10 +406,10 @@ class EnhancedRUUchebnikBot:
         ])
         
         if help_image_path:
-            photo = FSInputFile(help_image_path)
             await callback.message.delete()
-            await callback.message.answer_photo(
-                photo=photo,
+            await self.answer_photo_cached(
+                callback.message,
+                help_image_path,
                 caption=help_text,
                 parse_mode=ParseMode.HTML,
                 reply_markup=back_keyboard
@@ -486,6 +456,10 @@ class EnhancedRUUchebnikBot:
                 await self.handle_class_selection(callback, state)
             elif callback.data.startswith("subject_"):
                 await self.handle_subject_selection(callback, state)
+            elif callback.data.startswith(PAGE_CALLBACK_PREFIX):
+                await self.handle_textbooks_page(callback, state)
+            elif callback.data == "pagination_info":
+                await callback.answer()
             elif callback.data == "help_author":
                 await self.handle_author_help(callback, state)
             elif callback.data.startswith("back_"):
@@ -507,12 +481,66 @@ class EnhancedRUUchebnikBot:
     
     def register_handlers(self):
         """Регистрация обработчиков"""
+        # Ограничение частоты запросов до фильтров и обработчиков
+        rate_limit = RateLimitMiddleware()
+        self.dp.message.outer_middleware(rate_limit)
+        self.dp.callback_query.outer_middleware(rate_limit)
+        
         # Команды
         self.dp.message.register(self.start_command, Command("start"))
         
         # Callback обработчики
         self.dp.callback_query.register(self.callback_handler)
     
+    def create_webhook_app(self, secret_token: str, handle_in_background: bool = True) -> web.Application:
+        """
+        Создание aiohttp приложения, передающего обновления диспетчеру
+        
+        Args:
+            secret_token: Секрет, который Telegram передает в заголовке запроса
+            handle_in_background: Отвечать Telegram сразу, не дожидаясь обработки
+        """
+        app = web.Application()
+        
+        # Запросы без верного X-Telegram-Bot-Api-Secret-Token отклоняются (401)
+        SimpleRequestHandler(
+            dispatcher=self.dp,
+            bot=self.bot,
+            handle_in_background=handle_in_background,
+            secret_token=secret_token
+        ).register(app, path=BOT_CONFIG['webhook_path'])
+        setup_application(app, self.dp, bot=self.bot)
+        
+        return app
+    
+    async def run_webhook(self):
+        """Запуск встроенного HTTP сервера и регистрация webhook"""
+        logger = logging.getLogger(__name__)
+        
+        secret_token = BOT_CONFIG.get('webhook_secret') or secrets.token_urlsafe(32)
+        app = self.create_webhook_app(secret_token)
+        
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, BOT_CONFIG['webhook_host'], BOT_CONFIG['webhook_port'])
+        await site.start()
+        
+        webhook_url = BOT_CONFIG['webhook_url'].rstrip('/') + BOT_CONFIG['webhook_path']
+        await self.bot.set_webhook(
+            url=webhook_url,
+            secret_token=secret_token,
+            allowed_updates=self.dp.resolve_used_update_types(),
+            drop_pending_updates=BOT_CONFIG.get('drop_pending_updates', False)
+        )
+        logger.info(f"🌐 Webhook установлен: {webhook_url} "
+                    f"(сервер {BOT_CONFIG['webhook_host']}:{BOT_CONFIG['webhook_port']})")
+        
+        try:
+            # Работаем до остановки процесса
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+    
     async def start(self):
         """Запуск бота"""
         # Настройка логирования
@@ -532,14 +560,31 @@ class EnhancedRUUchebnikBot:
             self.db_manager = DatabaseManager()
             await self.db_manager.initialize()
             
-            # Создание бота и диспетчера
+            # Снимок каталога для навигации без запросов к БД
+            self.catalog = CatalogStore(self.db_manager)
+            await self.catalog.load()
+            self.catalog.start_watching()
+            
+            # Создание бота и диспетчера (пулы соединений и таймауты - bot_session)
             self.bot = Bot(
                 token=bot_token,
+                session=create_bot_session(),
                 default=DefaultBotProperties(parse_mode=ParseMode.HTML)
             )
             
-            storage = MemoryStorage()
-            self.dp = Dispatcher(storage=storage)
+            # Все исходящие запросы проходят через общий планировщик
+            self.api_scheduler = create_default_scheduler()
+            self.bot.session.middleware(self.api_scheduler)
+            metrics_interval = BOT_CONFIG.get('api_metrics_interval', 0)
+            if metrics_interval:
+                self.api_metrics_tasks = [
+                    asyncio.create_task(self.api_scheduler.log_stats_periodically(metrics_interval)),
+                    asyncio.create_task(self.bot.session.log_stats_periodically(metrics_interval)),
+                ]
+            
+            # Состояния FSM переживают перезапуск; диспетчер закрывает хранилище при остановке
+            self.fsm_storage = create_fsm_storage()
+            self.dp = Dispatcher(storage=self.fsm_storage)
             
             # Регистрация обработчиков
             self.register_handlers()
@@ -555,16 +600,33 @@ class EnhancedRUUchebnikBot:
                 BotCommand(command="help", description="❓ Помощь"),
             ])
             
-            # Запуск polling
-            logger.info("🔄 Запуск polling...")
-            await self.dp.start_polling(self.bot, drop_pending_updates=True)
+            if BOT_CONFIG.get('mode') == 'webhook':
+                # Обновления приходят на встроенный HTTP сервер
+                await self.run_webhook()
+            else:
+                # Запуск polling
+                logger.info("🔄 Запуск polling...")
+                # Снимаем webhook (если бот раньше работал в режиме webhook)
+                await self.bot.delete_webhook(drop_pending_updates=BOT_CONFIG.get('drop_pending_updates', False))
+                await self.dp.start_polling(self.bot)
             
         except Exception as e:
             logger.error(f"💥 Критическая ошибка: {e}")
         finally:
+            if self.catalog:
+                await self.catalog.stop_watching()
             if self.db_manager:
                 await self.db_manager.close()
+            if self.fsm_storage:
+                logger.info(f"💾 Итог хранилища FSM: {self.fsm_storage.stats()}")
+                await self.fsm_storage.close()
+            for task in self.api_metrics_tasks:
+                task.cancel()
+            if self.api_scheduler:
+                logger.info(f"📤 Итог планировщика API: {self.api_scheduler.stats()}")
+                await self.api_scheduler.close()
             if self.bot:
+                self.bot.session.log_stats()
                 await self.bot.session.close()
 
 
@@ -19,6 +19,9 @@ import requests
 from PIL import Image, ImageTk
 import webbrowser
 
+from media_cache import MediaCache
+from image_catalog import get_image_catalog
+
 class RUUchebnikDesktopApp:
     def __init__(self):
         self.root = tk.Tk()
@@ -34,6 +37,10 @@ class RUUchebnikDesktopApp:
         # Paths for images
         self.images_dir = "images"
         self.create_images_directory()
+        self.image_catalog = get_image_catalog(self.images_dir)
+        
+        # Реестр file_id изображений, загруженных ботом в Telegram
+        self.media_cache = MediaCache()
         
         # Image management
         self.current_images = {
@@ -329,14 +336,9 @@ class RUUchebnikDesktopApp:
     
     def load_image_for_type(self, image_type: str):
         """Загрузка изображения для конкретного типа"""
-        image_dir = os.path.join(self.images_dir, image_type.replace("_", "/"))
-        if os.path.exists(image_dir):
-            # Ищем первое изображение в директории
-            for file in os.listdir(image_dir):
-                if file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-                    image_path = os.path.join(image_dir, file)
-                    self.display_image(image_type, image_path)
-                    break
+        image_path = self.image_catalog.get_image_path(image_type.replace("_", "/"))
+        if image_path:
+            self.display_image(image_type, image_path)
     
     def display_image(self, image_type: str, image_path: str):
         """Отображение изображения в интерфейсе"""
@@ -378,6 +380,9 @@ class RUUchebnikDesktopApp:
             try:
                 import shutil
                 shutil.copy2(file_path, target_path)
+                # Бот должен загрузить новое изображение заново
+                self.media_cache.invalidate(target_path)
+                self.image_catalog.invalidate(image_type.replace("_", "/"))
                 self.display_image(image_type, target_path)
                 messagebox.showinfo("Успех", "Изображение добавлено успешно!")
                 
@@ -400,7 +405,19 @@ class RUUchebnikDesktopApp:
             messagebox.showwarning("Предупреждение", "Сначала добавьте изображение")
             return
         
+        old_path = self.current_images[image_type]
         self.add_image(image_type)  # Используем ту же логику что и для добавления
+        
+        # Удаляем старое изображение, чтобы бот не отправлял его вместо нового
+        new_path = self.current_images.get(image_type)
+        if new_path and os.path.abspath(new_path) != os.path.abspath(old_path):
+            try:
+                if os.path.exists(old_path):
+                    os.remove(old_path)
+                self.media_cache.invalidate(old_path)
+                self.image_catalog.invalidate(image_type.replace("_", "/"))
+            except Exception as e:
+                messagebox.showerror("Ошибка", f"Не удалось удалить старое изображение: {e}")
     
     def delete_image(self, image_type: str):
         """Удаление изображения"""
@@ -412,6 +429,8 @@ class RUUchebnikDesktopApp:
             try:
                 # Удаляем файл
                 os.remove(self.current_images[image_type])
+                self.media_cache.invalidate(self.current_images[image_type])
+                self.image_catalog.invalidate(image_type.replace("_", "/"))
                 
                 # Сбрасываем отображение
                 img_label = getattr(self, f"{image_type}_img_label")
@@ -599,10 +618,15 @@ class RUUchebnikDesktopApp:
 
 from flask import Flask, render_template, request, jsonify, send_from_directory
 import os
+import sys
 import json
 import argparse
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from image_catalog import get_image_catalog
+
 app = Flask(__name__)
+image_catalog = get_image_catalog('images')
 
 @app.route('/')
 def index():
@@ -614,19 +638,8 @@ def serve_image(filename):
 
 @app.route('/api/images')
 def get_images():
-    images = {}
-    images_dir = 'images'
-    
-    if os.path.exists(images_dir):
-        for subdir in os.listdir(images_dir):
-            subdir_path = os.path.join(images_dir, subdir)
-            if os.path.isdir(subdir_path):
-                images[subdir] = []
-                for file in os.listdir(subdir_path):
-                    if file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-                        images[subdir].append(file)
-    
-    return jsonify(images)
+    # Каталог обновляется сам при изменении директорий images
+    return jsonify(image_catalog.list_all())
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+Постоянное хранилище состояний FSM для aiogram на SQLite
+Замена MemoryStorage: состояния переживают перезапуск, в памяти держится
+ограниченный LRU-кеш, запись в базу идет пачками, неактивные состояния истекают
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from async_sqlite import AsyncSQLiteEngine
+from config import BOT_CONFIG
+
+_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS fsm_states (
+        key TEXT PRIMARY KEY,
+        state TEXT,
+        data TEXT NOT NULL DEFAULT '{}',
+        updated_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states(updated_at);
+'''
+
+_UPSERT = '''
+    INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT(key) DO UPDATE SET
+        state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+'''
+
+
+class _Record:
+    """Состояние и данные одного ключа FSM"""
+
+    __slots__ = ('state', 'data', 'updated_at')
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any], updated_at: float):
+        self.state = state
+        self.data = data
+        self.updated_at = updated_at
+
+    @property
+    def is_empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    Хранилище FSM: SQLite (WAL) + LRU-кеш в памяти
+
+    Чтение обслуживается из кеша; промах читает одну строку из базы.
+    Запись сразу меняет кеш (следующее чтение видит новое значение),
+    а в базу изменения уходят пачкой раз в flush_interval секунд или
+    при накоплении flush_batch ключей - одной транзакцией на пачку.
+    При сбое процесса теряется не больше последнего интервала.
+
+    Кеш ограничен cache_size ключами: вытесняются давно не использованные,
+    поэтому память не растет с числом всех когда-либо активных
+    пользователей. Состояние, которое не менялось ttl секунд, считается
+    пустым и удаляется из базы фоновой очисткой. Пустое состояние
+    (нет state и data) в базе не хранится.
+
+    Подключение - Dispatcher(storage=SQLiteStorage("fsm.db")); база
+    открывается при первом обращении, закрывает хранилище сам
+    диспетчер при остановке.
+    """
+
+    def __init__(self, path: str = "fsm_storage.db", cache_size: int = 10000,
+                 ttl: Optional[float] = 7 * 24 * 3600, flush_interval: float = 0.5,
+                 flush_batch: int = 500, purge_interval: float = 3600,
+                 key_builder: Optional[KeyBuilder] = None):
+        """
+        Args:
+            path: Файл базы SQLite
+            cache_size: Сколько ключей держать в памяти
+            ttl: Через сколько секунд без изменений состояние истекает (None - никогда)
+            flush_interval: Период записи изменений в базу в секундах
+            flush_batch: Число измененных ключей, при котором запись начинается сразу
+            purge_interval: Период удаления истекших состояний из базы в секундах
+            key_builder: Построитель ключей (по умолчанию - с bot_id и destiny)
+        """
+        self.path = path
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.purge_interval = purge_interval
+        self.key_builder = key_builder or DefaultKeyBuilder(
+            prefix="fsm", with_bot_id=True, with_destiny=True, with_business_connection_id=True
+        )
+        self.logger = logging.getLogger(__name__)
+
+        self.engine = AsyncSQLiteEngine(path)
+        # Ключи кеша - StorageKey: строка для базы строится только при промахе и записи
+        self._cache: "OrderedDict[StorageKey, _Record]" = OrderedDict()
+        # Изменения, еще не записанные в базу: ключ -> запись на момент изменения
+        self._pending: Dict[StorageKey, _Record] = {}
+        self._flush_now = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        self._open_lock = asyncio.Lock()
+        self._opened = False
+        self._closed = False
+
+        self.hits = 0
+        self.misses = 0
+        self.flushed = 0
+
+    # ------------------------------------------------------------------
+    # Открытие и закрытие
+    # ------------------------------------------------------------------
+
+    async def open(self) -> None:
+        """Открытие базы и запуск фоновой записи (вызывается автоматически)"""
+        async with self._open_lock:
+            if self._opened:
+                return
+            if self._closed:
+                raise RuntimeError("Хранилище FSM закрыто")
+            await self.engine.start()
+            await self.engine.executescript(_SCHEMA)
+            self._flusher = asyncio.create_task(self._flush_loop())
+            self._opened = True
+            self.logger.info(f"💾 Хранилище FSM открыто: {self.path}")
+
+    async def close(self) -> None:
+        """Запись оставшихся изменений и закрытие базы"""
+        if not self._opened or self._closed:
+            self._closed = True
+            return
+        self._closed = True
+        if self._flusher is not None:
+            # Фоновая запись завершается сама после последнего прохода
+            self._flush_now.set()
+            await self._flusher
+            self._flusher = None
+        await self.flush()
+        await self.engine.close()
+        self.logger.info(f"💾 Хранилище FSM закрыто (записано изменений: {self.flushed})")
+
+    # ------------------------------------------------------------------
+    # Кеш
+    # ------------------------------------------------------------------
+
+    def _expired(self, record: _Record, now: float) -> bool:
+        return self.ttl is not None and now - record.updated_at > self.ttl
+
+    async def _load(self, key: StorageKey) -> _Record:
+        """Запись ключа из кеша, несохраненных изменений или базы"""
+        record = self._cache.get(key)
+        if record is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+        else:
+            record = self._pending.get(key)
+            if record is None:
+                if not self._opened:
+                    await self.open()
+                self.misses += 1
+                row = await self.engine.fetchone(
+                    "SELECT state, data, updated_at FROM fsm_states WHERE key = ?", (self.key_builder.build(key),)
+                )
+                if row is not None:
+                    record = _Record(row['state'], json.loads(row['data']), row['updated_at'])
+                else:
+                    record = _Record(None, {}, time.time())
+            self._remember(key, record)
+
+        if not record.is_empty and self._expired(record, time.time()):
+            record = _Record(None, {}, time.time())
+            self._cache[key] = record
+            self._pending[key] = record
+        return record
+
+    def _remember(self, key: StorageKey, record: _Record) -> None:
+        self._cache[key] = record
+        if len(self._cache) > self.cache_size:
+            # Вытеснение безопасно: несохраненные изменения лежат в _pending
+            self._cache.popitem(last=False)
+
+    async def _write(self, key: StorageKey, state: Optional[str], data: Dict[str, Any]) -> None:
+        if not self._opened:
+            await self.open()
+        record = _Record(state, data, time.time())
+        self._remember(key, record)
+        self._cache.move_to_end(key)
+        self._pending[key] = record
+        if len(self._pending) >= self.flush_batch:
+            self._flush_now.set()
+            # Уступаем фоновой записи, иначе при потоке попаданий в кеш она не запустится
+            await asyncio.sleep(0)
+
+    # ------------------------------------------------------------------
+    # Запись в базу
+    # ------------------------------------------------------------------
+
+    async def flush(self) -> int:
+        """Запись накопленных изменений одной транзакцией; возвращает число ключей"""
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, {}
+        upserts = []
+        deletes = []
+        for key, record in batch.items():
+            storage_key = self.key_builder.build(key)
+            if record.is_empty:
+                deletes.append((storage_key,))
+            else:
+                upserts.append((storage_key, record.state, json.dumps(record.data, ensure_ascii=False, default=str),
+                                record.updated_at))
+
+        def _apply(conn) -> None:
+            if upserts:
+                conn.executemany(_UPSERT, upserts)
+            if deletes:
+                conn.executemany("DELETE FROM fsm_states WHERE key = ?", deletes)
+
+        try:
+            await self.engine.transaction(_apply)
+        except BaseException:
+            # Вернем изменения, если их не перезаписали новые
+            for key, record in batch.items():
+                self._pending.setdefault(key, record)
+            raise
+        self.flushed += len(batch)
+        return len(batch)
+
+    async def purge_expired(self) -> int:
+        """Удаление состояний, не менявшихся дольше ttl"""
+        if self.ttl is None:
+            return 0
+        deadline = time.time() - self.ttl
+        removed = await self.engine.execute("DELETE FROM fsm_states WHERE updated_at < ?", (deadline,))
+        for key in [key for key, record in self._cache.items() if record.updated_at < deadline]:
+            del self._cache[key]
+        return removed
+
+    async def _flush_loop(self) -> None:
+        last_purge = time.monotonic()
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            try:
+                await self.flush()
+                if time.monotonic() - last_purge >= self.purge_interval:
+                    last_purge = time.monotonic()
+                    removed = await self.purge_expired()
+                    if removed:
+                        self.logger.info(f"🧹 Удалено истекших состояний FSM: {removed}")
+            except Exception as e:
+                self.logger.error(f"❌ Ошибка записи состояний FSM: {e}")
+
+    # ------------------------------------------------------------------
+    # BaseStorage
+    # ------------------------------------------------------------------
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._load(key)
+        await self._write(key, state.state if isinstance(state, State) else state, record.data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._load(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        record = await self._load(key)
+        await self._write(key, record.state, data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._load(key)).data.copy()
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики кеша и записи"""
+        lookups = self.hits + self.misses
+        return {
+            'cached': len(self._cache),
+            'pending': len(self._pending),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'flushed': self.flushed,
+        }
+
+
+def create_fsm_storage() -> SQLiteStorage:
+    """Хранилище FSM с параметрами из BOT_CONFIG"""
+    return SQLiteStorage(
+        path=BOT_CONFIG.get('fsm_storage_path', 'fsm_storage.db'),
+        cache_size=BOT_CONFIG.get('fsm_cache_size', 10000),
+        ttl=BOT_CONFIG.get('fsm_state_ttl', 7 * 24 * 3600),
+        flush_interval=BOT_CONFIG.get('fsm_flush_interval', 0.5),
+        flush_batch=BOT_CONFIG.get('fsm_flush_batch', 500),
+    )
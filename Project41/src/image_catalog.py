@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Каталог изображений меню RUУчебник
+Хранит в памяти соответствие "тип изображения -> файл" и обновляет его
+только при изменении директорий (по mtime) или по явному сбросу
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# Поддерживаемые форматы изображений
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+
+class ImageCatalog:
+    """
+    Индекс изображений в директории images/<тип>
+
+    Проверка актуальности - один stat директории не чаще, чем раз
+    в check_interval секунд. Добавление, удаление и переименование файлов
+    меняют mtime директории, поэтому индекс перестраивается автоматически.
+    Замену файла "на месте" десктопное приложение сообщает через invalidate().
+    """
+
+    def __init__(self, images_dir: str = "images", check_interval: float = 2.0):
+        self.images_dir = images_dir
+        self.check_interval = check_interval
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._types: Dict[str, Dict[str, Any]] = {}
+        self._subdirs: Optional[Dict[str, Any]] = None
+
+    @staticmethod
+    def _dir_mtime(path: str) -> Optional[int]:
+        """mtime директории или None, если ее нет"""
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _scan(self, image_type: str) -> Dict[str, Any]:
+        """Чтение директории одного типа изображений"""
+        image_dir = os.path.join(self.images_dir, image_type)
+        dir_mtime = self._dir_mtime(image_dir)
+        images = []
+
+        if dir_mtime is not None:
+            for name in sorted(os.listdir(image_dir)):
+                if not name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                path = os.path.join(image_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                images.append({
+                    'name': name,
+                    'path': path,
+                    'size': stat.st_size,
+                    'mtime': stat.st_mtime
+                })
+
+        return {
+            'dir_mtime': dir_mtime,
+            'checked_at': time.monotonic(),
+            'images': images
+        }
+
+    def _get_record(self, image_type: str) -> Dict[str, Any]:
+        """Актуальная запись индекса для типа изображений"""
+        with self._lock:
+            record = self._types.get(image_type)
+            now = time.monotonic()
+
+            if record is not None and now - record['checked_at'] < self.check_interval:
+                return record
+
+            if record is not None:
+                image_dir = os.path.join(self.images_dir, image_type)
+                if self._dir_mtime(image_dir) == record['dir_mtime']:
+                    record['checked_at'] = now
+                    return record
+
+            record = self._scan(image_type)
+            self._types[image_type] = record
+            return record
+
+    def get_images(self, image_type: str) -> List[Dict[str, Any]]:
+        """
+        Список изображений определенного типа
+
+        Args:
+            image_type: Тип (поддиректория images), например "rules"
+
+        Returns:
+            List[Dict]: Изображения с путем, размером и временем изменения
+        """
+        return list(self._get_record(image_type)['images'])
+
+    def get_image(self, image_type: str) -> Optional[Dict[str, Any]]:
+        """Основное (первое) изображение типа с метаданными"""
+        images = self._get_record(image_type)['images']
+        return images[0] if images else None
+
+    def get_image_path(self, image_type: str) -> Optional[str]:
+        """Путь к основному изображению типа"""
+        image = self.get_image(image_type)
+        return image['path'] if image else None
+
+    def list_all(self) -> Dict[str, List[str]]:
+        """
+        Имена изображений по всем поддиректориям images
+
+        Returns:
+            Dict[str, List[str]]: Поддиректория -> список имен файлов
+        """
+        with self._lock:
+            now = time.monotonic()
+            subdirs = self._subdirs
+            if subdirs is None or now - subdirs['checked_at'] >= self.check_interval:
+                dir_mtime = self._dir_mtime(self.images_dir)
+                if subdirs is None or dir_mtime != subdirs['dir_mtime']:
+                    names = []
+                    if dir_mtime is not None:
+                        names = sorted(
+                            name for name in os.listdir(self.images_dir)
+                            if os.path.isdir(os.path.join(self.images_dir, name))
+                        )
+                    subdirs = {'dir_mtime': dir_mtime, 'names': names}
+                subdirs['checked_at'] = now
+                self._subdirs = subdirs
+
+        return {
+            name: [image['name'] for image in self.get_images(name)]
+            for name in subdirs['names']
+        }
+
+    def invalidate(self, image_type: Optional[str] = None):
+        """
+        Принудительный сброс индекса
+
+        Args:
+            image_type: Тип изображений; если не указан - сбрасывается весь индекс
+        """
+        with self._lock:
+            if image_type is None:
+                self._types.clear()
+                self._subdirs = None
+            else:
+                self._types.pop(image_type, None)
+
+
+# Общие экземпляры каталога (по одному на директорию)
+_catalogs: Dict[str, ImageCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_image_catalog(images_dir: str = "images") -> ImageCatalog:
+    """
+    Получение общего каталога изображений для директории
+
+    Args:
+        images_dir: Корневая директория изображений
+
+    Returns:
+        ImageCatalog: Каталог, общий для всех компонентов процесса
+    """
+    key = os.path.abspath(images_dir)
+    with _catalogs_lock:
+        catalog = _catalogs.get(key)
+        if catalog is None:
+            catalog = ImageCatalog(images_dir)
+            _catalogs[key] = catalog
+        return catalog
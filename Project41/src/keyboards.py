@@ -244,7 +244,9 @@ def get_admin_keyboard() -> InlineKeyboardMarkup:
 
 
 def get_pagination_keyboard(current_page: int, total_pages: int, 
-                           callback_prefix: str, additional_data: str = "") -> InlineKeyboardMarkup:
+                           callback_prefix: str, additional_data: str = "",
+                           prev_data: Optional[str] = None,
+                           next_data: Optional[str] = None) -> InlineKeyboardMarkup:
     """
     Создание клавиатуры с пагинацией
     
@@ -253,6 +255,8 @@ def get_pagination_keyboard(current_page: int, total_pages: int,
         total_pages: Общее количество страниц
         callback_prefix: Префикс для callback_data
         additional_data: Дополнительные данные для callback
+        prev_data: Готовый callback кнопки "назад" (например, с курсором страницы)
+        next_data: Готовый callback кнопки "вперед"
         
     Returns:
         InlineKeyboardMarkup: Клавиатура с кнопками пагинации
@@ -267,7 +271,7 @@ def get_pagination_keyboard(current_page: int, total_pages: int,
             pagination_row.append(
                 InlineKeyboardButton(
                     text="◀️ Пред",
-                    callback_data=f"{callback_prefix}_page_{current_page - 1}_{additional_data}"
+                    callback_data=prev_data or f"{callback_prefix}_page_{current_page - 1}_{additional_data}"
                 )
             )
         
@@ -284,7 +288,7 @@ def get_pagination_keyboard(current_page: int, total_pages: int,
             pagination_row.append(
                 InlineKeyboardButton(
                     text="След ▶️",
-                    callback_data=f"{callback_prefix}_page_{current_page + 1}_{additional_data}"
+                    callback_data=next_data or f"{callback_prefix}_page_{current_page + 1}_{additional_data}"
                 )
             )
         
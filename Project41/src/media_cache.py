@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Реестр file_id изображений, уже загруженных в Telegram
+Позволяет повторно отправлять изображения меню без загрузки файла
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+# Файл реестра (общий для бота и десктопного приложения)
+MEDIA_CACHE_FILE = os.path.join("data", "media", "file_ids.json")
+
+
+def file_sha256(file_path: str) -> str:
+    """Подсчет sha256 содержимого файла"""
+    hash_obj = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hash_obj.update(chunk)
+    return hash_obj.hexdigest()
+
+
+class MediaCache:
+    """
+    Персистентный реестр file_id, ключ - путь + mtime + хеш содержимого
+
+    Запись действительна, пока файл не изменился. При смене mtime
+    хеш пересчитывается: если содержимое то же, file_id сохраняется,
+    иначе запись удаляется и изображение будет загружено заново.
+    """
+
+    def __init__(self, cache_file: str = MEDIA_CACHE_FILE):
+        self.cache_file = cache_file
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._file_mtime: Optional[int] = None
+        self._load()
+
+    @staticmethod
+    def _key(file_path: str) -> str:
+        """Нормализованный ключ записи"""
+        return os.path.normcase(os.path.abspath(file_path))
+
+    def _load(self):
+        """Чтение реестра с диска"""
+        try:
+            self._file_mtime = os.stat(self.cache_file).st_mtime_ns
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            self._entries = {}
+        except Exception as e:
+            self.logger.warning(f"⚠️ Не удалось прочитать реестр file_id: {e}")
+            self._entries = {}
+
+    def _reload_if_changed(self):
+        """Перечитывание реестра, если его изменил другой процесс"""
+        try:
+            mtime = os.stat(self.cache_file).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._file_mtime:
+            self._load()
+
+    def _save(self):
+        """Атомарная запись реестра на диск"""
+        directory = os.path.dirname(self.cache_file)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        tmp_file = f"{self.cache_file}.tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.cache_file)
+            self._file_mtime = os.stat(self.cache_file).st_mtime_ns
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка сохранения реестра file_id: {e}")
+
+    def get_file_id(self, file_path: str) -> Optional[str]:
+        """
+        Получение file_id для файла, если он уже был загружен
+
+        Args:
+            file_path: Путь к изображению
+
+        Returns:
+            Optional[str]: file_id или None, если файл нужно загрузить
+        """
+        key = self._key(file_path)
+        with self._lock:
+            self._reload_if_changed()
+            entry = self._entries.get(key)
+            if not entry:
+                return None
+
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                self._entries.pop(key, None)
+                self._save()
+                return None
+
+            if entry.get('mtime') == stat.st_mtime_ns and entry.get('size') == stat.st_size:
+                return entry.get('file_id')
+
+            # Файл трогали - сверяем содержимое
+            if stat.st_size == entry.get('size') and file_sha256(file_path) == entry.get('sha256'):
+                entry['mtime'] = stat.st_mtime_ns
+                self._save()
+                return entry.get('file_id')
+
+            self.logger.info(f"🖼️ Изображение изменено, требуется повторная загрузка: {file_path}")
+            self._entries.pop(key, None)
+            self._save()
+            return None
+
+    def store(self, file_path: str, file_id: str):
+        """
+        Сохранение file_id, полученного после загрузки файла
+
+        Args:
+            file_path: Путь к загруженному изображению
+            file_id: file_id, который вернул Telegram
+        """
+        try:
+            stat = os.stat(file_path)
+            digest = file_sha256(file_path)
+        except OSError as e:
+            self.logger.warning(f"⚠️ Не удалось сохранить file_id для {file_path}: {e}")
+            return
+
+        with self._lock:
+            self._reload_if_changed()
+            self._entries[self._key(file_path)] = {
+                'file_id': file_id,
+                'mtime': stat.st_mtime_ns,
+                'size': stat.st_size,
+                'sha256': digest,
+                'uploaded_at': datetime.now().isoformat()
+            }
+            self._save()
+
+    def invalidate(self, file_path: str):
+        """
+        Удаление записи (например, после замены изображения администратором)
+
+        Args:
+            file_path: Путь к изображению
+        """
+        with self._lock:
+            self._reload_if_changed()
+            if self._entries.pop(self._key(file_path), None) is not None:
+                self._save()
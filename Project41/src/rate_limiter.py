@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Ограничение частоты запросов пользователей
+Token bucket с состоянием из двух чисел на пользователя и middleware для aiogram
+"""
+
+import logging
+import time
+from itertools import islice
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, InlineQuery, Message, TelegramObject
+
+from config import BOT_CONFIG, MESSAGES
+
+
+class TokenBucketLimiter:
+    """
+    Лимитер "ведро с токенами"
+
+    Для каждого ключа хранится пара (токены, время обновления). Токены
+    пополняются со скоростью rate в секунду до capacity; запрос стоимостью
+    cost проходит, если токенов достаточно. Проверка - O(1) и не зависит
+    от числа запросов пользователя.
+
+    Память ограничена max_keys: при переполнении вытесняются ключи,
+    к которым дольше всего не обращались (LRU). Порядок обращений хранит
+    сам dict: при каждом обращении запись удаляется и вставляется в конец.
+    Вытесняется сразу evict_fraction записей, чтобы стоимость вытеснения
+    распределялась по многим вставкам. Вытесненный пользователь просто
+    получает полное ведро при следующем запросе.
+    """
+
+    def __init__(self, rate: float, capacity: float, max_keys: int = 100_000,
+                 evict_fraction: float = 0.1, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            rate: Скорость пополнения (токенов в секунду)
+            capacity: Размер ведра (допустимый всплеск запросов)
+            max_keys: Максимальное количество отслеживаемых пользователей
+            evict_fraction: Доля записей, вытесняемых при переполнении
+            clock: Источник времени (монотонные секунды)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self.evict_count = max(1, int(max_keys * evict_fraction))
+        self.clock = clock
+        self._buckets: Dict[Any, Tuple[float, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def consume(self, key: Any, cost: float = 1.0) -> float:
+        """
+        Попытка списать токены за запрос
+
+        Args:
+            key: Ключ (обычно ID пользователя)
+            cost: Стоимость действия в токенах
+
+        Returns:
+            float: 0.0 если запрос разрешен, иначе сколько секунд ждать
+        """
+        now = self.clock()
+        buckets = self._buckets
+        state = buckets.pop(key, None)
+
+        if state is None:
+            tokens = self.capacity
+            if len(buckets) >= self.max_keys:
+                self._evict()
+        else:
+            tokens = state[0] + (now - state[1]) * self.rate
+            if tokens > self.capacity:
+                tokens = self.capacity
+
+        if tokens >= cost:
+            buckets[key] = (tokens - cost, now)
+            return 0.0
+
+        buckets[key] = (tokens, now)
+        return (cost - tokens) / self.rate
+
+    def _evict(self) -> None:
+        """Вытеснение самых давно активных пользователей"""
+        for key in list(islice(self._buckets, self.evict_count)):
+            del self._buckets[key]
+
+    def is_limited(self, key: Any, cost: float = 1.0) -> bool:
+        """True, если запрос нужно отклонить"""
+        return self.consume(key, cost) > 0.0
+
+    def time_to_full(self, key: Any) -> float:
+        """Через сколько секунд ведро пользователя снова станет полным"""
+        state = self._buckets.get(key)
+        if state is None:
+            return 0.0
+        tokens = min(self.capacity, state[0] + (self.clock() - state[1]) * self.rate)
+        return (self.capacity - tokens) / self.rate
+
+    def purge_idle(self) -> int:
+        """
+        Удаление пользователей с полным ведром (их состояние не нужно хранить)
+
+        Returns:
+            int: Количество удаленных записей
+        """
+        now = self.clock()
+        full_after = self.capacity / self.rate
+        idle = [key for key, (_, updated) in self._buckets.items() if now - updated >= full_after]
+        for key in idle:
+            del self._buckets[key]
+        return len(idle)
+
+
+def create_default_limiter() -> TokenBucketLimiter:
+    """Лимитер с параметрами из BOT_CONFIG (rate_limit_requests за rate_limit_window)"""
+    requests = BOT_CONFIG['rate_limit_requests']
+    return TokenBucketLimiter(
+        rate=requests / BOT_CONFIG['rate_limit_window'],
+        capacity=requests,
+        max_keys=BOT_CONFIG.get('rate_limit_max_users', 100_000)
+    )
+
+
+# Общий лимитер процесса
+default_limiter = create_default_limiter()
+
+
+class RateLimitMiddleware(BaseMiddleware):
+    """
+    Outer middleware: отклоняет апдейты пользователя, превысившего лимит,
+    до фильтров и обработчиков
+
+    Стоимость действия определяется по префиксу callback_data или текста
+    сообщения (например, скачивание дороже навигации), для inline-запросов -
+    по ключу 'inline_query'; остальные апдейты стоят costs['default'].
+    """
+
+    def __init__(self, limiter: Optional[TokenBucketLimiter] = None,
+                 costs: Optional[Dict[str, float]] = None,
+                 exempt_ids: Optional[set] = None):
+        self.limiter = limiter or default_limiter
+        costs = dict(costs if costs is not None else BOT_CONFIG.get('rate_limit_costs', {}))
+        self.default_cost = costs.pop('default', 1.0)
+        self.costs = costs
+        self.exempt_ids = exempt_ids if exempt_ids is not None else {BOT_CONFIG.get('admin_id')}
+        self.logger = logging.getLogger(__name__)
+
+    def get_cost(self, event: TelegramObject) -> float:
+        """Стоимость апдейта в токенах"""
+        if isinstance(event, InlineQuery):
+            return self.costs.get('inline_query', self.default_cost)
+
+        if isinstance(event, CallbackQuery):
+            text = event.data
+        elif isinstance(event, Message):
+            text = event.text
+        else:
+            text = None
+
+        if text:
+            for prefix, cost in self.costs.items():
+                if text.startswith(prefix):
+                    return cost
+        return self.default_cost
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        user = getattr(event, 'from_user', None)
+        if user is None or user.id in self.exempt_ids:
+            return await handler(event, data)
+
+        retry_after = self.limiter.consume(user.id, self.get_cost(event))
+        if not retry_after:
+            return await handler(event, data)
+
+        self.logger.debug(f"⏰ Лимит запросов для {user.id}, повтор через {retry_after:.1f} с")
+        if isinstance(event, CallbackQuery):
+            await event.answer(MESSAGES['error_rate_limit'], show_alert=True)
+        elif isinstance(event, Message):
+            await event.answer(MESSAGES['error_rate_limit'])
+        return None
@@ -7,21 +7,33 @@ import asyncio
 import logging
 import sqlite3
 import json
+import time
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
+
+from async_sqlite import AsyncSQLiteEngine
+
+# Решение о доступе (пользователь известен и не заблокирован) кешируется
+# на это время; set_user_blocked сбрасывает запись немедленно
+ACCESS_CACHE_TTL = 60
+ACCESS_CACHE_SIZE = 50000
 
 class DatabaseManager:
     """Упрощенный менеджер базы данных"""
     
-    def __init__(self):
-        self.db_path = "bot_database.db"
+    def __init__(self, db_path: str = "bot_database.db"):
+        self.db_path = db_path
         self.logger = logging.getLogger(__name__)
+        # Одно соединение в отдельном потоке - запросы не блокируют цикл событий
+        self.engine = AsyncSQLiteEngine(self.db_path)
+        self._access_cache: "OrderedDict[int, Tuple[float, bool]]" = OrderedDict()
         
     async def initialize(self):
         """Инициализация базы данных"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.execute('''
+            await self.engine.start()
+            await self.engine.executescript('''
                 CREATE TABLE IF NOT EXISTS users (
                     telegram_id INTEGER PRIMARY KEY,
                     username TEXT,
@@ -29,9 +41,7 @@ class DatabaseManager:
                     last_name TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     is_blocked BOOLEAN DEFAULT FALSE
-                )
-            ''')
-            conn.execute('''
+                );
                 CREATE TABLE IF NOT EXISTS textbooks (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     title TEXT,
@@ -40,10 +50,28 @@ class DatabaseManager:
                     subject TEXT,
                     file_path TEXT,
                     downloads INTEGER DEFAULT 0
-                )
+                );
+                -- Снимок каталога читается в порядке (class_name, subject, title, id)
+                DROP INDEX IF EXISTS idx_textbooks_class_subject;
+                CREATE INDEX IF NOT EXISTS idx_textbooks_class_subject_title
+                    ON textbooks(class_name, subject, title, id);
+                
+                -- Версия каталога: меняется при любом изменении списка учебников
+                CREATE TABLE IF NOT EXISTS catalog_meta (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    version INTEGER NOT NULL DEFAULT 0
+                );
+                INSERT OR IGNORE INTO catalog_meta (id, version) VALUES (1, 0);
+                CREATE TRIGGER IF NOT EXISTS trg_textbooks_catalog_insert
+                    AFTER INSERT ON textbooks
+                    BEGIN UPDATE catalog_meta SET version = version + 1 WHERE id = 1; END;
+                CREATE TRIGGER IF NOT EXISTS trg_textbooks_catalog_delete
+                    AFTER DELETE ON textbooks
+                    BEGIN UPDATE catalog_meta SET version = version + 1 WHERE id = 1; END;
+                CREATE TRIGGER IF NOT EXISTS trg_textbooks_catalog_update
+                    AFTER UPDATE OF title, author, class_name, subject, file_path ON textbooks
+                    BEGIN UPDATE catalog_meta SET version = version + 1 WHERE id = 1; END;
             ''')
-            conn.commit()
-            conn.close()
             self.logger.info("✅ База данных инициализирована")
         except Exception as e:
             self.logger.error(f"❌ Ошибка инициализации БД: {e}")
@@ -51,48 +79,86 @@ class DatabaseManager:
     
     async def close(self):
         """Закрытие соединения"""
+        await self.engine.close()
         self.logger.info("📊 База данных закрыта")
     
     async def get_or_create_user(self, telegram_id: int, username: str = None, 
                                 first_name: str = None, last_name: str = None) -> Dict[str, Any]:
         """Получение или создание пользователя"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Проверяем, существует ли пользователь
-            cursor.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
-            user = cursor.fetchone()
+            # INSERT OR IGNORE создает пользователя только если его еще нет
+            created = await self.engine.execute('''
+                INSERT OR IGNORE INTO users (telegram_id, username, first_name, last_name)
+                VALUES (?, ?, ?, ?)
+            ''', (telegram_id, username, first_name, last_name))
             
-            if not user:
-                # Создаем нового пользователя
-                cursor.execute('''
-                    INSERT INTO users (telegram_id, username, first_name, last_name)
-                    VALUES (?, ?, ?, ?)
-                ''', (telegram_id, username, first_name, last_name))
-                conn.commit()
+            if created:
                 self.logger.info(f"👤 Создан новый пользователь: {telegram_id}")
             
-            conn.close()
             return {
                 'telegram_id': telegram_id,
                 'username': username,
                 'first_name': first_name,
                 'last_name': last_name,
-                'is_new': not bool(user)
+                'is_new': bool(created)
             }
         except Exception as e:
             self.logger.error(f"❌ Ошибка работы с пользователем: {e}")
             return {}
     
+    async def get_user_access(self, telegram_id: int, username: str = None,
+                              first_name: str = None, last_name: str = None) -> Dict[str, Any]:
+        """
+        Проверка доступа с регистрацией пользователя за одно обращение к базе
+
+        Returns:
+            Dict: {'is_new': создан ли пользователь, 'is_blocked': заблокирован ли}
+        """
+        now = time.monotonic()
+        cached = self._access_cache.get(telegram_id)
+        if cached and cached[0] > now:
+            self._access_cache.move_to_end(telegram_id)
+            return {'is_new': False, 'is_blocked': cached[1]}
+
+        def _access(conn: sqlite3.Connection) -> Tuple[bool, bool]:
+            created = conn.execute('''
+                INSERT OR IGNORE INTO users (telegram_id, username, first_name, last_name)
+                VALUES (?, ?, ?, ?)
+            ''', (telegram_id, username, first_name, last_name)).rowcount
+            row = conn.execute(
+                "SELECT is_blocked FROM users WHERE telegram_id = ?", (telegram_id,)
+            ).fetchone()
+            return bool(created), bool(row and row[0])
+
+        is_new, is_blocked = await self.engine.run(_access)
+        if is_new:
+            self.logger.info(f"👤 Создан новый пользователь: {telegram_id}")
+
+        self._access_cache[telegram_id] = (now + ACCESS_CACHE_TTL, is_blocked)
+        self._access_cache.move_to_end(telegram_id)
+        if len(self._access_cache) > ACCESS_CACHE_SIZE:
+            self._access_cache.popitem(last=False)
+        return {'is_new': is_new, 'is_blocked': is_blocked}
+
+    async def set_user_blocked(self, telegram_id: int, blocked: bool = True) -> bool:
+        """Блокировка или разблокировка пользователя"""
+        try:
+            updated = await self.engine.execute(
+                "UPDATE users SET is_blocked = ? WHERE telegram_id = ?", (blocked, telegram_id)
+            )
+            return bool(updated)
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка блокировки пользователя: {e}")
+            return False
+        finally:
+            self._access_cache.pop(telegram_id, None)
+
     async def is_user_blocked(self, telegram_id: int) -> bool:
         """Проверка, заблокирован ли пользователь"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("SELECT is_blocked FROM users WHERE telegram_id = ?", (telegram_id,))
-            result = cursor.fetchone()
-            conn.close()
+            result = await self.engine.fetchone(
+                "SELECT is_blocked FROM users WHERE telegram_id = ?", (telegram_id,)
+            )
             return bool(result and result[0]) if result else False
         except:
             return False
@@ -100,27 +166,13 @@ class DatabaseManager:
     async def get_textbooks_by_class_and_subject(self, class_name: str, subject: str) -> List[Dict]:
         """Получение учебников по классу и предмету"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
+            rows = await self.engine.fetchall('''
                 SELECT id, title, author, class_name, subject, downloads
                 FROM textbooks 
                 WHERE class_name = ? AND subject = ?
             ''', (class_name, subject))
             
-            textbooks = []
-            for row in cursor.fetchall():
-                textbooks.append({
-                    'id': row[0],
-                    'title': row[1],
-                    'author': row[2],
-                    'class_name': row[3],
-                    'subject': row[4],
-                    'downloads': row[5]
-                })
-            
-            conn.close()
-            return textbooks
+            return [dict(row) for row in rows]
         except Exception as e:
             self.logger.error(f"❌ Ошибка получения учебников: {e}")
             return []
@@ -128,12 +180,22 @@ class DatabaseManager:
     async def increment_download_count(self, textbook_id: int):
         """Увеличение счетчика скачиваний"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
+            await self.engine.execute('''
                 UPDATE textbooks SET downloads = downloads + 1 WHERE id = ?
             ''', (textbook_id,))
-            conn.commit()
-            conn.close()
         except Exception as e:
-            self.logger.error(f"❌ Ошибка обновления счетчика: {e}")
\ No newline at end of file
+            self.logger.error(f"❌ Ошибка обновления счетчика: {e}")
+    
+    async def get_catalog_version(self) -> int:
+        """Текущая версия каталога учебников"""
+        row = await self.engine.fetchone("SELECT version FROM catalog_meta WHERE id = 1")
+        return row[0] if row else 0
+    
+    async def get_all_textbooks(self) -> List[Dict]:
+        """Получение всего каталога учебников (для снимка в памяти)"""
+        rows = await self.engine.fetchall('''
+            SELECT id, title, author, class_name, subject, downloads
+            FROM textbooks
+            ORDER BY class_name, subject, title, id
+        ''')
+        return [dict(row) for row in rows]
@@ -7,6 +7,7 @@ import logging
 from datetime import datetime
 from typing import Dict, Any
 from simple_database import DatabaseManager
+from rate_limiter import default_limiter
 
 def setup_logging():
     """Настройка логирования"""
@@ -30,9 +31,9 @@ def format_file_size(size_bytes):
         size_bytes /= 1024.0
     return f"{size_bytes:.1f} ТБ"
 
-async def is_rate_limited(user_id: int) -> bool:
-    """Проверка лимитов"""
-    return False  # Упрощенная версия
+async def is_rate_limited(user_id: int, cost: float = 1.0) -> bool:
+    """Проверка лимитов (общий token bucket, см. rate_limiter)"""
+    return default_limiter.is_limited(user_id, cost)
 
 async def log_user_action(db: DatabaseManager, user_id: str, action: str, data: Dict[str, Any] = None):
     """Логирование действий пользователя"""
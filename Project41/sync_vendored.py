@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Проверка и синхронизация общих модулей Project41 и RuUchebnik TEST
+
+Оба бота разворачиваются отдельно (каждая папка - свой Replit), и у
+каждого свой config.py с одинаковым именем модуля, поэтому общие модули
+не импортируются из соседней папки, а лежат копией в RuUchebnik TEST.
+Источник - Project41/src; копия отличается только заголовком модуля.
+
+Запуск:
+    python sync_vendored.py           # проверка: код копий совпадает с src (код выхода 1, если нет)
+    python sync_vendored.py --write   # перенести код из src в копии, сохранив их заголовки
+"""
+
+import argparse
+import ast
+import os
+import sys
+from typing import Tuple
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(ROOT, 'src')
+VENDOR_DIR = os.path.join(ROOT, os.pardir, 'RuUchebnik TEST')
+
+# Модули, общие для обоих ботов
+VENDORED = ['async_sqlite.py', 'bot_session.py', 'fsm_storage.py', 'rate_limiter.py']
+
+
+def split_header(text: str) -> Tuple[str, str]:
+    """Заголовок (кодировка и docstring модуля) и остальной код"""
+    docstring = ast.parse(text).body[0]
+    lines = text.splitlines(keepends=True)
+    return ''.join(lines[:docstring.end_lineno]), ''.join(lines[docstring.end_lineno:])
+
+
+def read(path: str) -> str:
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--write', action='store_true', help="Обновить копии из src")
+    args = parser.parse_args()
+
+    stale = []
+    for name in VENDORED:
+        _, source_code = split_header(read(os.path.join(SOURCE_DIR, name)))
+        vendor_path = os.path.join(VENDOR_DIR, name)
+        vendor_header, vendor_code = split_header(read(vendor_path))
+        if vendor_code == source_code:
+            continue
+        if args.write:
+            with open(vendor_path, 'w', encoding='utf-8') as f:
+                f.write(vendor_header + source_code)
+            print(f"🔄 {name}: копия обновлена")
+        else:
+            stale.append(name)
+            print(f"❌ {name}: копия в RuUchebnik TEST расходится с src")
+
+    if stale:
+        print("Запустите python sync_vendored.py --write (правки вносятся в Project41/src)")
+        sys.exit(1)
+    print("✅ Копии общих модулей совпадают с src")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный стенд webhook-режима бота RUУчебник
+Отправляет синтетические обновления (/start и нажатия кнопок) на webhook
+и выводит пропускную способность и задержки (p50/p99); с --local --mode polling
+те же обновления получает long polling, что позволяет сравнить режимы
+
+Запуск:
+    python webhook_harness.py --local                 # бот поднимается в процессе, без Telegram
+    python webhook_harness.py --local --mode polling  # то же через getUpdates
+    python webhook_harness.py --url http://127.0.0.1:8080/webhook --secret <WEBHOOK_SECRET>
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+
+import aiohttp
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import GetUpdates
+from aiogram.types import Chat, Message, Update, User
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+# Последовательность действий одного пользователя
+CALLBACKS = ["agree_rules", "menu_textbooks", "class_5", "subject_5_math", "back_classes", "back_main"]
+
+
+class StubSession(BaseSession):
+    """
+    Сессия бота без сети: на каждый вызов API возвращает минимальный ответ
+    Нужна, чтобы в режиме --local измерялась обработка, а не Telegram.
+    getUpdates отдает обновления из очереди updates (режим polling)
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.calls = Counter()
+        self.updates: asyncio.Queue = asyncio.Queue()
+        self._message_ids = itertools.count(1)
+
+    async def _get_updates(self, bot, method: GetUpdates):
+        try:
+            first = await asyncio.wait_for(self.updates.get(), timeout=method.timeout or 1)
+        except asyncio.TimeoutError:
+            return []
+        batch = [first]
+        while len(batch) < (method.limit or 100) and not self.updates.empty():
+            batch.append(self.updates.get_nowait())
+        return [Update.model_validate(update, context={"bot": bot}) for update in batch]
+
+    async def make_request(self, bot, method, timeout=None):
+        if isinstance(method, GetUpdates):
+            return await self._get_updates(bot, method)
+        self.calls[type(method).__name__] += 1
+        returning = method.__returning__
+        if returning is User:
+            return User(id=1, is_bot=True, first_name="Harness", username="harness_bot")
+        if returning is bool:
+            return True
+        chat_id = getattr(method, 'chat_id', None)
+        return Message(
+            message_id=next(self._message_ids),
+            date=datetime.now(),
+            chat=Chat(id=chat_id if isinstance(chat_id, int) else 1, type="private")
+        )
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536,
+                             raise_for_status=True):
+        """Стенд файлы не скачивает: содержимое всегда пустое"""
+        return
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def make_updates(users: int, rounds: int):
+    """Синтетические обновления: /start и цепочка нажатий для каждого пользователя"""
+    update_ids = itertools.count(1)
+    now = int(time.time())
+    per_user = []
+    for u in range(users):
+        user_id = 100000 + u
+        user = {"id": user_id, "is_bot": False, "first_name": f"User{u}", "username": f"user{u}"}
+        chat = {"id": user_id, "type": "private"}
+        updates = [{
+            "update_id": next(update_ids),
+            "message": {
+                "message_id": 1, "date": now, "chat": chat, "from": user, "text": "/start",
+                "entities": [{"type": "bot_command", "offset": 0, "length": 6}]
+            }
+        }]
+        for r in range(rounds):
+            for data in CALLBACKS:
+                updates.append({
+                    "update_id": next(update_ids),
+                    "callback_query": {
+                        "id": f"{user_id}-{r}-{data}",
+                        "from": user,
+                        "chat_instance": str(user_id),
+                        "data": data,
+                        "message": {"message_id": 2, "date": now, "chat": chat, "from": user, "text": "menu"}
+                    }
+                })
+        per_user.append(updates)
+    return per_user
+
+
+async def send_all(url: str, secret: str, per_user, concurrency: int):
+    """Отправка обновлений; порядок внутри пользователя сохраняется"""
+    latencies = []
+    statuses = Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret}
+
+    async def run_user(session: aiohttp.ClientSession, updates):
+        for update in updates:
+            async with semaphore:
+                started = time.perf_counter()
+                async with session.post(url, json=update, headers=headers) as response:
+                    await response.read()
+                    statuses[response.status] += 1
+                latencies.append(time.perf_counter() - started)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        # Запрос с неверным секретом должен быть отклонен
+        async with session.post(url, json={"update_id": 0},
+                                headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"}) as response:
+            secret_check = response.status
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run_user(session, updates) for updates in per_user))
+        elapsed = time.perf_counter() - started
+
+    return latencies, statuses, secret_check, elapsed
+
+
+async def send_polling(session: StubSession, dp, per_user, concurrency: int):
+    """
+    Те же обновления через getUpdates: задержка - от постановки в очередь
+    до завершения обработчика, следующее обновление пользователя - после него
+    """
+    latencies = []
+    statuses = Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+    waiters = {}
+
+    async def track(handler, event, data):
+        try:
+            return await handler(event, data)
+        finally:
+            future = waiters.pop(event.update_id, None)
+            if future is not None and not future.done():
+                future.set_result(None)
+
+    dp.update.outer_middleware(track)
+
+    async def run_user(updates):
+        loop = asyncio.get_running_loop()
+        for update in updates:
+            async with semaphore:
+                future = waiters[update["update_id"]] = loop.create_future()
+                started = time.perf_counter()
+                session.updates.put_nowait(update)
+                await future
+                statuses["handled"] += 1
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_user(updates) for updates in per_user))
+    return latencies, statuses, None, time.perf_counter() - started
+
+
+def report(latencies, statuses, secret_check, elapsed):
+    latencies.sort()
+    total = len(latencies)
+
+    def percentile(q: float) -> float:
+        return latencies[min(total - 1, int(total * q))] * 1000 if total else 0.0
+
+    print(f"Обновлений: {total} за {elapsed:.2f} с -> {total / elapsed:.0f} обн/с")
+    print(f"Задержка: p50 {percentile(0.50):.2f} мс, p99 {percentile(0.99):.2f} мс, "
+          f"макс {latencies[-1] * 1000 if total else 0.0:.2f} мс")
+    print(f"Коды ответов: {dict(statuses)}")
+    if secret_check is not None:
+        print(f"Неверный секрет: HTTP {secret_check} ({'OK' if secret_check == 401 else 'ОШИБКА'})")
+
+
+async def run_local(args):
+    """Бот с базой во временной директории и сессией-заглушкой (webhook или polling)"""
+    from aiogram import Bot, Dispatcher
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.enums import ParseMode
+    from aiogram.fsm.storage.memory import MemoryStorage
+    from aiohttp import web
+
+    from catalog_snapshot import CatalogStore
+    from config import BOT_CONFIG
+    from enhanced_bot import EnhancedRUUchebnikBot
+    from simple_database import DatabaseManager
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        app_bot = EnhancedRUUchebnikBot()
+        app_bot.db_manager = DatabaseManager(os.path.join(tmp, "harness.db"))
+        await app_bot.db_manager.initialize()
+        app_bot.catalog = CatalogStore(app_bot.db_manager)
+        await app_bot.catalog.load()
+
+        session = StubSession()
+        app_bot.bot = Bot(
+            token="123456:HARNESS",
+            session=session,
+            default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+        )
+        app_bot.dp = Dispatcher(storage=MemoryStorage())
+        app_bot.register_handlers()
+        per_user = make_updates(args.users, args.rounds)
+
+        if args.mode == "polling":
+            polling = asyncio.create_task(
+                app_bot.dp.start_polling(app_bot.bot, handle_signals=False, polling_timeout=1)
+            )
+            try:
+                report(*await send_polling(session, app_bot.dp, per_user, args.concurrency))
+                print(f"Вызовы Bot API: {dict(session.calls)}")
+            finally:
+                await app_bot.dp.stop_polling()
+                await asyncio.gather(polling, return_exceptions=True)
+                await app_bot.db_manager.close()
+            return
+
+        secret = "harness-secret"
+        # Ответ возвращается после обработки, чтобы задержка включала обработчики
+        app = app_bot.create_webhook_app(secret, handle_in_background=False)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", args.port)
+        await site.start()
+
+        try:
+            url = f"http://127.0.0.1:{args.port}{BOT_CONFIG['webhook_path']}"
+            report(*await send_all(url, secret, per_user, args.concurrency))
+            print(f"Вызовы Bot API: {dict(session.calls)}")
+        finally:
+            await runner.cleanup()
+            await app_bot.db_manager.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', help="Адрес webhook работающего бота")
+    parser.add_argument('--secret', default=os.getenv('WEBHOOK_SECRET', ''))
+    parser.add_argument('--local', action='store_true', help="Поднять бота в процессе с заглушкой Bot API")
+    parser.add_argument('--mode', choices=['webhook', 'polling'], default='webhook',
+                        help="Как бот получает обновления в --local")
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+
+    if args.local:
+        await run_local(args)
+    elif args.url:
+        per_user = make_updates(args.users, args.rounds)
+        report(*await send_all(args.url, args.secret, per_user, args.concurrency))
+    else:
+        parser.error("укажите --url или --local")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
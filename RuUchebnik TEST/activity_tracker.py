@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Учет активности пользователей для Telegram бота RUУчебник
+Время последней активности хранится в памяти и записывается в базу пакетами
+
+Автор: Разработано для системы RUУчебник
+Версия: 1.0.0
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def _start_of_day(timestamp: float) -> float:
+    """Начало локальных суток для момента времени"""
+    return datetime.fromtimestamp(timestamp).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    ).timestamp()
+
+
+class ActivityTracker:
+    """
+    Трекер активности с пакетной записью
+
+    Вместо UPDATE на каждое действие пользователя touch() только
+    запоминает время в памяти. Раз в flush_interval секунд все
+    накопившиеся отметки записываются одним запросом (для каждого
+    пользователя - только последняя).
+
+    Словарь отметок упорядочен по времени активности: при каждом
+    обращении запись удаляется и вставляется в конец. Поэтому счетчик
+    "активны сейчас" просматривает только недавних пользователей с конца,
+    а при смене суток вчерашние записи удаляются с начала. Число
+    "активны сегодня" - просто размер словаря; при запуске он заполняется
+    из базы, так что после перезапуска счетчик остается точным.
+
+    От базы данных требуются методы apply_activity_batch(rows) и
+    get_active_today().
+    """
+
+    def __init__(self, db: Any, flush_interval: float = 60.0, now_window: float = 300.0,
+                 clock=time.time):
+        """
+        Args:
+            db: Менеджер базы данных
+            flush_interval: Интервал записи в базу в секундах
+            now_window: Окно для счетчика "активны сейчас" в секундах
+            clock: Источник времени (секунды Unix)
+        """
+        self.db = db
+        self.flush_interval = flush_interval
+        self.now_window = now_window
+        self.clock = clock
+        self.logger = logging.getLogger(__name__)
+
+        self._last_seen: Dict[str, float] = {}
+        self._pending: Dict[str, float] = {}
+        self._day_start = _start_of_day(clock())
+
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        """Количество отметок, еще не записанных в базу"""
+        return len(self._pending)
+
+    def touch(self, telegram_id: Any) -> None:
+        """
+        Отметка активности пользователя (без обращения к базе данных)
+
+        Args:
+            telegram_id: ID пользователя в Telegram
+        """
+        key = str(telegram_id)
+        now = self.clock()
+        last_seen = self._last_seen
+        last_seen.pop(key, None)
+        last_seen[key] = now
+        self._pending[key] = now
+
+    def _roll_day(self, now: float) -> None:
+        """Удаление отметок предыдущих суток"""
+        day_start = _start_of_day(now)
+        if day_start == self._day_start:
+            return
+        self._day_start = day_start
+
+        last_seen = self._last_seen
+        stale = []
+        for key, seen in last_seen.items():
+            if seen >= day_start:
+                break
+            stale.append(key)
+        for key in stale:
+            del last_seen[key]
+
+    def active_today(self) -> int:
+        """Количество пользователей, активных с начала суток"""
+        self._roll_day(self.clock())
+        return len(self._last_seen)
+
+    def active_now(self, window: Optional[float] = None) -> int:
+        """
+        Количество пользователей, активных за последние window секунд
+
+        Args:
+            window: Окно в секундах (по умолчанию now_window)
+        """
+        cutoff = self.clock() - (window or self.now_window)
+        count = 0
+        for key in reversed(self._last_seen):
+            if self._last_seen[key] < cutoff:
+                break
+            count += 1
+        return count
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики активности для экранов статистики"""
+        return {
+            'active_now': self.active_now(),
+            'active_today': self.active_today()
+        }
+
+    async def load_today(self) -> int:
+        """
+        Заполнение отметок из базы (пользователи, активные сегодня)
+
+        Returns:
+            int: Количество загруженных пользователей
+        """
+        rows = await self.db.get_active_today()
+        seeded = {}
+        for telegram_id, seen_at in rows:
+            key = str(telegram_id)
+            if key not in self._last_seen:
+                seeded[key] = seen_at.timestamp()
+
+        # Загруженные отметки старше любых отметок текущего запуска
+        merged = dict(sorted(seeded.items(), key=lambda item: item[1]))
+        merged.update(self._last_seen)
+        self._last_seen = merged
+        return len(seeded)
+
+    async def flush(self) -> int:
+        """
+        Запись накопленных отметок в базу данных
+
+        Returns:
+            int: Количество обновленных пользователей
+        """
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+
+            batch, self._pending = self._pending, {}
+            rows: List[Tuple[str, datetime]] = [
+                (key, datetime.fromtimestamp(seen, timezone.utc))
+                for key, seen in sorted(batch.items())
+            ]
+            try:
+                await self.db.apply_activity_batch(rows)
+            except BaseException as e:
+                # Возвращаем отметки, не затирая более свежие
+                for key, seen in batch.items():
+                    if self._pending.get(key, 0.0) < seen:
+                        self._pending[key] = seen
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                self.logger.error(f"❌ Ошибка записи активности ({len(batch)} пользователей): {e}")
+                raise
+
+            self.logger.debug(f"🕐 Записана активность пользователей: {len(rows)}")
+            return len(rows)
+
+    async def _run(self) -> None:
+        """Фоновый цикл записи"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self._roll_day(self.clock())
+            try:
+                await self.flush()
+            except Exception:
+                # Ошибка уже залогирована, отметки остались в памяти
+                pass
+
+    async def start(self) -> None:
+        """Загрузка сегодняшней активности и запуск фоновой записи"""
+        if self._task is not None:
+            return
+        try:
+            loaded = await self.load_today()
+            self.logger.info(f"🕐 Загружено активных сегодня: {loaded}")
+        except Exception as e:
+            self.logger.warning(f"⚠️ Не удалось загрузить активность за сегодня: {e}")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Остановка фоновой записи и финальный сброс"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        try:
+            await self.flush()
+        except Exception:
+            self.logger.error(f"❌ При остановке не записана активность: {self.pending}")
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Неблокирующий доступ к SQLite для asyncio
+Одно долгоживущее соединение принадлежит выделенному потоку,
+запросы передаются ему через очередь, результат возвращается в Future
+
+Копия Project41/src/async_sqlite.py: правки вносятся туда, затем
+python Project41/sync_vendored.py --write
+
+Автор: Разработано для системы RUУчебник
+Версия: 1.0.0
+"""
+
+import asyncio
+import logging
+import queue
+import sqlite3
+import threading
+from typing import Any, Callable, Iterable, List, Optional, Sequence
+
+
+class AsyncSQLiteEngine:
+    """
+    Асинхронный движок SQLite с потоком-исполнителем
+
+    Соединение открывается один раз в режиме WAL, поэтому подготовленные
+    выражения кешируются модулем sqlite3 (cached_statements) и не
+    компилируются заново на каждый запрос. Цикл событий не блокируется:
+    корутина лишь ставит задачу в очередь и ожидает Future.
+    """
+
+    def __init__(self, db_path: str, cached_statements: int = 256,
+                 busy_timeout_ms: int = 5000):
+        self.db_path = db_path
+        self.cached_statements = cached_statements
+        self.busy_timeout_ms = busy_timeout_ms
+        self.logger = logging.getLogger(__name__)
+        self._jobs: "queue.SimpleQueue[Optional[tuple]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_running(self) -> bool:
+        """Запущен ли поток-исполнитель"""
+        return self._thread is not None and self._thread.is_alive()
+
+    async def start(self):
+        """Запуск потока и открытие соединения"""
+        if self.is_running:
+            return
+
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        self._thread = threading.Thread(
+            target=self._worker,
+            args=(loop, ready),
+            name="sqlite-worker",
+            daemon=True
+        )
+        self._thread.start()
+        await ready
+
+    async def close(self):
+        """Остановка потока после выполнения всех поставленных задач"""
+        if not self.is_running:
+            return
+        self._jobs.put(None)
+        await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+        self._thread = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Открытие соединения с настройками для конкурентной работы"""
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            isolation_level=None,  # autocommit, транзакции - явно через BEGIN
+            cached_statements=self.cached_statements
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        return conn
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result: Any = None,
+                 error: Optional[BaseException] = None):
+        """Передача результата в Future (вызывается в потоке цикла событий)"""
+        if future.cancelled():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _worker(self, loop: asyncio.AbstractEventLoop, ready: asyncio.Future):
+        """Основной цикл потока-исполнителя"""
+        try:
+            conn = self._connect()
+        except Exception as e:
+            loop.call_soon_threadsafe(self._resolve, ready, None, e)
+            return
+        loop.call_soon_threadsafe(self._resolve, ready, None)
+
+        try:
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    break
+                func, future, job_loop = job
+                try:
+                    result = func(conn)
+                except Exception as e:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    job_loop.call_soon_threadsafe(self._resolve, future, None, e)
+                else:
+                    job_loop.call_soon_threadsafe(self._resolve, future, result)
+        finally:
+            conn.close()
+
+    async def run(self, func: Callable[[sqlite3.Connection], Any]) -> Any:
+        """
+        Выполнение функции с соединением в потоке-исполнителе
+
+        Args:
+            func: Функция, принимающая sqlite3.Connection
+
+        Returns:
+            Any: Результат функции
+        """
+        if not self.is_running:
+            raise RuntimeError("AsyncSQLiteEngine не запущен")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._jobs.put((func, future, loop))
+        return await future
+
+    async def transaction(self, func: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Выполнение функции внутри одной транзакции (BEGIN ... COMMIT)"""
+        def _in_transaction(conn: sqlite3.Connection) -> Any:
+            conn.execute("BEGIN IMMEDIATE")
+            result = func(conn)
+            conn.execute("COMMIT")
+            return result
+
+        return await self.run(_in_transaction)
+
+    async def execute(self, sql: str, params: Sequence[Any] = ()) -> int:
+        """Выполнение запроса на изменение, возвращает число затронутых строк"""
+        return await self.run(lambda conn: conn.execute(sql, params).rowcount)
+
+    async def executemany(self, sql: str, seq_of_params: Iterable[Sequence[Any]]) -> int:
+        """Пакетное выполнение запроса в одной транзакции"""
+        rows = list(seq_of_params)
+        return await self.transaction(lambda conn: conn.executemany(sql, rows).rowcount)
+
+    async def executescript(self, script: str):
+        """Выполнение SQL-скрипта (создание схемы и т.п.)"""
+        await self.run(lambda conn: conn.executescript(script))
+
+    async def fetchone(self, sql: str, params: Sequence[Any] = ()) -> Optional[sqlite3.Row]:
+        """Получение одной строки"""
+        return await self.run(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List[sqlite3.Row]:
+        """Получение всех строк"""
+        return await self.run(lambda conn: conn.execute(sql, params).fetchall())
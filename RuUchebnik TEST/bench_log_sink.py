@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк записи журналов RUУчебник
+Сравнивает прежний путь (INSERT на каждую запись в обработчике) с LogSink
+(очередь + COPY пачками): устойчивая скорость вставки и время, которое
+обработчик ждет записи журнала
+
+Запуск: DATABASE_URL=postgres://... python bench_log_sink.py [--rows 50000] [--concurrency 50]
+Таблица bench_logs создается и удаляется скриптом.
+
+Автор: Разработано для системы RUУчебник
+Версия: 1.0.0
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+import asyncpg
+
+from log_sink import LogSink, json_columns, OVERFLOW_BLOCK
+
+TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS bench_logs (
+    id BIGSERIAL PRIMARY KEY,
+    type TEXT NOT NULL,
+    user_id VARCHAR,
+    action TEXT NOT NULL,
+    details JSONB,
+    timestamp TIMESTAMP DEFAULT NOW(),
+    ip_address TEXT
+)
+"""
+
+COLUMNS = ("type", "user_id", "action", "details", "ip_address")
+
+
+def make_record(i: int):
+    """Запись, похожая на журнал скачивания"""
+    return ("user_action", str(100000 + i % 5000), "textbook_downloaded",
+            {"textbook_id": str(i % 700), "textbook_title": "Алгебра 7 класс", "source": "bench"},
+            None)
+
+
+async def run_per_row(pool, rows: int, concurrency: int):
+    """Прежний путь: каждый обработчик ждет свой INSERT"""
+    waits = []
+    counter = iter(range(rows))
+
+    async def handler():
+        for i in counter:
+            record = make_record(i)
+            started = time.perf_counter()
+            async with pool.acquire() as conn:
+                await conn.execute(
+                    "INSERT INTO bench_logs (type, user_id, action, details, ip_address) "
+                    "VALUES ($1, $2, $3, $4, $5)",
+                    record[0], record[1], record[2], json.dumps(record[3]), record[4]
+                )
+            waits.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(handler() for _ in range(concurrency)))
+    return time.perf_counter() - started, waits
+
+
+async def run_sink(pool, rows: int, concurrency: int, batch_size: int, max_queue: int):
+    """LogSink: обработчик только ставит запись в очередь, запись - COPY пачками"""
+    sink = LogSink(pool, "bench_logs", COLUMNS, max_queue=max_queue, batch_size=batch_size,
+                   flush_interval=0.2, overflow=OVERFLOW_BLOCK, prepare=json_columns(3))
+    sink.start()
+    waits = []
+    counter = iter(range(rows))
+
+    async def handler():
+        for i in counter:
+            started = time.perf_counter()
+            await sink.put(make_record(i))
+            waits.append(time.perf_counter() - started)
+            # Уступаем цикл событий, как настоящий обработчик между запросами
+            await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(handler() for _ in range(concurrency)))
+    await sink.stop()  # скорость считается до полной записи очереди
+    return time.perf_counter() - started, waits, sink.stats
+
+
+def report(name: str, rows: int, elapsed: float, waits):
+    waits_ms = sorted(w * 1000 for w in waits)
+    p99 = waits_ms[int(len(waits_ms) * 0.99) - 1]
+    print(f"{name:<10} {rows / elapsed:>12.0f} {statistics.mean(waits_ms):>14.3f} {p99:>12.3f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--concurrency", type=int, default=50, help="Одновременных обработчиков")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--max-queue", type=int, default=10_000)
+    args = parser.parse_args()
+
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        print("Укажите DATABASE_URL")
+        sys.exit(1)
+
+    pool = await asyncpg.create_pool(database_url, min_size=2, max_size=10)
+    try:
+        async with pool.acquire() as conn:
+            await conn.execute(TABLE_SQL)
+            await conn.execute("TRUNCATE bench_logs")
+
+        print(f"Записей: {args.rows}, обработчиков: {args.concurrency}, пул: 10 соединений")
+        print(f"{'путь':<10} {'строк/с':>12} {'ожидание, мс':>14} {'p99, мс':>12}")
+
+        elapsed, waits = await run_per_row(pool, args.rows, args.concurrency)
+        report("INSERT", args.rows, elapsed, waits)
+
+        async with pool.acquire() as conn:
+            await conn.execute("TRUNCATE bench_logs")
+
+        elapsed, waits, stats = await run_sink(pool, args.rows, args.concurrency,
+                                               args.batch_size, args.max_queue)
+        report("LogSink", args.rows, elapsed, waits)
+
+        async with pool.acquire() as conn:
+            written = await conn.fetchval("SELECT COUNT(*) FROM bench_logs")
+        print(f"LogSink записал {written} строк, отброшено {stats['dropped']}, "
+              f"ошибок пачек {stats['failed_batches']}")
+    finally:
+        async with pool.acquire() as conn:
+            await conn.execute("DROP TABLE IF EXISTS bench_logs")
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
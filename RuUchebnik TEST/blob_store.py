@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Хранилище файлов учебников по содержимому для RUУчебник
+Файл лежит под своим sha256: <корень>/ab/cd/abcd..., одинаковые загрузки
+занимают на диске один файл, а целостность проверяется по имени
+
+Проверка хранилища: python blob_store.py verify [--root DIR]
+Перенос старых записей каталога: DATABASE_URL=postgres://... python blob_store.py adopt
+
+Автор: Разработано для системы RUУчебник
+Версия: 1.0.0
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import mmap
+import os
+import shutil
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Файлы меньше этого размера читаются обычным read (mmap не окупается)
+MMAP_THRESHOLD = 1024 * 1024
+
+# Буфер чтения, если mmap недоступен
+HASH_BUFFER_SIZE = 1024 * 1024
+
+# Кеш результатов проверки: размер и mtime каждого проверенного файла
+VERIFY_CACHE_FILE = ".verify_cache.json"
+
+logger = logging.getLogger(__name__)
+
+
+def hash_file(path: str, algorithm: str = "sha256") -> Tuple[str, int]:
+    """
+    Хеш и размер файла
+
+    Большие файлы хешируются через mmap - без копирования данных
+    в буферы Python, остальные читаются целиком или блоками по 1 МБ.
+
+    Returns:
+        Tuple[str, int]: Хеш в шестнадцатеричном виде и размер в байтах
+    """
+    digest = hashlib.new(algorithm)
+    with open(path, "rb", buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    digest.update(mapped)
+                return digest.hexdigest(), size
+            except (OSError, ValueError):
+                f.seek(0)  # mmap недоступен (сетевой диск и т.п.) - читаем блоками
+
+        size = 0
+        buffer = bytearray(HASH_BUFFER_SIZE)
+        view = memoryview(buffer)
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            digest.update(view[:read])
+            size += read
+    return digest.hexdigest(), size
+
+
+class BlobStore:
+    """
+    Хранилище файлов, адресуемых по sha256
+
+    Путь файла определяется только содержимым, поэтому повторная
+    загрузка того же файла ничего не пишет на диск. Запись идет
+    во временный файл с последующим os.replace: в хранилище не бывает
+    полузаписанных файлов под настоящим именем.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    def blob_path(self, file_hash: str) -> str:
+        """Путь файла с данным sha256"""
+        return os.path.join(self.root, file_hash[:2], file_hash[2:4], file_hash)
+
+    def contains(self, file_hash: str) -> bool:
+        return os.path.exists(self.blob_path(file_hash))
+
+    def put_file(self, source: str, file_hash: Optional[str] = None) -> Tuple[str, int, str]:
+        """
+        Помещение файла в хранилище
+
+        Args:
+            source: Исходный файл
+            file_hash: Уже посчитанный sha256 (иначе считается здесь)
+
+        Returns:
+            Tuple[str, int, str]: sha256, размер и путь файла в хранилище
+        """
+        if file_hash is None:
+            file_hash, size = hash_file(source)
+        else:
+            size = os.path.getsize(source)
+
+        dest = self.blob_path(file_hash)
+        if not os.path.exists(dest):
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            tmp = f"{dest}.{os.getpid()}.part"
+            shutil.copyfile(source, tmp)
+            os.replace(tmp, dest)
+        return file_hash, size, dest
+
+    def iter_blobs(self):
+        """Все файлы хранилища: (sha256 из имени, путь)"""
+        for directory, dirnames, filenames in os.walk(self.root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if len(filename) == 64 and not filename.endswith(".part"):
+                    yield filename, os.path.join(directory, filename)
+
+    def verify(self, cache_path: Optional[str] = None, full: bool = False) -> Dict[str, object]:
+        """
+        Проверка целостности хранилища
+
+        Хешируются только файлы, у которых размер или mtime изменились
+        с прошлой успешной проверки (сведения хранятся в cache_path);
+        full=True перепроверяет все файлы.
+
+        Returns:
+            Dict: checked, skipped, bytes_hashed, corrupted (список путей)
+        """
+        cache_path = cache_path or os.path.join(self.root, VERIFY_CACHE_FILE)
+        cache: Dict[str, List[int]] = {}
+        if not full and os.path.exists(cache_path):
+            try:
+                with open(cache_path, "r", encoding="utf-8") as f:
+                    cache = json.load(f)
+            except ValueError:
+                logger.warning(f"⚠️ Кеш проверки поврежден, проверяются все файлы: {cache_path}")
+
+        fresh: Dict[str, List[int]] = {}
+        corrupted: List[str] = []
+        checked = skipped = bytes_hashed = 0
+
+        for file_hash, path in self.iter_blobs():
+            stat = os.stat(path)
+            signature = [stat.st_size, stat.st_mtime_ns]
+            if cache.get(file_hash) == signature:
+                fresh[file_hash] = signature
+                skipped += 1
+                continue
+
+            actual, size = hash_file(path)
+            checked += 1
+            bytes_hashed += size
+            if actual == file_hash:
+                fresh[file_hash] = signature
+            else:
+                corrupted.append(path)
+                logger.error(f"❌ Содержимое не совпадает с хешем: {path}")
+
+        tmp = cache_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(fresh, f)
+        os.replace(tmp, cache_path)
+
+        return {
+            "checked": checked,
+            "skipped": skipped,
+            "bytes_hashed": bytes_hashed,
+            "corrupted": corrupted
+        }
+
+
+async def adopt_catalog(store: BlobStore, database_url: str) -> Tuple[int, int]:
+    """
+    Перенос файлов старых записей каталога (без file_hash) в хранилище
+
+    Запись, чье содержимое уже есть в каталоге под другой строкой
+    (file_hash уникален), не меняется и остается на прежнем месте.
+
+    Returns:
+        Tuple[int, int]: Перенесено записей, пропущено
+    """
+    import asyncpg
+
+    conn = await asyncpg.connect(database_url)
+    adopted = skipped = 0
+    try:
+        rows = await conn.fetch("SELECT id, file_path FROM textbooks WHERE file_hash IS NULL")
+        for row in rows:
+            if not os.path.exists(row["file_path"]):
+                logger.warning(f"⚠️ Файл не найден: {row['file_path']}")
+                skipped += 1
+                continue
+            file_hash, size, dest = store.put_file(row["file_path"])
+            updated = await conn.execute("""
+                UPDATE textbooks SET file_hash = $2, file_size = $3, file_path = $4
+                WHERE id = $1
+                  AND NOT EXISTS (SELECT 1 FROM textbooks WHERE file_hash = $2)
+            """, row["id"], file_hash, size, dest)
+            if updated.endswith(" 1"):
+                adopted += 1
+            else:
+                skipped += 1
+    finally:
+        await conn.close()
+    return adopted, skipped
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Хранилище учебников по содержимому")
+    parser.add_argument("command", choices=["verify", "adopt"])
+    parser.add_argument("--root", help="Корень хранилища (по умолчанию TEXTBOOKS_DIR)")
+    parser.add_argument("--cache", help=f"Файл кеша проверки (по умолчанию <корень>/{VERIFY_CACHE_FILE})")
+    parser.add_argument("--full", action="store_true", help="Перепроверить все файлы")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    root = args.root
+    if root is None:
+        from config2 import TEXTBOOKS_DIR
+        root = TEXTBOOKS_DIR
+    store = BlobStore(root)
+
+    if args.command == "verify":
+        started = time.perf_counter()
+        result = store.verify(args.cache, full=args.full)
+        elapsed = time.perf_counter() - started
+        print(f"🔍 Проверено {result['checked']} файлов "
+              f"({result['bytes_hashed'] / 1024 / 1024:.1f} МБ), без изменений {result['skipped']}, "
+              f"за {elapsed:.1f} с")
+        if result["corrupted"]:
+            print(f"❌ Повреждено файлов: {len(result['corrupted'])}")
+            sys.exit(1)
+        print("✅ Хранилище в порядке")
+    else:
+        database_url = os.getenv("DATABASE_URL")
+        if not database_url:
+            print("Укажите DATABASE_URL")
+            sys.exit(1)
+        adopted, skipped = asyncio.run(adopt_catalog(store, database_url))
+        print(f"📦 Перенесено записей: {adopted}, пропущено: {skipped}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,461 @@
+# -*- coding: utf-8 -*-
+"""
+Рассылки для Telegram бота RUУчебник
+Параллельная отправка с общим ограничением скорости, учетом RetryAfter
+и сохранением прогресса по каждому получателю. Фото, документы и альбомы
+загружаются в Telegram один раз, получателям уходит только file_id
+
+Автор: Разработано для системы RUУчебник
+Версия: 1.0.0
+"""
+
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from telegram import InputMediaDocument, InputMediaPhoto, InputMediaVideo
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+# Общий лимит Telegram на рассылку - около 30 сообщений в секунду
+BROADCAST_RATE = 28.0
+BROADCAST_WORKERS = 20
+
+# Результаты отправки записываются в базу пачками
+PROGRESS_BATCH_SIZE = 500
+PROGRESS_FLUSH_INTERVAL = 1.0
+
+# Отчет администратору обновляется не чаще (редактирование сообщения тоже лимитируется)
+REPORT_INTERVAL = 5.0
+
+# Повторы при сетевых ошибках
+MAX_ATTEMPTS = 3
+
+# Ошибки BadRequest, после которых получателю писать бесполезно
+_GONE_ERRORS = ("chat not found", "user is deactivated", "peer_id_invalid")
+
+# Статусы получателя
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+STATUS_BLOCKED = "blocked"
+
+# Вложения рассылки: payload = {"media": [{"type": "photo", "file_id": "..."}, ...]}
+_INPUT_MEDIA = {
+    "photo": InputMediaPhoto,
+    "document": InputMediaDocument,
+    "video": InputMediaVideo,
+}
+MEDIA_TYPES = tuple(_INPUT_MEDIA)
+
+# Не больше 10 вложений в альбоме (ограничение Telegram)
+MAX_ALBUM_SIZE = 10
+
+
+def _seconds(value: Any) -> float:
+    """retry_after в секундах (в новых версиях библиотеки - timedelta)"""
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+
+class _TemplateFields(dict):
+    """Поля шаблона; неизвестное поле остается в тексте как есть"""
+
+    def __missing__(self, key: str) -> str:
+        return "{" + key + "}"
+
+
+def render_template(template: Optional[str], recipient: Dict[str, Any]) -> Optional[str]:
+    """
+    Подстановка данных получателя в текст или подпись
+
+    Доступны поля {first_name}, {last_name}, {username}, {telegram_id}
+    и {name} (имя или username). Текст с ошибкой в шаблоне
+    отправляется без подстановки.
+    """
+    if not template or "{" not in template:
+        return template
+    fields = _TemplateFields({key: value or "" for key, value in recipient.items()})
+    fields.setdefault("name", recipient.get("first_name") or recipient.get("username") or "")
+    try:
+        return template.format_map(fields)
+    except (ValueError, IndexError, KeyError, AttributeError):
+        return template
+
+
+def media_payload(items: List[Tuple[str, str]]) -> Dict[str, Any]:
+    """payload рассылки из пар (тип, file_id)"""
+    if len(items) > MAX_ALBUM_SIZE:
+        raise ValueError(f"В альбоме не больше {MAX_ALBUM_SIZE} вложений")
+    for media_type, _ in items:
+        if media_type not in _INPUT_MEDIA:
+            raise ValueError(f"Неподдерживаемый тип вложения: {media_type}")
+    return {"media": [{"type": media_type, "file_id": file_id} for media_type, file_id in items]}
+
+
+class AsyncRateLimiter:
+    """
+    Общее "ведро с токенами" для всех отправителей рассылки
+
+    Токены пополняются со скоростью rate в секунду до capacity.
+    pause_for() останавливает всех отправителей, когда Telegram
+    ответил RetryAfter: ограничение глобальное, и продолжать
+    отправку до истечения паузы бессмысленно.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+
+    async def acquire(self, cost: float = 1) -> None:
+        """Ожидание права на cost сообщений (альбом считается по числу вложений)"""
+        cost = min(cost, self.capacity)
+        while True:
+            now = self.clock()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= cost:
+                self._tokens -= cost
+                return
+            await asyncio.sleep((cost - self._tokens) / self.rate)
+
+    def pause_for(self, seconds: float) -> None:
+        """Пауза для всех отправителей (RetryAfter)"""
+        self._paused_until = max(self._paused_until, self.clock() + seconds)
+        self._tokens = 0.0
+        # Токены копятся только после окончания паузы
+        self._updated = self._paused_until
+
+
+class BroadcastRun:
+    """Выполнение одной рассылки: отправители, запись прогресса и счетчики"""
+
+    def __init__(self, engine: "BroadcastEngine", broadcast: Dict[str, Any]):
+        self.engine = engine
+        self.broadcast_id = broadcast["id"]
+        self.message = broadcast["message"]
+        self.media = (broadcast.get("payload") or {}).get("media") or []
+        if not self.media and broadcast.get("image_url"):
+            # Рассылки до появления payload: картинка по ссылке или file_id
+            self.media = [{"type": "photo", "file_id": broadcast["image_url"]}]
+        # Альбом расходует лимит по числу вложений
+        self.cost = max(len(self.media), 1)
+        self.total = broadcast["total"]
+        self.done_before = broadcast["sent_to"] + broadcast["failed"] + broadcast["blocked"]
+        self.counts = {STATUS_SENT: 0, STATUS_FAILED: 0, STATUS_BLOCKED: 0}
+        self.counts_before = {
+            STATUS_SENT: broadcast["sent_to"],
+            STATUS_FAILED: broadcast["failed"],
+            STATUS_BLOCKED: broadcast["blocked"],
+        }
+        self.retries = 0
+        self.started = time.monotonic()
+        self.status = "running"
+
+        self._results: List[Tuple[str, str, Optional[str]]] = []
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=engine.workers * 4)
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def processed(self) -> int:
+        return sum(self.counts.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики для отчета администратору"""
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        rate = self.processed / elapsed
+        done = self.done_before + self.processed
+        remaining = max(self.total - done, 0)
+        return {
+            "broadcast_id": self.broadcast_id,
+            "status": self.status,
+            "total": self.total,
+            "done": done,
+            "sent": self.counts_before[STATUS_SENT] + self.counts[STATUS_SENT],
+            "failed": self.counts_before[STATUS_FAILED] + self.counts[STATUS_FAILED],
+            "blocked": self.counts_before[STATUS_BLOCKED] + self.counts[STATUS_BLOCKED],
+            "retries": self.retries,
+            "rate": rate,
+            "eta": remaining / rate if rate > 0 else None,
+            "elapsed": elapsed,
+        }
+
+    async def send(self, recipient: Dict[str, Any]) -> None:
+        """
+        Отправка сообщения одному получателю
+
+        Вложения передаются по file_id: файл уже лежит на серверах
+        Telegram, поэтому на каждого получателя уходит лишь короткий
+        запрос. Подпись альбома ставится на первое вложение.
+        """
+        bot = self.engine.bot
+        chat_id = recipient["telegram_id"]
+        text = render_template(self.message, recipient)
+
+        if not self.media:
+            await bot.send_message(chat_id=chat_id, text=text)
+        elif len(self.media) == 1:
+            item = self.media[0]
+            send_media = getattr(bot, f"send_{item['type']}")
+            await send_media(chat_id=chat_id, caption=text or None, **{item["type"]: item["file_id"]})
+        else:
+            album = [
+                _INPUT_MEDIA[item["type"]](item["file_id"], caption=(text or None) if index == 0 else None)
+                for index, item in enumerate(self.media)
+            ]
+            await bot.send_media_group(chat_id=chat_id, media=album)
+
+    async def _deliver(self, recipient: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+        """Отправка с повторами; возвращает (статус, ошибка)"""
+        limiter = self.engine.limiter
+        attempts = 0
+        while True:
+            await limiter.acquire(self.cost)
+            try:
+                await self.send(recipient)
+                return STATUS_SENT, None
+            except RetryAfter as e:
+                # Лимит превышен: пауза для всех и повтор этого же получателя
+                self.retries += 1
+                limiter.pause_for(_seconds(e.retry_after))
+            except Forbidden as e:
+                return STATUS_BLOCKED, str(e)
+            except BadRequest as e:
+                if any(text in str(e).lower() for text in _GONE_ERRORS):
+                    return STATUS_BLOCKED, str(e)
+                return STATUS_FAILED, str(e)
+            except (TimedOut, NetworkError) as e:
+                attempts += 1
+                self.retries += 1
+                if attempts >= MAX_ATTEMPTS:
+                    return STATUS_FAILED, str(e)
+                await asyncio.sleep(attempts)
+            except Exception as e:
+                return STATUS_FAILED, str(e)
+
+    async def _worker(self) -> None:
+        while True:
+            recipient = await self._queue.get()
+            try:
+                if recipient is None:
+                    return
+                status, error = await self._deliver(recipient)
+                self.counts[status] += 1
+                self._results.append((recipient["telegram_id"], status, error))
+                if len(self._results) >= PROGRESS_BATCH_SIZE:
+                    try:
+                        await self._flush()
+                    except Exception as e:
+                        # Результаты остались в буфере; отправитель продолжает работу
+                        self.engine.logger.error(f"❌ Ошибка записи прогресса рассылки {self.broadcast_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _produce(self) -> None:
+        """Чтение ожидающих получателей страницами по курсору"""
+        db = self.engine.db
+        after = None
+        while True:
+            page = await db.get_pending_recipients(self.broadcast_id, after, self.engine.page_size)
+            if not page:
+                return
+            for recipient in page:
+                await self._queue.put(recipient)
+            after = page[-1]["telegram_id"]
+
+    async def _flush(self) -> None:
+        """Запись накопленных результатов"""
+        if not self._results:
+            return
+        batch, self._results = self._results, []
+        try:
+            await self.engine.db.save_broadcast_progress(self.broadcast_id, batch)
+        except BaseException:
+            # Вернем результаты: запишутся со следующей пачкой
+            self._results[:0] = batch
+            raise
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(PROGRESS_FLUSH_INTERVAL)
+            try:
+                await self._flush()
+            except Exception as e:
+                self.engine.logger.error(f"❌ Ошибка записи прогресса рассылки {self.broadcast_id}: {e}")
+
+    async def _report_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(REPORT_INTERVAL)
+            await self.engine.report(self.stats())
+
+    async def run(self) -> None:
+        """Полный цикл рассылки до завершения, паузы или отмены"""
+        engine = self.engine
+        workers = [asyncio.create_task(self._worker()) for _ in range(engine.workers)]
+        flusher = asyncio.create_task(self._flush_periodically())
+        reporter = asyncio.create_task(self._report_periodically())
+        try:
+            await self._produce()
+            for _ in workers:
+                await self._queue.put(None)
+            await asyncio.gather(*workers)
+            self.status = "done"
+        finally:
+            # Пауза, остановка или ошибка чтения получателей: недоставленные
+            # получатели остаются pending
+            for task in (*workers, flusher, reporter):
+                task.cancel()
+            await asyncio.gather(*workers, flusher, reporter, return_exceptions=True)
+            try:
+                await self._flush()
+            except Exception as e:
+                engine.logger.error(f"❌ Не записан прогресс рассылки {self.broadcast_id}: {e}")
+            await engine.db.set_broadcast_status(self.broadcast_id, self.status)
+            await engine.report(self.stats())
+
+
+class BroadcastEngine:
+    """
+    Движок рассылок
+
+    Рассылка выполняется пулом из workers отправителей под общим
+    ограничением скорости (rate сообщений в секунду). RetryAfter
+    приостанавливает всех отправителей на указанное Telegram время,
+    получатель отправляется повторно. Пользователи, заблокировавшие
+    бота, помечаются в базе и не попадают в следующие рассылки.
+
+    Статус каждого получателя хранится в базе (broadcast_recipients),
+    результаты записываются пачками. Пауза или перезапуск процесса
+    не теряют прогресс: продолжение отправляет только тем, кто еще
+    в статусе pending. Результаты последней секунды перед аварийной
+    остановкой могут быть не записаны - такие получатели получат
+    сообщение повторно (доставка "хотя бы один раз").
+
+    От базы данных требуются методы create_broadcast, get_broadcast,
+    get_unfinished_broadcasts, get_pending_recipients,
+    save_broadcast_progress и set_broadcast_status.
+    """
+
+    def __init__(self, bot, db, rate: float = BROADCAST_RATE, workers: int = BROADCAST_WORKERS,
+                 page_size: int = 1000,
+                 on_progress: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None):
+        """
+        Args:
+            bot: Бот python-telegram-bot
+            db: Менеджер базы данных
+            rate: Сообщений в секунду на все рассылки вместе
+            workers: Одновременных отправителей
+            page_size: Получателей, читаемых из базы за раз
+            on_progress: Корутина, получающая счетчики рассылки
+        """
+        self.bot = bot
+        self.db = db
+        self.workers = workers
+        self.page_size = page_size
+        self.on_progress = on_progress
+        self.limiter = AsyncRateLimiter(rate)
+        self.logger = logging.getLogger(__name__)
+        self.runs: Dict[str, BroadcastRun] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def upload_media(self, chat_id: int, path: str, media_type: str = "document") -> str:
+        """
+        Однократная загрузка файла для рассылки
+
+        Файл отправляется в чат chat_id (обычно чат администратора) без
+        звука, и возвращается его file_id для media_payload().
+        """
+        if media_type not in _INPUT_MEDIA:
+            raise ValueError(f"Неподдерживаемый тип вложения: {media_type}")
+        send_media = getattr(self.bot, f"send_{media_type}")
+        with open(path, "rb") as f:
+            message = await send_media(chat_id=chat_id, disable_notification=True, **{media_type: f})
+        attachment = message.photo[-1] if media_type == "photo" else getattr(message, media_type)
+        self.logger.info(f"📎 Вложение загружено для рассылки: {path}")
+        return attachment.file_id
+
+    def _make_run(self, broadcast: Dict[str, Any]) -> BroadcastRun:
+        return BroadcastRun(self, broadcast)
+
+    async def report(self, stats: Dict[str, Any]) -> None:
+        if self.on_progress is None:
+            return
+        try:
+            await self.on_progress(stats)
+        except Exception as e:
+            self.logger.warning(f"⚠️ Не удалось обновить отчет о рассылке: {e}")
+
+    async def start(self, broadcast_id: str) -> BroadcastRun:
+        """Запуск (или продолжение) рассылки в фоне"""
+        if broadcast_id in self._tasks:
+            return self.runs[broadcast_id]
+
+        broadcast = await self.db.get_broadcast(broadcast_id)
+        if broadcast is None:
+            raise ValueError(f"Рассылка не найдена: {broadcast_id}")
+        if broadcast["status"] != "running":
+            await self.db.set_broadcast_status(broadcast_id, "running")
+
+        run = self._make_run(broadcast)
+        self.runs[broadcast_id] = run
+        task = asyncio.create_task(run.run())
+        self._tasks[broadcast_id] = task
+        task.add_done_callback(lambda _: self._finished(broadcast_id))
+        self.logger.info(f"📢 Рассылка {broadcast_id}: {broadcast['total']} получателей, "
+                         f"уже обработано {run.done_before}")
+        return run
+
+    def _finished(self, broadcast_id: str) -> None:
+        task = self._tasks.pop(broadcast_id, None)
+        if task is not None and not task.cancelled() and task.exception():
+            self.logger.error(f"❌ Рассылка {broadcast_id} прервана: {task.exception()}")
+
+    async def _stop(self, broadcast_id: str, status: str) -> bool:
+        task = self._tasks.get(broadcast_id)
+        if task is None:
+            return False
+        self.runs[broadcast_id].status = status
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return True
+
+    async def pause(self, broadcast_id: str) -> bool:
+        """Пауза: оставшиеся получатели ждут продолжения"""
+        return await self._stop(broadcast_id, "paused")
+
+    async def cancel(self, broadcast_id: str) -> bool:
+        """Отмена рассылки"""
+        if await self._stop(broadcast_id, "cancelled"):
+            return True
+        await self.db.set_broadcast_status(broadcast_id, "cancelled")
+        return False
+
+    async def resume_unfinished(self) -> int:
+        """Продолжение рассылок, прерванных остановкой процесса"""
+        broadcasts = await self.db.get_unfinished_broadcasts()
+        for broadcast in broadcasts:
+            await self.start(broadcast["id"])
+        return len(broadcasts)
+
+    async def shutdown(self) -> None:
+        """
+        Остановка всех рассылок с сохранением прогресса
+
+        Статус остается running, поэтому при следующем запуске
+        рассылки продолжатся автоматически.
+        """
+        for broadcast_id in list(self._tasks):
+            await self._stop(broadcast_id, "running")
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Массовый импорт учебников RUУчебник из дерева каталогов
+Файлы хешируются параллельно в пуле процессов, дубликаты по содержимому
+пропускаются, файлы кладутся в хранилище по sha256 (BlobStore), записи
+каталога добавляются пачками в одной транзакции
+
+Раскладка каталогов: <корень>/<класс>/<предмет>/<автор>/<название>.pdf
+Автора можно не выделять в каталог: <класс>/<предмет>/<Автор - Название>.pdf
+Класс - каталог с номером 1-11 ("5", "5 класс"), предмет - код или
+название из SUBJECTS ("mathematics", "Математика").
+
+Запуск: DATABASE_URL=postgres://... python bulk_import.py /path/to/library [--workers 8]
+Прерванный импорт продолжается с того же места при повторном запуске.
+
+Автор: Разработано для системы RUУчебник
+Версия: 1.0.0
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple
+
+import asyncpg
+
+from blob_store import BlobStore, hash_file
+from config2 import ADMIN_ID, DATABASE_URL, SUBJECTS, TEXTBOOKS_DIR
+
+# Имя файла состояния импорта в корне библиотеки
+STATE_FILE = ".bulk_import_state.jsonl"
+
+UNKNOWN_AUTHOR = "Неизвестный автор"
+
+_GRADE_RE = re.compile(r"\d+")
+
+# Код предмета по коду или названию в нижнем регистре
+_SUBJECT_CODES = {
+    **{code.lower(): code for code in SUBJECTS},
+    **{name.lower(): code for code, name in SUBJECTS.items()},
+}
+
+
+@dataclass
+class ImportItem:
+    """Файл библиотеки и сведения, выведенные из его пути"""
+    path: str
+    relpath: str
+    grade: str
+    subject: str
+    author: str
+    title: str
+    size: int
+    mtime: float
+
+
+def infer_metadata(root: str, path: str) -> Optional[ImportItem]:
+    """
+    Класс, предмет, автор и название по расположению файла
+
+    Returns:
+        ImportItem или None, если путь не соответствует раскладке
+    """
+    relpath = os.path.relpath(path, root)
+    parts = relpath.split(os.sep)
+    if len(parts) < 3:
+        return None
+
+    grade_match = _GRADE_RE.search(parts[0])
+    if not grade_match or not 1 <= int(grade_match.group()) <= 11:
+        return None
+    grade = str(int(grade_match.group()))
+
+    subject_dir = parts[1].strip()
+    subject = _SUBJECT_CODES.get(subject_dir.lower(), subject_dir.lower())
+
+    stem = os.path.splitext(parts[-1])[0].replace("_", " ").strip()
+    if len(parts) >= 4:
+        author, title = parts[2].strip(), stem
+    elif " - " in stem:
+        author, title = (part.strip() for part in stem.split(" - ", 1))
+    else:
+        author, title = UNKNOWN_AUTHOR, stem
+
+    stat = os.stat(path)
+    return ImportItem(path, relpath, grade, subject, author or UNKNOWN_AUTHOR,
+                      title or stem, stat.st_size, stat.st_mtime)
+
+
+def walk_library(root: str, extensions: Tuple[str, ...]) -> Iterator[Tuple[str, Optional[ImportItem]]]:
+    """Обход дерева: (путь, сведения или None для файлов вне раскладки)"""
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(extensions):
+                path = os.path.join(directory, filename)
+                yield path, infer_metadata(root, path)
+
+
+class ImportState:
+    """
+    Журнал обработанных файлов для продолжения импорта
+
+    Строка дописывается только после фиксации транзакции с файлом,
+    поэтому при повторном запуске пропускаются ровно те файлы, которые
+    уже в каталоге (или признаны дубликатами), и только если их размер
+    и время изменения не поменялись.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Dict[str, Tuple[int, float]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # оборванная строка после сбоя
+                    self.done[record["path"]] = (record["size"], record["mtime"])
+        self._file = open(path, "a", encoding="utf-8")
+
+    def is_done(self, item: ImportItem) -> bool:
+        return self.done.get(item.relpath) == (item.size, item.mtime)
+
+    def record(self, items: List[Tuple[ImportItem, str, str]]) -> None:
+        """Отметка пачки: (файл, хеш, результат)"""
+        for item, file_hash, result in items:
+            self._file.write(json.dumps({
+                "path": item.relpath, "size": item.size, "mtime": item.mtime,
+                "hash": file_hash, "result": result
+            }, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+async def hashed(items: List[ImportItem], pool: ProcessPoolExecutor,
+                 window: int) -> AsyncIterator[Tuple[ImportItem, Optional[Tuple[str, int]], Optional[Exception]]]:
+    """Хеши файлов в исходном порядке; в работе не больше window файлов"""
+    loop = asyncio.get_running_loop()
+    pending = deque()
+    for item in items:
+        pending.append((item, loop.run_in_executor(pool, hash_file, item.path)))
+        if len(pending) >= window:
+            yield await _result(*pending.popleft())
+    while pending:
+        yield await _result(*pending.popleft())
+
+
+async def _result(item: ImportItem, future: "asyncio.Future"):
+    try:
+        return item, await future, None
+    except Exception as e:
+        return item, None, e
+
+
+async def insert_batch(conn: asyncpg.Connection, rows: List[Tuple], uploaded_by: str) -> Set[str]:
+    """
+    Добавление пачки учебников одной транзакцией
+
+    Returns:
+        Set[str]: Хеши добавленных строк (остальные уже были в каталоге)
+    """
+    columns = [list(column) for column in zip(*rows)]
+    async with conn.transaction():
+        inserted = await conn.fetch("""
+            INSERT INTO textbooks (title, author, subject, grade, file_name, file_path,
+                                   file_size, file_hash, uploaded_by)
+            SELECT r.title, r.author, r.subject, r.grade, r.file_name, r.file_path,
+                   r.file_size, r.file_hash, $9
+            FROM unnest($1::text[], $2::text[], $3::text[], $4::text[], $5::text[],
+                        $6::text[], $7::int[], $8::text[])
+                AS r(title, author, subject, grade, file_name, file_path, file_size, file_hash)
+            ON CONFLICT (file_hash) DO NOTHING
+            RETURNING file_hash
+        """, *columns, uploaded_by)
+    return {row["file_hash"] for row in inserted}
+
+
+async def run_import(args) -> int:
+    root = os.path.abspath(args.root)
+    extensions = tuple(ext.lower() for ext in args.extensions)
+
+    items: List[ImportItem] = []
+    unmatched = 0
+    for path, item in walk_library(root, extensions):
+        if item is None:
+            unmatched += 1
+            print(f"⚠️ Пропущен (не по раскладке): {os.path.relpath(path, root)}")
+        else:
+            items.append(item)
+
+    store = BlobStore(args.storage)
+    state = ImportState(args.state or os.path.join(root, STATE_FILE))
+    todo = [item for item in items if not state.is_done(item)]
+    resumed = len(items) - len(todo)
+    total_bytes = sum(item.size for item in todo)
+    print(f"📚 Найдено файлов: {len(items)}, уже обработано ранее: {resumed}, к импорту: {len(todo)} "
+          f"({total_bytes / 1024 / 1024:.1f} МБ)")
+    if not todo:
+        state.close()
+        return 0
+
+    conn = await asyncpg.connect(DATABASE_URL)
+    await conn.execute("""
+        ALTER TABLE textbooks ADD COLUMN IF NOT EXISTS file_hash TEXT;
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_textbooks_file_hash ON textbooks(file_hash);
+    """)
+    known: Set[str] = {
+        row["file_hash"] for row in
+        await conn.fetch("SELECT file_hash FROM textbooks WHERE file_hash IS NOT NULL")
+    }
+
+    counts = {"imported": 0, "duplicate": 0, "error": 0}
+    batch: List[Tuple[ImportItem, str, str]] = []
+    processed_bytes = 0
+    started = time.perf_counter()
+
+    async def flush_batch() -> None:
+        new = [(item, file_hash, dest) for item, file_hash, dest in batch if dest]
+        # Файлы кладутся в хранилище параллельно в потоках, до записи в каталог
+        await asyncio.gather(*(
+            asyncio.to_thread(store.put_file, item.path, file_hash) for item, file_hash, _ in new
+        ))
+        inserted: Set[str] = set()
+        if new:
+            rows = [(item.title, item.author, item.subject, item.grade,
+                     os.path.basename(item.path), dest, item.size, file_hash)
+                    for item, file_hash, dest in new]
+            inserted = await insert_batch(conn, rows, args.uploaded_by)
+
+        results = []
+        for item, file_hash, dest in batch:
+            result = "imported" if file_hash in inserted else "duplicate"
+            counts[result] += 1
+            results.append((item, file_hash, result))
+        state.record(results)
+        batch.clear()
+
+        elapsed = time.perf_counter() - started
+        done = counts["imported"] + counts["duplicate"]
+        print(f"⏳ {done}/{len(todo)}  {done / elapsed:.1f} файлов/с  "
+              f"{processed_bytes / 1024 / 1024 / elapsed:.1f} МБ/с  "
+              f"новых {counts['imported']}, дубликатов {counts['duplicate']}")
+
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            async for item, result, error in hashed(todo, pool, args.workers * 4):
+                if error is not None:
+                    counts["error"] += 1
+                    print(f"❌ Ошибка чтения {item.relpath}: {error}")
+                    continue
+                file_hash, size = result
+                processed_bytes += size
+                if file_hash in known:
+                    batch.append((item, file_hash, ""))
+                else:
+                    known.add(file_hash)
+                    batch.append((item, file_hash, store.blob_path(file_hash)))
+                if len(batch) >= args.batch_size:
+                    await flush_batch()
+            if batch:
+                await flush_batch()
+    finally:
+        state.close()
+        await conn.close()
+
+    elapsed = time.perf_counter() - started
+    processed = counts["imported"] + counts["duplicate"]
+    print(f"✅ Импорт завершен за {elapsed:.1f} с: {processed / elapsed:.1f} файлов/с, "
+          f"{processed_bytes / 1024 / 1024 / elapsed:.1f} МБ/с")
+    print(f"   добавлено {counts['imported']}, дубликатов {counts['duplicate']}, "
+          f"ошибок {counts['error']}, вне раскладки {unmatched}, пропущено (ранее) {resumed}")
+    return 1 if counts["error"] else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Массовый импорт учебников из дерева каталогов")
+    parser.add_argument("root", help="Корень библиотеки: <класс>/<предмет>/[<автор>/]<файл>")
+    parser.add_argument("--storage", default=TEXTBOOKS_DIR, help="Каталог хранения учебников")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Процессов хеширования")
+    parser.add_argument("--batch-size", type=int, default=200, help="Учебников в одной транзакции")
+    parser.add_argument("--extensions", nargs="+", default=[".pdf"])
+    parser.add_argument("--state", help=f"Файл состояния (по умолчанию <корень>/{STATE_FILE})")
+    parser.add_argument("--uploaded-by", default=str(ADMIN_ID))
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.root):
+        print(f"Каталог не найден: {args.root}")
+        sys.exit(1)
+    sys.exit(asyncio.run(run_import(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -25,10 +25,78 @@ BOT_CONFIG = {
     'max_file_size_mb': 50,  # Максимальный размер файла в МБ
     'rate_limit_requests': 10,  # Максимум запросов в минуту на пользователя
     'rate_limit_window': 60,  # Окно времени для лимитов в секундах
+    'rate_limit_max_users': 100000,  # Сколько пользователей хранит лимитер (LRU)
+    
+    # Стоимость действий в запросах: ключ - префикс callback_data или текста
+    # сообщения, 'inline_query' - inline-поиск, 'default' - остальное (навигация)
+    'rate_limit_costs': {
+        'default': 0.2,
+        'download_': 1.0,
+        '/search': 1.0,
+        'inline_query': 0.5,
+    },
+    
+    # Хранилище состояний FSM (fsm_storage): файл SQLite, размер кеша в памяти,
+    # срок жизни неактивного состояния (сек), период и порог пакетной записи
+    'fsm_storage_path': os.getenv('FSM_STORAGE_PATH', 'fsm_storage.db'),
+    'fsm_cache_size': 10000,
+    'fsm_state_ttl': 7 * 24 * 3600,
+    'fsm_flush_interval': 0.5,
+    'fsm_flush_batch': 500,
+    
+    # Адрес сервера Bot API, если не api.telegram.org (например, fake_bot_api.py)
+    'api_server_url': os.getenv('TELEGRAM_API_URL', ''),
+    
+    # HTTP-сессия Bot API (bot_session): пулы соединений, keep-alive, DNS, таймауты
+    'http_pool_size': 100,  # Соединений для легких запросов (кнопки, тексты)
+    'http_upload_pool_size': 8,  # Соединений для загрузки и скачивания файлов
+    'http_keepalive_timeout': 60,  # Сколько секунд держать простаивающее соединение
+    'http_dns_ttl': 600,  # Время жизни записи кеша DNS в секундах
+    'http_connect_timeout': 5,  # Таймаут установки соединения
+    'http_request_timeout': 15,  # Таймаут легкого запроса
+    'http_upload_timeout': 300,  # Таймаут запроса с файлом (учебники до 50 МБ)
+    'http_method_timeouts': {  # Таймауты отдельных методов Bot API
+        'answerCallbackQuery': 5,
+        'deleteMessage': 10,
+        'editMessageText': 10,
+        'editMessageReplyMarkup': 10,
+        'sendMessage': 15,
+    },
     
     # Настройки базы данных
     'database_url': os.getenv('DATABASE_URL', ''),
     
+    # Отложенная запись скачиваний: интервал сброса (сек) и порог событий
+    'downloads_flush_interval': 5,
+    'downloads_flush_threshold': 200,
+    
+    # Отметки активности: интервал записи в базу и окно "онлайн" (сек)
+    'activity_flush_interval': 60,
+    'activity_now_window': 300,
+    
+    # Журналы (downloads, system_logs): очередь, размер пачки COPY, задержка записи (сек)
+    # и политика переполнения очереди: block, drop_new или drop_oldest
+    'log_queue_size': 10000,
+    'log_batch_size': 500,
+    'log_flush_interval': 0.5,
+    'log_overflow': 'drop_oldest',
+    
+    # Помесячные секции downloads: сколько месяцев создавать наперед, срок хранения
+    # в месяцах (None - хранить все) и каталог CSV-архивов удаляемых секций
+    'partition_months_ahead': 2,
+    'downloads_retention_months': None,
+    'partition_archive_dir': None,
+    
+    # Учебников на одной странице списка по предмету
+    'textbooks_page_size': 10,
+    
+    # Inline-режим: результатов на страницу и время кеширования ответа в Telegram (сек)
+    'inline_page_size': 20,
+    'inline_cache_time': 300,
+    
+    # Время жизни кеша статистики бота в секундах
+    'stats_cache_ttl': 30,
+    
     # Режим отладки
     'debug_mode': os.getenv('DEBUG', 'False').lower() == 'true',
 }
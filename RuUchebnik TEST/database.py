@@ -9,12 +9,16 @@
 
 import asyncio
 import logging
+import time
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Dict, List, Optional, Set, Tuple, Any
 import asyncpg
 from asyncpg import Pool, Connection
 
 from config import BOT_CONFIG
+from search_index import TextbookSearchIndex
+from log_sink import LogSink, json_columns
+from partitions import PartitionMaintainer, convert_to_partitioned, ensure_partitions
 
 
 class DatabaseManager:
@@ -23,6 +27,18 @@ class DatabaseManager:
     def __init__(self):
         """Инициализация менеджера базы данных"""
         self.pool: Optional[Pool] = None
+        self.search_index: Optional[TextbookSearchIndex] = None
+        self._listen_connection: Optional[Connection] = None
+        # Задачи обновления индекса по уведомлениям: ссылка нужна, чтобы задачу не собрал GC
+        self._index_tasks: Set[asyncio.Task] = set()
+        # telegram_id заблокированных пользователей; обновляется по уведомлениям
+        self.blocked_ids: Set[str] = set()
+        # Изменения блокировок, пришедшие во время первоначальной загрузки
+        self._blocked_changes: Optional[Dict[str, bool]] = None
+        self._stats_cache: Optional[Tuple[float, Dict[str, Any]]] = None
+        self.download_log: Optional[LogSink] = None
+        self.event_log: Optional[LogSink] = None
+        self.partitions: Optional[PartitionMaintainer] = None
         self.logger = logging.getLogger(__name__)
         self.database_url = BOT_CONFIG['database_url']
         
@@ -52,6 +68,21 @@ class DatabaseManager:
             async with self.pool.acquire() as connection:
                 version = await connection.fetchval('SELECT version()')
                 self.logger.info(f"📊 Подключено к: {version.split(',')[0]}")
+            
+            await self._ensure_schema()
+            await self._ensure_stats_rollups()
+            await self._load_search_index()
+            await self._load_blocked_users()
+            self._start_log_sinks()
+            
+            # Секции downloads на месяцы вперед и удаление старых по сроку хранения
+            self.partitions = PartitionMaintainer(
+                self.pool,
+                {'downloads': BOT_CONFIG.get('downloads_retention_months')},
+                months_ahead=BOT_CONFIG.get('partition_months_ahead', 2),
+                archive_dir=BOT_CONFIG.get('partition_archive_dir')
+            )
+            self.partitions.start()
                 
         except Exception as e:
             self.logger.error(f"❌ Ошибка подключения к базе данных: {e}")
@@ -59,10 +90,383 @@ class DatabaseManager:
     
     async def close(self) -> None:
         """Закрытие пула соединений с базой данных"""
+        # Журналы дописываются до закрытия пула
+        for sink in (self.download_log, self.event_log):
+            if sink is not None:
+                await sink.stop()
+        
+        if self.partitions:
+            await self.partitions.stop()
+            self.partitions = None
+        
+        if self._listen_connection:
+            await self._listen_connection.close()
+            self._listen_connection = None
+        
+        # Начатые обновления индекса дочитывают учебник до закрытия пула
+        if self._index_tasks:
+            await asyncio.gather(*self._index_tasks, return_exceptions=True)
+        
         if self.pool:
             await self.pool.close()
             self.logger.info("📊 Пул соединений с базой данных закрыт")
     
+    def _start_log_sinks(self) -> None:
+        """Запуск фоновой записи журналов скачиваний и системных событий"""
+        options = {
+            'max_queue': BOT_CONFIG.get('log_queue_size', 10000),
+            'batch_size': BOT_CONFIG.get('log_batch_size', 500),
+            'flush_interval': BOT_CONFIG.get('log_flush_interval', 0.5),
+            'overflow': BOT_CONFIG.get('log_overflow', 'drop_oldest')
+        }
+        self.download_log = LogSink(
+            self.pool, 'downloads', ('user_id', 'textbook_id', 'ip_address'), **options
+        )
+        self.event_log = LogSink(
+            self.pool, 'system_logs', ('type', 'action', 'details', 'user_id'),
+            prepare=json_columns(2), **options
+        )
+        self.download_log.start()
+        self.event_log.start()
+    
+    async def _ensure_schema(self) -> None:
+        """Добавление служебных колонок, необходимых боту"""
+        async with self.pool.acquire() as connection:
+            # file_id документа в Telegram для повторной отправки без загрузки
+            await connection.execute(
+                "ALTER TABLE textbooks ADD COLUMN IF NOT EXISTS telegram_file_id TEXT"
+            )
+            
+            # Списки учебников листаются по (title, id) внутри класса и предмета
+            await connection.execute("""
+                CREATE INDEX IF NOT EXISTS idx_textbooks_class_subject_title_id
+                    ON textbooks(class_id, subject_id, title, id)
+                    WHERE is_active = true
+            """)
+            
+            # Уведомление об изменении учебника для обновления поискового индекса
+            # (счетчики и file_id не влияют на поиск и уведомлений не вызывают)
+            await connection.execute("""
+                CREATE OR REPLACE FUNCTION notify_textbooks_changed() RETURNS trigger AS $$
+                BEGIN
+                    IF TG_OP = 'DELETE' THEN
+                        PERFORM pg_notify('textbooks_changed', OLD.id::text);
+                    ELSE
+                        PERFORM pg_notify('textbooks_changed', NEW.id::text);
+                    END IF;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql
+            """)
+            await connection.execute("""
+                DROP TRIGGER IF EXISTS textbooks_changed ON textbooks;
+                CREATE TRIGGER textbooks_changed
+                    AFTER INSERT OR DELETE
+                    OR UPDATE OF title, author_id, class_id, subject_id, is_active
+                    ON textbooks
+                    FOR EACH ROW EXECUTE FUNCTION notify_textbooks_changed()
+            """)
+            
+            # Уведомление о блокировке пользователя (в том числе из админ-панели):
+            # payload - "telegram_id:true|false"
+            await connection.execute("""
+                CREATE OR REPLACE FUNCTION notify_user_blocked_changed() RETURNS trigger AS $$
+                BEGIN
+                    IF TG_OP = 'DELETE' THEN
+                        PERFORM pg_notify('user_blocked_changed', OLD.telegram_id || ':false');
+                    ELSIF NEW.is_blocked IS DISTINCT FROM OLD.is_blocked THEN
+                        PERFORM pg_notify('user_blocked_changed',
+                                          NEW.telegram_id || ':' || COALESCE(NEW.is_blocked, false)::text);
+                    END IF;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql
+            """)
+            await connection.execute("""
+                DROP TRIGGER IF EXISTS user_blocked_changed ON bot_users;
+                CREATE TRIGGER user_blocked_changed
+                    AFTER DELETE OR UPDATE OF is_blocked ON bot_users
+                    FOR EACH ROW EXECUTE FUNCTION notify_user_blocked_changed()
+            """)
+            
+            # downloads секционируется по месяцам downloaded_at; существующая
+            # таблица переносится в секции один раз (триггеры сводок создаются позже)
+            months_ahead = BOT_CONFIG.get('partition_months_ahead', 2)
+            try:
+                await convert_to_partitioned(connection, 'downloads', 'downloaded_at', months_ahead)
+                await ensure_partitions(connection, 'downloads', months_ahead)
+            except Exception as e:
+                # Миграция выполняется в транзакции - таблица осталась прежней
+                self.logger.warning(f"⚠️ Не удалось секционировать downloads: {e}")
+            await connection.execute("""
+                CREATE INDEX IF NOT EXISTS idx_downloads_user_downloaded_at
+                    ON downloads (user_id, downloaded_at);
+                CREATE INDEX IF NOT EXISTS idx_downloads_textbook_id
+                    ON downloads (textbook_id);
+            """)
+    
+    async def _ensure_stats_rollups(self) -> None:
+        """
+        Таблицы-сводки статистики, поддерживаемые триггерами
+        
+        stats_totals - одна строка с общими счетчиками, stats_daily - счетчики
+        по дням, stats_subject_downloads - скачивания по предметам.
+        Триггеры на bot_users, textbooks и downloads обновляют сводки в той же
+        транзакции, что и исходные данные, поэтому статистика читается одним
+        запросом по первичному ключу независимо от размера таблиц.
+        """
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                await connection.execute("""
+                    CREATE TABLE IF NOT EXISTS stats_totals (
+                        id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+                        total_users BIGINT NOT NULL DEFAULT 0,
+                        total_textbooks BIGINT NOT NULL DEFAULT 0,
+                        total_downloads BIGINT NOT NULL DEFAULT 0
+                    );
+                    
+                    CREATE TABLE IF NOT EXISTS stats_daily (
+                        day DATE PRIMARY KEY,
+                        new_users INTEGER NOT NULL DEFAULT 0,
+                        active_users INTEGER NOT NULL DEFAULT 0,
+                        downloads INTEGER NOT NULL DEFAULT 0
+                    );
+                    
+                    CREATE TABLE IF NOT EXISTS stats_subject_downloads (
+                        subject_id TEXT PRIMARY KEY,
+                        downloads BIGINT NOT NULL DEFAULT 0
+                    );
+                """)
+                
+                # Пользователи: регистрация и первая активность за день
+                await connection.execute("""
+                    CREATE OR REPLACE FUNCTION stats_on_bot_users() RETURNS trigger AS $$
+                    BEGIN
+                        IF TG_OP = 'INSERT' THEN
+                            UPDATE stats_totals SET total_users = total_users + 1 WHERE id = 1;
+                            INSERT INTO stats_daily (day, new_users, active_users)
+                            VALUES (CURRENT_DATE, 1, 1)
+                            ON CONFLICT (day) DO UPDATE
+                            SET new_users = stats_daily.new_users + 1,
+                                active_users = stats_daily.active_users + 1;
+                        ELSIF TG_OP = 'DELETE' THEN
+                            UPDATE stats_totals SET total_users = total_users - 1 WHERE id = 1;
+                        ELSIF NEW.last_activity_at >= CURRENT_DATE
+                              AND (OLD.last_activity_at IS NULL OR OLD.last_activity_at < CURRENT_DATE) THEN
+                            INSERT INTO stats_daily (day, active_users)
+                            VALUES (CURRENT_DATE, 1)
+                            ON CONFLICT (day) DO UPDATE
+                            SET active_users = stats_daily.active_users + 1;
+                        END IF;
+                        RETURN NULL;
+                    END;
+                    $$ LANGUAGE plpgsql;
+                    
+                    DROP TRIGGER IF EXISTS stats_bot_users ON bot_users;
+                    CREATE TRIGGER stats_bot_users
+                        AFTER INSERT OR DELETE OR UPDATE OF last_activity_at ON bot_users
+                        FOR EACH ROW EXECUTE FUNCTION stats_on_bot_users();
+                """)
+                
+                # Учебники: число активных, сумма скачиваний, скачивания по предметам
+                await connection.execute("""
+                    CREATE OR REPLACE FUNCTION stats_on_textbooks() RETURNS trigger AS $$
+                    DECLARE
+                        old_active INTEGER := 0;
+                        new_active INTEGER := 0;
+                        old_downloads BIGINT := 0;
+                        new_downloads BIGINT := 0;
+                    BEGIN
+                        IF TG_OP <> 'INSERT' THEN
+                            old_active := CASE WHEN OLD.is_active THEN 1 ELSE 0 END;
+                            old_downloads := COALESCE(OLD.download_count, 0);
+                        END IF;
+                        IF TG_OP <> 'DELETE' THEN
+                            new_active := CASE WHEN NEW.is_active THEN 1 ELSE 0 END;
+                            new_downloads := COALESCE(NEW.download_count, 0);
+                        END IF;
+                        
+                        IF new_active <> old_active OR new_downloads <> old_downloads THEN
+                            UPDATE stats_totals
+                            SET total_textbooks = total_textbooks + new_active - old_active,
+                                total_downloads = total_downloads + new_downloads - old_downloads
+                            WHERE id = 1;
+                        END IF;
+                        
+                        -- В рейтинг предметов входят только активные учебники
+                        IF old_active = 1 AND OLD.subject_id IS NOT NULL THEN
+                            UPDATE stats_subject_downloads
+                            SET downloads = downloads - old_downloads
+                            WHERE subject_id = OLD.subject_id::text;
+                        END IF;
+                        IF new_active = 1 AND NEW.subject_id IS NOT NULL THEN
+                            INSERT INTO stats_subject_downloads (subject_id, downloads)
+                            VALUES (NEW.subject_id::text, new_downloads)
+                            ON CONFLICT (subject_id) DO UPDATE
+                            SET downloads = stats_subject_downloads.downloads + EXCLUDED.downloads;
+                        END IF;
+                        RETURN NULL;
+                    END;
+                    $$ LANGUAGE plpgsql;
+                    
+                    DROP TRIGGER IF EXISTS stats_textbooks ON textbooks;
+                    CREATE TRIGGER stats_textbooks
+                        AFTER INSERT OR DELETE OR UPDATE OF download_count, is_active, subject_id ON textbooks
+                        FOR EACH ROW EXECUTE FUNCTION stats_on_textbooks();
+                """)
+                
+                # Скачивания по дням: один UPDATE на весь INSERT (пакет)
+                await connection.execute("""
+                    CREATE OR REPLACE FUNCTION stats_on_downloads() RETURNS trigger AS $$
+                    BEGIN
+                        INSERT INTO stats_daily (day, downloads)
+                        SELECT COALESCE(downloaded_at::date, CURRENT_DATE), COUNT(*)
+                        FROM new_rows
+                        GROUP BY 1
+                        ON CONFLICT (day) DO UPDATE
+                        SET downloads = stats_daily.downloads + EXCLUDED.downloads;
+                        RETURN NULL;
+                    END;
+                    $$ LANGUAGE plpgsql;
+                    
+                    DROP TRIGGER IF EXISTS stats_downloads ON downloads;
+                    CREATE TRIGGER stats_downloads
+                        AFTER INSERT ON downloads
+                        REFERENCING NEW TABLE AS new_rows
+                        FOR EACH STATEMENT EXECUTE FUNCTION stats_on_downloads();
+                """)
+                
+                # Первичное заполнение сводок по уже накопленным данным
+                initialized = await connection.fetchval("SELECT EXISTS (SELECT 1 FROM stats_totals)")
+                if not initialized:
+                    await connection.execute("""
+                        INSERT INTO stats_totals (id, total_users, total_textbooks, total_downloads)
+                        SELECT 1,
+                            (SELECT COUNT(*) FROM bot_users),
+                            (SELECT COUNT(*) FROM textbooks WHERE is_active = true),
+                            (SELECT COALESCE(SUM(download_count), 0) FROM textbooks);
+                        
+                        INSERT INTO stats_daily (day, new_users)
+                        SELECT registered_at::date, COUNT(*) FROM bot_users
+                        WHERE registered_at IS NOT NULL GROUP BY 1
+                        ON CONFLICT (day) DO UPDATE SET new_users = EXCLUDED.new_users;
+                        
+                        INSERT INTO stats_daily (day, downloads)
+                        SELECT downloaded_at::date, COUNT(*) FROM downloads
+                        WHERE downloaded_at IS NOT NULL GROUP BY 1
+                        ON CONFLICT (day) DO UPDATE SET downloads = EXCLUDED.downloads;
+                        
+                        INSERT INTO stats_daily (day, active_users)
+                        SELECT CURRENT_DATE, COUNT(*) FROM bot_users
+                        WHERE last_activity_at >= CURRENT_DATE
+                        ON CONFLICT (day) DO UPDATE SET active_users = EXCLUDED.active_users;
+                        
+                        INSERT INTO stats_subject_downloads (subject_id, downloads)
+                        SELECT subject_id::text, COALESCE(SUM(download_count), 0) FROM textbooks
+                        WHERE is_active = true AND subject_id IS NOT NULL GROUP BY 1;
+                    """)
+                    self.logger.info("📊 Сводки статистики заполнены по текущим данным")
+    
+    async def _load_search_index(self) -> None:
+        """Построение поискового индекса и подписка на изменения учебников"""
+        async with self.pool.acquire() as connection:
+            rows = await connection.fetch("""
+                SELECT 
+                    t.*,
+                    a.full_name as author_name,
+                    a.short_name as author_short_name,
+                    c.name as class_name,
+                    s.name as subject_name
+                FROM textbooks t
+                LEFT JOIN authors a ON t.author_id = a.id
+                LEFT JOIN classes c ON t.class_id = c.id
+                LEFT JOIN subjects s ON t.subject_id = s.id
+                WHERE t.is_active = true
+            """)
+        
+        search_index = TextbookSearchIndex()
+        search_index.rebuild(dict(row) for row in rows)
+        
+        # Отдельное соединение вне пула: LISTEN должен жить все время работы
+        self._listen_connection = await asyncpg.connect(self.database_url)
+        await self._listen_connection.add_listener('textbooks_changed', self._on_textbook_changed)
+        
+        self.search_index = search_index
+        self.logger.info(f"🔍 Поисковый индекс построен: {len(search_index)} учебников")
+    
+    def _on_textbook_changed(self, connection: Connection, pid: int, 
+                             channel: str, payload: str) -> None:
+        """Обработчик уведомления об изменении учебника"""
+        task = asyncio.create_task(self.refresh_textbook_in_index(payload))
+        self._index_tasks.add(task)
+        task.add_done_callback(self._index_tasks.discard)
+    
+    async def _load_blocked_users(self) -> None:
+        """Загрузка заблокированных пользователей и подписка на изменения блокировок"""
+        # Подписка до чтения: изменения во время запроса не теряются
+        self._blocked_changes = {}
+        await self._listen_connection.add_listener('user_blocked_changed', self._on_user_blocked_changed)
+        
+        async with self.pool.acquire() as connection:
+            rows = await connection.fetch("SELECT telegram_id FROM bot_users WHERE is_blocked = true")
+        
+        blocked_ids = {row['telegram_id'] for row in rows}
+        for telegram_id, blocked in self._blocked_changes.items():
+            if blocked:
+                blocked_ids.add(telegram_id)
+            else:
+                blocked_ids.discard(telegram_id)
+        self._blocked_changes = None
+        self.blocked_ids = blocked_ids
+        self.logger.info(f"🚫 Заблокированных пользователей: {len(blocked_ids)}")
+    
+    def _on_user_blocked_changed(self, connection: Connection, pid: int,
+                                 channel: str, payload: str) -> None:
+        """Обработчик уведомления о блокировке или разблокировке пользователя"""
+        telegram_id, _, blocked = payload.rpartition(':')
+        self._set_blocked(telegram_id, blocked == 'true')
+    
+    def _set_blocked(self, telegram_id: str, blocked: bool) -> None:
+        if self._blocked_changes is not None:
+            self._blocked_changes[telegram_id] = blocked
+        if blocked:
+            self.blocked_ids.add(telegram_id)
+        else:
+            self.blocked_ids.discard(telegram_id)
+    
+    def is_blocked_cached(self, telegram_id: int) -> bool:
+        """
+        Проверка блокировки по набору в памяти, без запроса к базе
+        
+        Args:
+            telegram_id: ID пользователя в Telegram
+            
+        Returns:
+            bool: True если пользователь заблокирован
+        """
+        return str(telegram_id) in self.blocked_ids
+    
+    async def refresh_textbook_in_index(self, textbook_id: str) -> None:
+        """
+        Обновление одного учебника в поисковом индексе
+        
+        Args:
+            textbook_id: ID учебника (неактивный или удаленный учебник убирается из индекса)
+        """
+        if self.search_index is None:
+            return
+        
+        try:
+            textbook = await self.get_textbook(textbook_id)
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка обновления поискового индекса для {textbook_id}: {e}")
+            return
+        
+        if textbook:
+            self.search_index.add(textbook)
+        else:
+            self.search_index.remove(textbook_id)
+    
     # =============================================================================
     # РАБОТА С ПОЛЬЗОВАТЕЛЯМИ БОТА
     # =============================================================================
@@ -127,7 +531,43 @@ class DatabaseManager:
                 "UPDATE bot_users SET last_activity_at = CURRENT_TIMESTAMP WHERE telegram_id = $1",
                 str(telegram_id)
             )
-    
+
+    async def apply_activity_batch(self, last_seen: List[Tuple[str, datetime]]) -> None:
+        """
+        Пакетная запись времени последней активности (одним запросом)
+
+        Время не откатывается назад, если в базе уже записано более позднее.
+
+        Args:
+            last_seen: Пары (telegram_id, время активности), отсортированные по telegram_id
+        """
+        if not last_seen:
+            return
+
+        async with self.pool.acquire() as connection:
+            await connection.execute("""
+                UPDATE bot_users AS u
+                SET last_activity_at = v.seen
+                FROM unnest($1::varchar[], $2::timestamptz[]) AS v(telegram_id, seen)
+                WHERE u.telegram_id = v.telegram_id
+                  AND (u.last_activity_at IS NULL OR u.last_activity_at < v.seen)
+            """, [telegram_id for telegram_id, _ in last_seen], [seen for _, seen in last_seen])
+
+    async def get_active_today(self) -> List[Tuple[str, datetime]]:
+        """
+        Пользователи, активные с начала суток
+
+        Returns:
+            List[Tuple]: Пары (telegram_id, время активности) по возрастанию времени
+        """
+        async with self.pool.acquire() as connection:
+            rows = await connection.fetch("""
+                SELECT telegram_id, last_activity_at FROM bot_users
+                WHERE last_activity_at >= CURRENT_DATE
+                ORDER BY last_activity_at
+            """)
+            return [(row['telegram_id'], row['last_activity_at']) for row in rows]
+
     async def is_user_blocked(self, telegram_id: int) -> bool:
         """
         Проверка, заблокирован ли пользователь
@@ -226,6 +666,63 @@ class DatabaseManager:
             """, class_id, subject_id)
             return [dict(row) for row in rows]
     
+    async def count_textbooks(self, class_id: str, subject_id: str) -> int:
+        """Количество активных учебников по классу и предмету (для счетчика страниц)"""
+        async with self.pool.acquire() as connection:
+            return await connection.fetchval(
+                "SELECT COUNT(*) FROM textbooks WHERE class_id = $1 AND subject_id = $2 AND is_active = true",
+                class_id, subject_id
+            )
+    
+    async def get_textbooks_page(self, class_id: str, subject_id: str,
+                                 cursor: Optional[str] = None, backward: bool = False,
+                                 page_size: int = 10) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Страница учебников по классу и предмету в порядке (title, id)
+        
+        Курсор - id учебника на границе предыдущей страницы: последнего
+        (следующая страница) или первого (backward=True, предыдущая).
+        Запрос читает не больше page_size + 1 строк по индексу
+        idx_textbooks_class_subject_title_id, без OFFSET.
+        
+        Args:
+            class_id: ID класса
+            subject_id: ID предмета
+            cursor: ID учебника-курсора (None - первая страница)
+            backward: Листать назад от курсора
+            page_size: Учебников на странице
+            
+        Returns:
+            Tuple[List[Dict], bool]: Учебники страницы и есть ли еще страница в этом направлении
+        """
+        op, order = ('<', 'DESC') if backward else ('>', 'ASC')
+        # Строка курсора ищется по первичному ключу без приведения типа
+        after_cursor = (f"AND (t.title, t.id) {op} (SELECT title, id FROM textbooks WHERE id = $3)"
+                        if cursor is not None else "")
+        params = [class_id, subject_id] + ([cursor] if cursor is not None else [])
+        async with self.pool.acquire() as connection:
+            rows = await connection.fetch(f"""
+                SELECT 
+                    t.*,
+                    a.full_name as author_name,
+                    a.short_name as author_short_name,
+                    c.name as class_name,
+                    s.name as subject_name
+                FROM textbooks t
+                LEFT JOIN authors a ON t.author_id = a.id
+                LEFT JOIN classes c ON t.class_id = c.id  
+                LEFT JOIN subjects s ON t.subject_id = s.id
+                WHERE t.class_id = $1 AND t.subject_id = $2 AND t.is_active = true {after_cursor}
+                ORDER BY t.title {order}, t.id {order}
+                LIMIT ${len(params) + 1}
+            """, *params, page_size + 1)
+        
+        has_more = len(rows) > page_size
+        page = [dict(row) for row in rows[:page_size]]
+        if backward:
+            page.reverse()
+        return page, has_more
+    
     async def get_textbook(self, textbook_id: str) -> Optional[Dict[str, Any]]:
         """
         Получение информации об учебнике по ID
@@ -265,6 +762,39 @@ class DatabaseManager:
                 textbook_id
             )
     
+    async def set_textbook_file_id(self, textbook_id: str, file_id: str) -> None:
+        """
+        Сохранение file_id, полученного после первой загрузки учебника
+        
+        Args:
+            textbook_id: ID учебника
+            file_id: file_id документа в Telegram
+        """
+        async with self.pool.acquire() as connection:
+            await connection.execute(
+                "UPDATE textbooks SET telegram_file_id = $2 WHERE id = $1",
+                textbook_id, file_id
+            )
+        
+        if self.search_index is not None:
+            self.search_index.update_fields(textbook_id, telegram_file_id=file_id)
+    
+    async def clear_textbook_file_id(self, textbook_id: str) -> None:
+        """
+        Сброс устаревшего file_id (следующая отправка загрузит файл заново)
+        
+        Args:
+            textbook_id: ID учебника
+        """
+        async with self.pool.acquire() as connection:
+            await connection.execute(
+                "UPDATE textbooks SET telegram_file_id = NULL WHERE id = $1",
+                textbook_id
+            )
+        
+        if self.search_index is not None:
+            self.search_index.update_fields(textbook_id, telegram_file_id=None)
+    
     async def search_textbooks(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
         """
         Поиск учебников по названию
@@ -276,6 +806,10 @@ class DatabaseManager:
         Returns:
             List[Dict]: Найденные учебники
         """
+        # Поиск по индексу в памяти (морфология, ё/е, опечатки)
+        if self.search_index is not None:
+            return self.search_index.search(query, limit)
+        
         async with self.pool.acquire() as connection:
             rows = await connection.fetch("""
                 SELECT 
@@ -308,80 +842,112 @@ class DatabaseManager:
         """
         Логирование скачивания учебника
         
+        Запись ставится в очередь и пишется в фоне пачкой через COPY.
+        
         Args:
             user_id: ID пользователя
             textbook_id: ID учебника
             ip_address: IP адрес (опционально)
         """
+        await self.download_log.put((user_id, textbook_id, ip_address))
+
+    async def apply_download_batch(self, textbook_deltas: Dict[str, int],
+                                   user_deltas: Dict[str, int],
+                                   downloads: List[Tuple[str, str, Optional[str]]]) -> None:
+        """
+        Запись накопленных скачиваний одной транзакцией
+
+        Args:
+            textbook_deltas: Приращение счетчика по ID учебника
+            user_deltas: Приращение счетчика по telegram_id пользователя
+            downloads: Скачивания (telegram_id, textbook_id, ip_address)
+        """
         async with self.pool.acquire() as connection:
-            await connection.execute("""
-                INSERT INTO downloads (user_id, textbook_id, ip_address)
-                VALUES ($1, $2, $3)
-            """, user_id, textbook_id, ip_address)
-    
+            async with connection.transaction():
+                # Строки обновляются в порядке ключей, чтобы параллельные
+                # транзакции не блокировали друг друга взаимно
+                if textbook_deltas:
+                    await connection.executemany(
+                        "UPDATE textbooks SET download_count = download_count + $2 WHERE id = $1",
+                        sorted(textbook_deltas.items())
+                    )
+
+                if user_deltas:
+                    await connection.executemany("""
+                        UPDATE bot_users
+                        SET download_count = download_count + $2,
+                            last_activity_at = CURRENT_TIMESTAMP
+                        WHERE telegram_id = $1
+                    """, sorted(user_deltas.items()))
+
+                # Внутренний ID пользователя берется прямо в запросе
+                if downloads:
+                    await connection.executemany("""
+                        INSERT INTO downloads (user_id, textbook_id, ip_address)
+                        SELECT id, $2, $3 FROM bot_users WHERE telegram_id = $1
+                    """, downloads)
+        
+        # Популярность в поисковом индексе учитывает записанные скачивания
+        if self.search_index is not None:
+            self.search_index.add_downloads(textbook_deltas)
+
     # =============================================================================
     # СТАТИСТИКА
     # =============================================================================
     
-    async def get_bot_statistics(self) -> Dict[str, Any]:
+    async def get_bot_statistics(self, use_cache: bool = True) -> Dict[str, Any]:
         """
         Получение статистики бота
         
+        Статистика читается из таблиц-сводок одним запросом и кешируется
+        в памяти на BOT_CONFIG['stats_cache_ttl'] секунд.
+        
+        Args:
+            use_cache: Разрешить ответ из кеша
+        
         Returns:
             Dict: Статистические данные
         """
+        now = time.monotonic()
+        if use_cache and self._stats_cache and self._stats_cache[0] > now:
+            return dict(self._stats_cache[1])
+        
         async with self.pool.acquire() as connection:
-            # Общая статистика
-            stats = {}
-            
-            # Общее количество пользователей
-            stats['total_users'] = await connection.fetchval(
-                "SELECT COUNT(*) FROM bot_users"
-            )
-            
-            # Активные пользователи сегодня
-            today = datetime.now().date()
-            stats['active_today'] = await connection.fetchval(
-                "SELECT COUNT(*) FROM bot_users WHERE DATE(last_activity_at) = $1",
-                today
-            )
-            
-            # Новые пользователи за последние 7 дней
-            week_ago = datetime.now() - timedelta(days=7)
-            stats['new_users_week'] = await connection.fetchval(
-                "SELECT COUNT(*) FROM bot_users WHERE registered_at >= $1",
-                week_ago
-            )
-            
-            # Общее количество учебников
-            stats['total_textbooks'] = await connection.fetchval(
-                "SELECT COUNT(*) FROM textbooks WHERE is_active = true"
-            )
-            
-            # Общее количество скачиваний
-            stats['total_downloads'] = await connection.fetchval(
-                "SELECT SUM(download_count) FROM textbooks"
-            )
-            
-            # Скачивания сегодня
-            stats['downloads_today'] = await connection.fetchval(
-                "SELECT COUNT(*) FROM downloads WHERE DATE(downloaded_at) = $1",
-                today
-            )
-            
-            # Популярные предметы (топ 5)
-            popular_subjects = await connection.fetch("""
-                SELECT s.name, SUM(t.download_count) as downloads
-                FROM subjects s
-                JOIN textbooks t ON t.subject_id = s.id
-                WHERE t.is_active = true
-                GROUP BY s.id, s.name
-                ORDER BY downloads DESC
-                LIMIT 5
+            row = await connection.fetchrow("""
+                SELECT 
+                    t.total_users,
+                    t.total_textbooks,
+                    t.total_downloads,
+                    COALESCE(d.active_users, 0) AS active_today,
+                    COALESCE(d.downloads, 0) AS downloads_today,
+                    (SELECT COALESCE(SUM(w.new_users), 0) FROM stats_daily w
+                     WHERE w.day > CURRENT_DATE - 7) AS new_users_week,
+                    ARRAY(SELECT s.name FROM stats_subject_downloads r
+                          JOIN subjects s ON s.id::text = r.subject_id
+                          ORDER BY r.downloads DESC, r.subject_id LIMIT 5) AS subject_names,
+                    ARRAY(SELECT r.downloads FROM stats_subject_downloads r
+                          JOIN subjects s ON s.id::text = r.subject_id
+                          ORDER BY r.downloads DESC, r.subject_id LIMIT 5) AS subject_downloads
+                FROM stats_totals t
+                LEFT JOIN stats_daily d ON d.day = CURRENT_DATE
+                WHERE t.id = 1
             """)
-            stats['popular_subjects'] = [dict(row) for row in popular_subjects]
-            
-            return stats
+        
+        stats = {
+            'total_users': row['total_users'] if row else 0,
+            'active_today': row['active_today'] if row else 0,
+            'new_users_week': row['new_users_week'] if row else 0,
+            'total_textbooks': row['total_textbooks'] if row else 0,
+            'total_downloads': row['total_downloads'] if row else 0,
+            'downloads_today': row['downloads_today'] if row else 0,
+            'popular_subjects': [
+                {'name': name, 'downloads': downloads}
+                for name, downloads in zip(row['subject_names'], row['subject_downloads'])
+            ] if row else []
+        }
+        
+        self._stats_cache = (now + BOT_CONFIG.get('stats_cache_ttl', 30), stats)
+        return dict(stats)
     
     async def get_user_statistics(self, telegram_id: int) -> Dict[str, Any]:
         """
@@ -409,12 +975,12 @@ class DatabaseManager:
                 user_id
             )
             
-            # Скачивания за сегодня
-            today = datetime.now().date()
-            user_stats['downloads_today'] = await connection.fetchval(
-                "SELECT COUNT(*) FROM downloads WHERE user_id = $1 AND DATE(downloaded_at) = $2",
-                user_id, today
-            )
+            # Скачивания за сегодня (диапазон по downloaded_at - читается только текущая секция)
+            user_stats['downloads_today'] = await connection.fetchval("""
+                SELECT COUNT(*) FROM downloads
+                WHERE user_id = $1 AND downloaded_at >= CURRENT_DATE
+                  AND downloaded_at < CURRENT_DATE + 1
+            """, user_id)
             
             # Любимые предметы пользователя
             favorite_subjects = await connection.fetch("""
@@ -447,11 +1013,19 @@ class DatabaseManager:
             details: Дополнительные детали в формате JSON
             user_id: ID пользователя (если применимо)
         """
-        async with self.pool.acquire() as connection:
-            await connection.execute("""
-                INSERT INTO system_logs (type, action, details, user_id)
-                VALUES ($1, $2, $3, $4)
-            """, event_type, action, details, user_id)
+        await self.event_log.put((event_type, action, details, user_id))
+    
+    def enqueue_system_event(self, event_type: str, action: str,
+                             details: Optional[Dict] = None,
+                             user_id: Optional[str] = None) -> bool:
+        """
+        Постановка системного события в очередь без ожидания
+        (для синхронного кода; при переполнении действует политика журнала)
+        
+        Returns:
+            bool: True, если событие принято
+        """
+        return self.event_log.submit((event_type, action, details, user_id))
     
     # =============================================================================
     # АДМИНИСТРАТИВНЫЕ ФУНКЦИИ
@@ -488,6 +1062,7 @@ class DatabaseManager:
             )
             
             if result != "UPDATE 0":
+                self._set_blocked(str(telegram_id), True)
                 await self.log_system_event(
                     "warning", 
                     f"Пользователь {telegram_id} заблокирован",
@@ -513,6 +1088,7 @@ class DatabaseManager:
             )
             
             if result != "UPDATE 0":
+                self._set_blocked(str(telegram_id), False)
                 await self.log_system_event(
                     "info",
                     f"Пользователь {telegram_id} разблокирован"
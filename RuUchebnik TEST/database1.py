@@ -1,16 +1,46 @@
 import asyncio
 import asyncpg
 import json
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from bot.config import DATABASE_URL
+from bot.log_sink import LogSink, json_columns
+from bot.partitions import PartitionMaintainer, convert_to_partitioned, ensure_partitions
 import logging
 
 logger = logging.getLogger(__name__)
 
+# How long get_stats() may serve a cached result, in seconds
+STATS_CACHE_TTL = 30
+
+# Access decisions (ban / agreement) are cached per user for this many seconds;
+# changes made through this class or signalled via NOTIFY invalidate them at once
+ACCESS_CACHE_TTL = 60
+ACCESS_CACHE_SIZE = 50000
+
+# log_action() queues rows and a background task COPYs them into logs
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 500
+LOG_FLUSH_INTERVAL = 0.5
+
+# logs is partitioned by month; partitions older than LOG_RETENTION_MONTHS
+# (current month included) are dropped, after a CSV dump if LOG_ARCHIVE_DIR is set
+LOG_RETENTION_MONTHS = 12
+LOG_ARCHIVE_DIR = None
+PARTITION_MONTHS_AHEAD = 2
+
 class DatabaseManager:
     def __init__(self):
         self.pool: Optional[asyncpg.Pool] = None
+        self._stats_cache: Optional[Tuple[float, Dict]] = None
+        self._access_cache: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        # Bumped on every invalidation; a lookup that raced with one is not cached
+        self._access_generation = 0
+        self._listen_conn: Optional[asyncpg.Connection] = None
+        self.log_sink: Optional[LogSink] = None
+        self.partitions: Optional[PartitionMaintainer] = None
     
     async def initialize(self):
         """Initialize database connection pool"""
@@ -23,12 +53,33 @@ class DatabaseManager:
             )
             logger.info("Database connection pool created successfully")
             await self._ensure_tables()
+            await self._listen_access_changes()
+            self.log_sink = LogSink(
+                self.pool, "logs", ("type", "user_id", "action", "details", "ip_address"),
+                max_queue=LOG_QUEUE_SIZE, batch_size=LOG_BATCH_SIZE,
+                flush_interval=LOG_FLUSH_INTERVAL, prepare=json_columns(3)
+            )
+            self.log_sink.start()
+            self.partitions = PartitionMaintainer(
+                self.pool, {"logs": LOG_RETENTION_MONTHS},
+                months_ahead=PARTITION_MONTHS_AHEAD, archive_dir=LOG_ARCHIVE_DIR
+            )
+            self.partitions.start()
         except Exception as e:
             logger.error(f"Failed to initialize database: {e}")
             raise
     
     async def close(self):
         """Close database connection pool"""
+        if self.log_sink:
+            await self.log_sink.stop()
+            self.log_sink = None
+        if self.partitions:
+            await self.partitions.stop()
+            self.partitions = None
+        if self._listen_conn:
+            await self._listen_conn.close()
+            self._listen_conn = None
         if self.pool:
             await self.pool.close()
             logger.info("Database connection pool closed")
@@ -45,9 +96,13 @@ class DatabaseManager:
             joined_at TIMESTAMP DEFAULT NOW(),
             downloads INTEGER DEFAULT 0,
             agreed BOOLEAN DEFAULT FALSE,
-            last_active TIMESTAMP DEFAULT NOW()
+            last_active TIMESTAMP DEFAULT NOW(),
+            blocked_bot_at TIMESTAMP
         );
         
+        -- Set when a broadcast finds the user has blocked the bot; cleared on /start
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS blocked_bot_at TIMESTAMP;
+        
         CREATE TABLE IF NOT EXISTS banned_users (
             id VARCHAR PRIMARY KEY DEFAULT gen_random_uuid(),
             telegram_id VARCHAR NOT NULL UNIQUE,
@@ -68,18 +123,26 @@ class DatabaseManager:
             file_size INTEGER,
             downloads INTEGER DEFAULT 0,
             created_at TIMESTAMP DEFAULT NOW(),
-            uploaded_by VARCHAR NOT NULL
+            uploaded_by VARCHAR NOT NULL,
+            telegram_file_id TEXT,
+            file_hash TEXT
         );
         
+        ALTER TABLE textbooks ADD COLUMN IF NOT EXISTS telegram_file_id TEXT;
+        -- sha256 of the file contents; identical uploads are stored once
+        ALTER TABLE textbooks ADD COLUMN IF NOT EXISTS file_hash TEXT;
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_textbooks_file_hash ON textbooks(file_hash);
+        
         CREATE TABLE IF NOT EXISTS logs (
-            id VARCHAR PRIMARY KEY DEFAULT gen_random_uuid(),
+            id VARCHAR NOT NULL DEFAULT gen_random_uuid(),
             type TEXT NOT NULL,
             user_id VARCHAR,
             action TEXT NOT NULL,
             details JSONB,
-            timestamp TIMESTAMP DEFAULT NOW(),
-            ip_address TEXT
-        );
+            timestamp TIMESTAMP NOT NULL DEFAULT NOW(),
+            ip_address TEXT,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp);
         
         CREATE TABLE IF NOT EXISTS broadcasts (
             id VARCHAR PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -90,17 +153,172 @@ class DatabaseManager:
             sent_at TIMESTAMP DEFAULT NOW()
         );
         
+        -- Delivery state of engine-driven broadcasts (sent_to counts delivered messages)
+        ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'done';
+        ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS total INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS failed INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS blocked INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS finished_at TIMESTAMP;
+        -- Media broadcasts: {"media": [{"type": ..., "file_id": ...}]}; message is the caption template
+        ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS payload JSONB;
+        
+        -- One row per recipient; status: pending, sent, failed, blocked
+        CREATE TABLE IF NOT EXISTS broadcast_recipients (
+            broadcast_id VARCHAR NOT NULL REFERENCES broadcasts(id) ON DELETE CASCADE,
+            telegram_id VARCHAR NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            error TEXT,
+            updated_at TIMESTAMP,
+            PRIMARY KEY (broadcast_id, telegram_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_broadcast_recipients_pending
+            ON broadcast_recipients (broadcast_id, telegram_id) WHERE status = 'pending';
+        
         CREATE INDEX IF NOT EXISTS idx_users_telegram_id ON users(telegram_id);
         CREATE INDEX IF NOT EXISTS idx_banned_users_telegram_id ON banned_users(telegram_id);
         CREATE INDEX IF NOT EXISTS idx_textbooks_grade_subject ON textbooks(grade, subject);
-        CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs(timestamp);
-        CREATE INDEX IF NOT EXISTS idx_logs_type ON logs(type);
         """
         
         async with self.pool.acquire() as conn:
             await conn.execute(create_tables_sql)
+            # Installs created before partitioning get their logs moved into monthly partitions
+            await convert_to_partitioned(conn, "logs", "timestamp", PARTITION_MONTHS_AHEAD)
+            await ensure_partitions(conn, "logs", PARTITION_MONTHS_AHEAD)
+            # Keyset paging by (timestamp, id), optionally within one type
+            await conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_logs_timestamp_id ON logs (timestamp, id);
+            CREATE INDEX IF NOT EXISTS idx_logs_type_timestamp_id ON logs (type, timestamp, id);
+            """)
+            await self._ensure_stats_rollups(conn)
+            await conn.execute("""
+            CREATE OR REPLACE FUNCTION notify_access_changed() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    PERFORM pg_notify('access_changed', OLD.telegram_id);
+                ELSE
+                    PERFORM pg_notify('access_changed', NEW.telegram_id);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+            
+            DROP TRIGGER IF EXISTS access_changed ON banned_users;
+            CREATE TRIGGER access_changed
+                AFTER INSERT OR UPDATE OR DELETE ON banned_users
+                FOR EACH ROW EXECUTE FUNCTION notify_access_changed();
+            """)
             logger.info("Database tables ensured")
     
+    async def _listen_access_changes(self):
+        """Drop cached access decisions when a ban changes in any process"""
+        self._listen_conn = await asyncpg.connect(DATABASE_URL)
+        await self._listen_conn.add_listener(
+            "access_changed",
+            lambda conn, pid, channel, telegram_id: self.invalidate_access(telegram_id)
+        )
+    
+    async def _ensure_stats_rollups(self, conn: asyncpg.Connection):
+        """Create trigger-maintained rollup tables used by get_stats()"""
+        async with conn.transaction():
+            await conn.execute("""
+            CREATE TABLE IF NOT EXISTS stats_totals (
+                id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+                total_users BIGINT NOT NULL DEFAULT 0,
+                total_textbooks BIGINT NOT NULL DEFAULT 0,
+                total_downloads BIGINT NOT NULL DEFAULT 0
+            );
+            
+            CREATE TABLE IF NOT EXISTS stats_daily (
+                day DATE PRIMARY KEY,
+                active_users INTEGER NOT NULL DEFAULT 0,
+                requests INTEGER NOT NULL DEFAULT 0
+            );
+            
+            CREATE OR REPLACE FUNCTION stats_on_users() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    UPDATE stats_totals SET total_users = total_users + 1 WHERE id = 1;
+                ELSIF TG_OP = 'DELETE' THEN
+                    UPDATE stats_totals SET total_users = total_users - 1 WHERE id = 1;
+                    RETURN NULL;
+                END IF;
+                -- First activity of the day (a new user counts as active)
+                IF NEW.last_active >= CURRENT_DATE
+                   AND (TG_OP = 'INSERT' OR OLD.last_active IS NULL OR OLD.last_active < CURRENT_DATE) THEN
+                    INSERT INTO stats_daily (day, active_users) VALUES (CURRENT_DATE, 1)
+                    ON CONFLICT (day) DO UPDATE SET active_users = stats_daily.active_users + 1;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+            
+            DROP TRIGGER IF EXISTS stats_users ON users;
+            CREATE TRIGGER stats_users
+                AFTER INSERT OR DELETE OR UPDATE OF last_active ON users
+                FOR EACH ROW EXECUTE FUNCTION stats_on_users();
+            
+            CREATE OR REPLACE FUNCTION stats_on_textbooks() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    UPDATE stats_totals
+                    SET total_textbooks = total_textbooks + 1,
+                        total_downloads = total_downloads + COALESCE(NEW.downloads, 0)
+                    WHERE id = 1;
+                ELSIF TG_OP = 'DELETE' THEN
+                    UPDATE stats_totals
+                    SET total_textbooks = total_textbooks - 1,
+                        total_downloads = total_downloads - COALESCE(OLD.downloads, 0)
+                    WHERE id = 1;
+                ELSIF NEW.downloads IS DISTINCT FROM OLD.downloads THEN
+                    UPDATE stats_totals
+                    SET total_downloads = total_downloads + COALESCE(NEW.downloads, 0) - COALESCE(OLD.downloads, 0)
+                    WHERE id = 1;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+            
+            DROP TRIGGER IF EXISTS stats_textbooks ON textbooks;
+            CREATE TRIGGER stats_textbooks
+                AFTER INSERT OR DELETE OR UPDATE OF downloads ON textbooks
+                FOR EACH ROW EXECUTE FUNCTION stats_on_textbooks();
+            
+            -- One counter update per INSERT/COPY statement, not per log row
+            CREATE OR REPLACE FUNCTION stats_on_logs() RETURNS trigger AS $$
+            BEGIN
+                INSERT INTO stats_daily (day, requests)
+                SELECT COALESCE(timestamp::date, CURRENT_DATE), COUNT(*) FROM new_rows GROUP BY 1
+                ON CONFLICT (day) DO UPDATE SET requests = stats_daily.requests + EXCLUDED.requests;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+            
+            DROP TRIGGER IF EXISTS stats_logs ON logs;
+            CREATE TRIGGER stats_logs
+                AFTER INSERT ON logs
+                REFERENCING NEW TABLE AS new_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION stats_on_logs();
+            """)
+            
+            # Backfill the rollups from existing data on first run
+            initialized = await conn.fetchval("SELECT EXISTS (SELECT 1 FROM stats_totals)")
+            if not initialized:
+                await conn.execute("""
+                INSERT INTO stats_totals (id, total_users, total_textbooks, total_downloads)
+                SELECT 1,
+                    (SELECT COUNT(*) FROM users),
+                    (SELECT COUNT(*) FROM textbooks),
+                    (SELECT COALESCE(SUM(downloads), 0) FROM textbooks);
+                
+                INSERT INTO stats_daily (day, active_users, requests)
+                SELECT CURRENT_DATE,
+                    (SELECT COUNT(*) FROM users WHERE last_active >= CURRENT_DATE),
+                    (SELECT COUNT(*) FROM logs WHERE timestamp >= CURRENT_DATE)
+                ON CONFLICT (day) DO UPDATE
+                SET active_users = EXCLUDED.active_users, requests = EXCLUDED.requests;
+                """)
+                logger.info("Statistics rollups backfilled")
+    
     # User Management
     async def get_user(self, telegram_id: str) -> Optional[Dict]:
         """Get user by telegram ID"""
@@ -123,6 +341,7 @@ class DatabaseManager:
                 """,
                 telegram_id, username, first_name, last_name
             )
+            self.invalidate_access(telegram_id)
             await self.log_action("user_action", telegram_id, "user_registered", {
                 "username": username,
                 "first_name": first_name,
@@ -137,6 +356,7 @@ class DatabaseManager:
                 "UPDATE users SET agreed = TRUE, last_active = NOW() WHERE telegram_id = $1",
                 telegram_id
             )
+            self.invalidate_access(telegram_id)
             await self.log_action("user_action", telegram_id, "rules_accepted")
     
     async def update_user_activity(self, telegram_id: str) -> None:
@@ -146,7 +366,42 @@ class DatabaseManager:
                 "UPDATE users SET last_active = NOW() WHERE telegram_id = $1",
                 telegram_id
             )
-    
+
+    async def apply_activity_batch(self, last_seen: List[Tuple[str, datetime]]) -> None:
+        """
+        Write coalesced last-activity timestamps in one statement
+
+        last_seen holds (telegram_id, seen_at) pairs sorted by telegram_id;
+        a newer timestamp already in the table is never overwritten.
+        """
+        if not last_seen:
+            return
+
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                """
+                UPDATE users AS u
+                SET last_active = v.seen
+                FROM unnest($1::varchar[], $2::timestamptz[]) AS v(telegram_id, seen)
+                WHERE u.telegram_id = v.telegram_id
+                AND (u.last_active IS NULL OR u.last_active < v.seen)
+                """,
+                [telegram_id for telegram_id, _ in last_seen],
+                [seen for _, seen in last_seen]
+            )
+
+    async def get_active_today(self) -> List[Tuple[str, datetime]]:
+        """Users active since midnight as (telegram_id, last_active), oldest first"""
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT telegram_id, last_active FROM users
+                WHERE last_active >= CURRENT_DATE
+                ORDER BY last_active
+                """
+            )
+            return [(row["telegram_id"], row["last_active"]) for row in rows]
+
     async def increment_user_downloads(self, telegram_id: str) -> None:
         """Increment user download count"""
         async with self.pool.acquire() as conn:
@@ -169,6 +424,75 @@ class DatabaseManager:
             )
             return dict(row) if row else None
     
+    async def check_access(self, telegram_id: str) -> Dict:
+        """
+        Access decision for a user in one round trip:
+        {"ban": ban row or None, "agreed": bool, "user": user row or None}
+        
+        Active ban, agreement flag and user row come from a single statement.
+        Decisions are cached for ACCESS_CACHE_TTL seconds (never past the ban
+        expiry); last_active is recorded separately by ActivityTracker.
+        A decision read while an invalidation happened is returned but not
+        cached, so a ban or agreement made during the query is not masked.
+        """
+        now = time.monotonic()
+        cached = self._access_cache.get(telegram_id)
+        if cached and cached[0] > now:
+            self._access_cache.move_to_end(telegram_id)
+            return cached[1]
+        
+        generation = self._access_generation
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow(
+                """
+                WITH ban AS (
+                    SELECT reason, banned_until, banned_at, banned_by FROM banned_users
+                    WHERE telegram_id = $1
+                    AND (banned_until IS NULL OR banned_until > NOW())
+                )
+                SELECT u.*,
+                       ban.reason AS ban_reason, ban.banned_until AS ban_until,
+                       ban.banned_at AS ban_at, ban.banned_by AS ban_by,
+                       ban.reason IS NOT NULL AS is_banned
+                FROM (SELECT $1::varchar AS telegram_id) k
+                LEFT JOIN users u ON u.telegram_id = k.telegram_id
+                LEFT JOIN ban ON TRUE
+                """,
+                telegram_id
+            )
+        
+        data = dict(row)
+        ban = None
+        if data.pop("is_banned"):
+            ban = {
+                "telegram_id": telegram_id,
+                "reason": data.pop("ban_reason"),
+                "banned_until": data.pop("ban_until"),
+                "banned_at": data.pop("ban_at"),
+                "banned_by": data.pop("ban_by")
+            }
+        else:
+            for key in ("ban_reason", "ban_until", "ban_at", "ban_by"):
+                data.pop(key)
+        user = data if data.get("id") is not None else None
+        decision = {"ban": ban, "agreed": bool(user and user["agreed"]), "user": user}
+        if generation != self._access_generation:
+            return decision
+        
+        expires_at = now + ACCESS_CACHE_TTL
+        if ban and ban["banned_until"]:
+            expires_at = min(expires_at, now + (ban["banned_until"] - datetime.now()).total_seconds())
+        self._access_cache[telegram_id] = (expires_at, decision)
+        self._access_cache.move_to_end(telegram_id)
+        if len(self._access_cache) > ACCESS_CACHE_SIZE:
+            self._access_cache.popitem(last=False)
+        return decision
+    
+    def invalidate_access(self, telegram_id: str) -> None:
+        """Forget the cached access decision for a user"""
+        self._access_generation += 1
+        self._access_cache.pop(telegram_id, None)
+    
     async def ban_user(self, telegram_id: str, reason: str, days: int = None, banned_by: str = None) -> None:
         """Ban user"""
         banned_until = None
@@ -185,6 +509,7 @@ class DatabaseManager:
                 """,
                 telegram_id, reason, banned_until, banned_by or "system"
             )
+            self.invalidate_access(telegram_id)
             await self.log_action("ban", telegram_id, "user_banned", {
                 "reason": reason,
                 "days": days,
@@ -198,6 +523,7 @@ class DatabaseManager:
                 "DELETE FROM banned_users WHERE telegram_id = $1",
                 telegram_id
             )
+            self.invalidate_access(telegram_id)
             if result == "DELETE 1":
                 await self.log_action("admin_action", telegram_id, "user_unbanned")
                 return True
@@ -239,6 +565,22 @@ class DatabaseManager:
                 textbook_id
             )
     
+    async def set_textbook_file_id(self, textbook_id: str, file_id: str) -> None:
+        """Store Telegram file_id received after the first upload"""
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                "UPDATE textbooks SET telegram_file_id = $2 WHERE id = $1",
+                textbook_id, file_id
+            )
+    
+    async def clear_textbook_file_id(self, textbook_id: str) -> None:
+        """Drop a stale Telegram file_id so the next send re-uploads the file"""
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                "UPDATE textbooks SET telegram_file_id = NULL WHERE id = $1",
+                textbook_id
+            )
+    
     async def get_subjects_by_grade(self, grade: str) -> List[str]:
         """Get unique subjects for a grade"""
         async with self.pool.acquire() as conn:
@@ -249,64 +591,65 @@ class DatabaseManager:
             return [row['subject'] for row in rows]
     
     # Statistics
-    async def get_stats(self) -> Dict:
-        """Get system statistics"""
+    async def get_stats(self, use_cache: bool = True) -> Dict:
+        """Get system statistics (one rollup read, cached for STATS_CACHE_TTL seconds)"""
+        now = time.monotonic()
+        if use_cache and self._stats_cache and self._stats_cache[0] > now:
+            return dict(self._stats_cache[1])
+        
         async with self.pool.acquire() as conn:
-            # Total users
-            total_users = await conn.fetchval("SELECT COUNT(*) FROM users")
-            
-            # Total textbooks
-            total_textbooks = await conn.fetchval("SELECT COUNT(*) FROM textbooks")
-            
-            # Active today
-            active_today = await conn.fetchval(
-                "SELECT COUNT(*) FROM users WHERE last_active >= CURRENT_DATE"
+            row = await conn.fetchrow(
+                """
+                SELECT t.total_users, t.total_textbooks, t.total_downloads,
+                       COALESCE(d.active_users, 0) AS active_today,
+                       COALESCE(d.requests, 0) AS requests_today
+                FROM stats_totals t
+                LEFT JOIN stats_daily d ON d.day = CURRENT_DATE
+                WHERE t.id = 1
+                """
             )
-            
-            # Total downloads
-            total_downloads = await conn.fetchval(
-                "SELECT COALESCE(SUM(downloads), 0) FROM textbooks"
-            ) or 0
-            
-            # Requests today
-            requests_today = await conn.fetchval(
-                "SELECT COUNT(*) FROM logs WHERE timestamp >= CURRENT_DATE"
-            ) or 0
-            
-            return {
-                "total_users": total_users,
-                "total_textbooks": total_textbooks,
-                "active_today": active_today,
-                "total_downloads": total_downloads,
-                "requests_today": requests_today
-            }
+        
+        stats = {
+            "total_users": row["total_users"] if row else 0,
+            "total_textbooks": row["total_textbooks"] if row else 0,
+            "active_today": row["active_today"] if row else 0,
+            "total_downloads": row["total_downloads"] if row else 0,
+            "requests_today": row["requests_today"] if row else 0
+        }
+        self._stats_cache = (now + STATS_CACHE_TTL, stats)
+        return dict(stats)
     
     # Logging
     async def log_action(self, log_type: str, user_id: str = None, action: str = "", 
                         details: Dict = None, ip_address: str = None) -> None:
-        """Log an action"""
-        async with self.pool.acquire() as conn:
-            await conn.execute(
-                """
-                INSERT INTO logs (type, user_id, action, details, ip_address)
-                VALUES ($1, $2, $3, $4, $5)
-                """,
-                log_type, user_id, action, json.dumps(details) if details else None, ip_address
-            )
+        """Queue an action for the background log writer (does not wait for the insert)"""
+        await self.log_sink.put((log_type, user_id, action, details or None, ip_address))
     
-    async def get_recent_logs(self, limit: int = 50, log_type: str = None) -> List[Dict]:
-        """Get recent logs"""
+    async def get_recent_logs(self, limit: int = 50, log_type: str = None,
+                              before: Optional[Tuple[datetime, str]] = None) -> List[Dict]:
+        """
+        Get logs newest first, one page at a time
+
+        Pass the (timestamp, id) of the last row of a page as `before` to get
+        the next, older page. Each page is an index range scan from the cursor,
+        so deep pages cost the same as the first one.
+        """
+        conditions = []
+        args: List[Any] = []
+        if log_type:
+            args.append(log_type)
+            conditions.append(f"type = ${len(args)}")
+        if before:
+            args.extend(before)
+            conditions.append(f"(timestamp, id) < (${len(args) - 1}, ${len(args)})")
+        args.append(limit)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        
         async with self.pool.acquire() as conn:
-            if log_type:
-                rows = await conn.fetch(
-                    "SELECT * FROM logs WHERE type = $1 ORDER BY timestamp DESC LIMIT $2",
-                    log_type, limit
-                )
-            else:
-                rows = await conn.fetch(
-                    "SELECT * FROM logs ORDER BY timestamp DESC LIMIT $1",
-                    limit
-                )
+            rows = await conn.fetch(
+                f"SELECT * FROM logs {where} ORDER BY timestamp DESC, id DESC LIMIT ${len(args)}",
+                *args
+            )
             return [dict(row) for row in rows]
     
     # Broadcast
@@ -331,8 +674,156 @@ class DatabaseManager:
     async def get_all_user_ids(self) -> List[str]:
         """Get all user telegram IDs for broadcasting"""
         async with self.pool.acquire() as conn:
-            rows = await conn.fetch("SELECT telegram_id FROM users WHERE agreed = TRUE")
+            rows = await conn.fetch(
+                "SELECT telegram_id FROM users WHERE agreed = TRUE AND blocked_bot_at IS NULL"
+            )
             return [row['telegram_id'] for row in rows]
+    
+    async def create_broadcast(self, message: str, sent_by: str, image_url: str = None,
+                               payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Create a broadcast and its recipient list in one transaction.
+        
+        The audience is every agreed user who has not blocked the bot, fixed
+        at creation time so a resumed broadcast reaches exactly the same people.
+        payload describes attached media (Telegram file_ids, reused for everyone).
+        """
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                broadcast_id = await conn.fetchval(
+                    """
+                    INSERT INTO broadcasts (message, image_url, sent_to, sent_by, status, payload)
+                    VALUES ($1, $2, 0, $3, 'running', $4::jsonb)
+                    RETURNING id
+                    """,
+                    message, image_url, sent_by,
+                    json.dumps(payload, ensure_ascii=False) if payload else None
+                )
+                total = await conn.fetchval(
+                    """
+                    WITH added AS (
+                        INSERT INTO broadcast_recipients (broadcast_id, telegram_id)
+                        SELECT $1, telegram_id FROM users
+                        WHERE agreed = TRUE AND blocked_bot_at IS NULL
+                        RETURNING 1
+                    )
+                    UPDATE broadcasts SET total = (SELECT COUNT(*) FROM added)
+                    WHERE id = $1
+                    RETURNING total
+                    """,
+                    broadcast_id
+                )
+        await self.log_action("admin_action", sent_by, "broadcast_created", {
+            "broadcast_id": broadcast_id,
+            "message_length": len(message),
+            "total": total,
+            "has_image": bool(image_url)
+        })
+        return await self.get_broadcast(broadcast_id)
+    
+    async def get_broadcast(self, broadcast_id: str) -> Optional[Dict[str, Any]]:
+        """Get broadcast with its delivery counters (payload decoded)"""
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow("SELECT * FROM broadcasts WHERE id = $1", broadcast_id)
+        if row is None:
+            return None
+        broadcast = dict(row)
+        if isinstance(broadcast.get("payload"), str):
+            broadcast["payload"] = json.loads(broadcast["payload"])
+        return broadcast
+    
+    async def get_unfinished_broadcasts(self) -> List[Dict[str, Any]]:
+        """Broadcasts that were running when the bot stopped"""
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT * FROM broadcasts WHERE status = 'running' ORDER BY sent_at"
+            )
+            return [dict(row) for row in rows]
+    
+    async def get_pending_recipients(self, broadcast_id: str, after: Optional[str] = None,
+                                     limit: int = 1000) -> List[Dict[str, Any]]:
+        """
+        Next page of recipients not yet processed, in telegram_id order after `after`.
+        
+        Rows carry the fields available to caption templates
+        (telegram_id, first_name, last_name, username).
+        """
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT r.telegram_id, u.first_name, u.last_name, u.username
+                FROM broadcast_recipients r
+                LEFT JOIN users u ON u.telegram_id = r.telegram_id
+                WHERE r.broadcast_id = $1 AND r.status = 'pending'
+                AND ($2::varchar IS NULL OR r.telegram_id > $2)
+                ORDER BY r.telegram_id
+                LIMIT $3
+                """,
+                broadcast_id, after, limit
+            )
+            return [dict(row) for row in rows]
+    
+    async def save_broadcast_progress(self, broadcast_id: str,
+                                      results: List[Tuple[str, str, Optional[str]]]) -> None:
+        """
+        Record a batch of delivery results (telegram_id, status, error).
+        
+        Only pending rows change, so a result reported twice (e.g. after a
+        restart) is not counted twice. Users who blocked the bot are flagged
+        and left out of future audiences.
+        """
+        if not results:
+            return
+        telegram_ids, statuses, errors = (list(column) for column in zip(*results))
+        blocked_ids = [tid for tid, status, _ in results if status == "blocked"]
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    """
+                    WITH updated AS (
+                        UPDATE broadcast_recipients r
+                        SET status = u.status, error = u.error, updated_at = NOW()
+                        FROM unnest($2::varchar[], $3::text[], $4::text[]) AS u(telegram_id, status, error)
+                        WHERE r.broadcast_id = $1 AND r.telegram_id = u.telegram_id
+                        AND r.status = 'pending'
+                        RETURNING r.status
+                    )
+                    UPDATE broadcasts SET
+                        sent_to = sent_to + (SELECT COUNT(*) FROM updated WHERE status = 'sent'),
+                        failed = failed + (SELECT COUNT(*) FROM updated WHERE status = 'failed'),
+                        blocked = blocked + (SELECT COUNT(*) FROM updated WHERE status = 'blocked')
+                    WHERE id = $1
+                    """,
+                    broadcast_id, telegram_ids, statuses, errors
+                )
+                if blocked_ids:
+                    await conn.execute(
+                        """
+                        UPDATE users SET blocked_bot_at = NOW()
+                        WHERE telegram_id = ANY($1::varchar[]) AND blocked_bot_at IS NULL
+                        """,
+                        blocked_ids
+                    )
+    
+    async def set_broadcast_status(self, broadcast_id: str, status: str) -> None:
+        """Set broadcast status: running, paused, done or cancelled"""
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                """
+                UPDATE broadcasts SET status = $2,
+                    finished_at = CASE WHEN $2 IN ('done', 'cancelled') THEN NOW() END
+                WHERE id = $1
+                """,
+                broadcast_id, status
+            )
+    
+    async def clear_bot_blocked(self, telegram_id: str) -> None:
+        """User is talking to the bot again - include them in broadcasts"""
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                "UPDATE users SET blocked_bot_at = NULL WHERE telegram_id = $1 AND blocked_bot_at IS NOT NULL",
+                telegram_id
+            )
 
 # Global database instance
 db = DatabaseManager()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Отложенная запись счетчиков скачиваний для Telegram бота RUУчебник
+Скачивания накапливаются в памяти и записываются в базу одной транзакцией
+
+Автор: Разработано для системы RUУчебник
+Версия: 1.0.0
+"""
+
+import asyncio
+import logging
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import BOT_CONFIG
+from database import DatabaseManager
+
+
+class DownloadCounters:
+    """
+    Агрегатор скачиваний с отложенной записью (write-behind)
+
+    Вместо пяти последовательных запросов на каждое скачивание обработчик
+    вызывает record() без обращения к базе. Приращения суммируются по
+    учебникам и пользователям, поэтому горячая строка популярного учебника
+    обновляется один раз за сброс, а не на каждое скачивание.
+
+    Сброс выполняется каждые flush_interval секунд, при накоплении
+    flush_threshold событий и при остановке. Если запись не удалась,
+    данные возвращаются в буфер и будут записаны при следующем сбросе.
+    """
+
+    def __init__(self, db: DatabaseManager, flush_interval: Optional[float] = None,
+                 flush_threshold: Optional[int] = None):
+        """
+        Args:
+            db: Экземпляр менеджера базы данных
+            flush_interval: Максимальный интервал между сбросами в секундах
+            flush_threshold: Число событий, после которого сброс выполняется досрочно
+        """
+        self.db = db
+        self.flush_interval = flush_interval or BOT_CONFIG.get('downloads_flush_interval', 5)
+        self.flush_threshold = flush_threshold or BOT_CONFIG.get('downloads_flush_threshold', 200)
+        self.logger = logging.getLogger(__name__)
+
+        self._textbook_deltas: Counter = Counter()
+        self._user_deltas: Counter = Counter()
+        self._downloads: List[Tuple[str, str, Optional[str]]] = []
+
+        self._flush_needed = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        """Количество скачиваний, еще не записанных в базу"""
+        return len(self._downloads)
+
+    def record(self, telegram_id: int, textbook_id: str,
+               details: Optional[Dict[str, Any]] = None,
+               ip_address: Optional[str] = None) -> None:
+        """
+        Регистрация скачивания (без обращения к базе данных)
+
+        Args:
+            telegram_id: ID пользователя в Telegram
+            textbook_id: ID учебника
+            details: Детали для системного лога (если не указаны - событие не пишется;
+                     событие уходит в очередь журнала, а не в транзакцию счетчиков)
+            ip_address: IP адрес (опционально)
+        """
+        self._textbook_deltas[textbook_id] += 1
+        self._user_deltas[str(telegram_id)] += 1
+        self._downloads.append((str(telegram_id), textbook_id, ip_address))
+
+        if details is not None:
+            self.db.enqueue_system_event("info", "textbook_downloaded", details, str(telegram_id))
+
+        if len(self._downloads) >= self.flush_threshold:
+            self._flush_needed.set()
+
+    def _take_batch(self) -> Dict[str, Any]:
+        """Забрать накопленные данные, оставив буферы пустыми"""
+        batch = {
+            'textbook_deltas': self._textbook_deltas,
+            'user_deltas': self._user_deltas,
+            'downloads': self._downloads
+        }
+        self._textbook_deltas = Counter()
+        self._user_deltas = Counter()
+        self._downloads = []
+        return batch
+
+    def _restore_batch(self, batch: Dict[str, Any]) -> None:
+        """Вернуть незаписанные данные в буферы (перед новыми событиями)"""
+        self._textbook_deltas.update(batch['textbook_deltas'])
+        self._user_deltas.update(batch['user_deltas'])
+        self._downloads[:0] = batch['downloads']
+
+    async def flush(self) -> int:
+        """
+        Запись накопленных скачиваний в базу данных
+
+        Returns:
+            int: Количество записанных скачиваний
+        """
+        async with self._flush_lock:
+            self._flush_needed.clear()
+            if not self._downloads and not self._textbook_deltas:
+                return 0
+
+            batch = self._take_batch()
+            try:
+                await self.db.apply_download_batch(**batch)
+            except asyncio.CancelledError:
+                self._restore_batch(batch)
+                raise
+            except Exception as e:
+                self._restore_batch(batch)
+                self.logger.error(f"❌ Ошибка записи счетчиков скачиваний "
+                                  f"({len(batch['downloads'])} в буфере): {e}")
+                raise
+
+            self.logger.debug(f"📥 Записано скачиваний: {len(batch['downloads'])}, "
+                              f"учебников: {len(batch['textbook_deltas'])}")
+            return len(batch['downloads'])
+
+    async def _run(self) -> None:
+        """Фоновый цикл сброса по таймеру или по порогу"""
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_needed.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            try:
+                await self.flush()
+            except Exception:
+                # Ошибка уже залогирована, данные остались в буфере
+                await asyncio.sleep(self.flush_interval)
+
+    def start(self) -> None:
+        """Запуск фоновой записи"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            self.logger.info(f"📥 Отложенная запись скачиваний: каждые {self.flush_interval} с "
+                             f"или {self.flush_threshold} событий")
+
+    async def stop(self) -> None:
+        """Остановка фоновой записи и финальный сброс"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        try:
+            await self.flush()
+        except Exception:
+            self.logger.error(f"❌ При остановке не записано скачиваний: {self.pending}")
@@ -13,18 +13,27 @@ from typing import Dict, Any, Optional
 from datetime import datetime
 
 from aiogram import Dispatcher, F
-from aiogram.types import Message, CallbackQuery, FSInputFile, BufferedInputFile
-from aiogram.filters import Command, StateFilter
+from aiogram.types import (
+    Message, CallbackQuery, FSInputFile, BufferedInputFile,
+    InlineQuery, ChosenInlineResult, InlineQueryResultUnion,
+    InlineQueryResultCachedDocument, InlineQueryResultArticle, InputTextMessageContent
+)
+from aiogram.filters import Command, CommandObject, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.exceptions import TelegramBadRequest
 
-from config import MESSAGES, KEYBOARD_TEXTS, CLASSES, SUBJECTS, CALLBACK_PATTERNS, FILE_CONFIG
+from config import BOT_CONFIG, MESSAGES, KEYBOARD_TEXTS, CLASSES, SUBJECTS, CALLBACK_PATTERNS, FILE_CONFIG
 from keyboards import (
     get_main_keyboard, get_classes_keyboard, get_subjects_keyboard, 
-    get_textbooks_keyboard, get_textbook_details_keyboard, get_back_keyboard
+    get_textbooks_keyboard, get_textbook_details_keyboard, get_back_keyboard,
+    get_inline_textbook_keyboard
 )
-from utils import format_file_size, is_rate_limited, log_user_action
+from utils import format_file_size, log_user_action
 from database import DatabaseManager
+from download_counters import DownloadCounters
+from activity_tracker import ActivityTracker
+from rate_limiter import RateLimitMiddleware
 
 
 # Определение состояний для FSM (Finite State Machine)
@@ -40,14 +49,36 @@ class BotStates(StatesGroup):
 logger = logging.getLogger(__name__)
 
 
+def format_textbook_caption(textbook: Dict[str, Any]) -> str:
+    """Подпись к файлу учебника"""
+    return (f"📖 <b>{textbook['title']}</b>\n"
+            f"👤 <b>Автор:</b> {textbook.get('author_name', 'Неизвестный автор')}\n"
+            f"🎓 <b>Класс:</b> {textbook.get('class_name', '')}\n"
+            f"📚 <b>Предмет:</b> {textbook.get('subject_name', '')}")
+
+
+def format_textbook_info(textbook: Dict[str, Any]) -> str:
+    """Карточка учебника с размером файла и числом скачиваний"""
+    return MESSAGES['search_textbook_info'].format(
+        title=textbook['title'],
+        author=textbook.get('author_short_name') or textbook.get('author_name', 'Неизвестный автор'),
+        class_name=textbook.get('class_name', 'Неизвестный класс'),
+        subject_name=textbook.get('subject_name', 'Неизвестный предмет'),
+        file_size=format_file_size(textbook.get('file_size', 0)),
+        downloads=textbook.get('download_count', 0)
+    )
+
+
 # =============================================================================
 # БАЗОВЫЕ КОМАНДЫ БОТА
 # =============================================================================
 
-async def cmd_start(message: Message, state: FSMContext, db: DatabaseManager):
+async def cmd_start(message: Message, state: FSMContext, db: DatabaseManager,
+                    command: Optional[CommandObject] = None):
     """
     Обработчик команды /start
     Приветствие пользователя и создание записи в БД
+    Ссылка вида /start textbook_<id> (из inline-режима) сразу открывает учебник
     """
     user = message.from_user
     if not user:
@@ -86,6 +117,21 @@ async def cmd_start(message: Message, state: FSMContext, db: DatabaseManager):
         # Устанавливаем состояние главного меню
         await state.set_state(BotStates.main_menu)
         
+        # Переход по ссылке из inline-результата
+        if command and command.args and command.args.startswith('textbook_'):
+            textbook_id = command.args.replace('textbook_', '', 1)
+            textbook = await db.get_textbook(textbook_id)
+            if textbook:
+                await message.answer(
+                    format_textbook_info(textbook),
+                    reply_markup=get_textbook_details_keyboard(textbook_id),
+                    parse_mode='HTML'
+                )
+                await state.update_data(selected_textbook=textbook)
+                await state.set_state(BotStates.viewing_textbook)
+            else:
+                await message.answer(MESSAGES['error_file_not_found'])
+        
         logger.info(f"👤 Пользователь {user.id} (@{user.username}) запустил бота")
         
     except Exception as e:
@@ -93,7 +139,8 @@ async def cmd_start(message: Message, state: FSMContext, db: DatabaseManager):
         await message.answer(MESSAGES['error_general'])
 
 
-async def cmd_help(message: Message, db: DatabaseManager):
+async def cmd_help(message: Message, db: DatabaseManager,
+                   activity: ActivityTracker):
     """
     Обработчик команды /help
     Показывает подробную справку по использованию бота
@@ -108,7 +155,7 @@ async def cmd_help(message: Message, db: DatabaseManager):
             return
         
         # Обновляем активность пользователя
-        await db.update_user_activity(user.id)
+        activity.touch(user.id)
         
         # Отправляем справку
         await message.answer(
@@ -124,7 +171,8 @@ async def cmd_help(message: Message, db: DatabaseManager):
         await message.answer(MESSAGES['error_general'])
 
 
-async def cmd_about(message: Message, db: DatabaseManager):
+async def cmd_about(message: Message, db: DatabaseManager,
+                    activity: ActivityTracker):
     """
     Обработчик команды /about  
     Показывает информацию о проекте и статистику
@@ -149,7 +197,7 @@ async def cmd_about(message: Message, db: DatabaseManager):
         )
         
         # Обновляем активность
-        await db.update_user_activity(user.id)
+        activity.touch(user.id)
         
         await message.answer(
             about_text,
@@ -164,7 +212,8 @@ async def cmd_about(message: Message, db: DatabaseManager):
         await message.answer(MESSAGES['error_general'])
 
 
-async def cmd_search(message: Message, state: FSMContext, db: DatabaseManager):
+async def cmd_search(message: Message, state: FSMContext, db: DatabaseManager,
+                     activity: ActivityTracker):
     """
     Обработчик команды /search
     Начинает процесс поиска учебников
@@ -174,14 +223,10 @@ async def cmd_search(message: Message, state: FSMContext, db: DatabaseManager):
         return
     
     try:
-        # Проверяем блокировку и лимиты
+        # Проверяем блокировку (лимиты проверяет RateLimitMiddleware)
         if await db.is_user_blocked(user.id):
             return
         
-        if await is_rate_limited(user.id):
-            await message.answer(MESSAGES['error_rate_limit'])
-            return
-        
         # Получаем список классов
         classes = await db.get_classes()
         
@@ -199,7 +244,7 @@ async def cmd_search(message: Message, state: FSMContext, db: DatabaseManager):
         await state.set_state(BotStates.selecting_class)
         
         # Обновляем активность
-        await db.update_user_activity(user.id)
+        activity.touch(user.id)
         
         logger.info(f"🔍 Пользователь {user.id} начал поиск учебников")
         
@@ -212,7 +257,8 @@ async def cmd_search(message: Message, state: FSMContext, db: DatabaseManager):
 # ОБРАБОТЧИКИ CALLBACK ЗАПРОСОВ  
 # =============================================================================
 
-async def process_class_selection(callback: CallbackQuery, state: FSMContext, db: DatabaseManager):
+async def process_class_selection(callback: CallbackQuery, state: FSMContext, db: DatabaseManager,
+                                  activity: ActivityTracker):
     """
     Обработка выбора класса пользователем
     """
@@ -252,7 +298,7 @@ async def process_class_selection(callback: CallbackQuery, state: FSMContext, db
         await callback.answer()
         
         # Обновляем активность
-        await db.update_user_activity(user.id)
+        activity.touch(user.id)
         
         logger.info(f"🎓 Пользователь {user.id} выбрал класс: {class_name}")
         
@@ -261,7 +307,8 @@ async def process_class_selection(callback: CallbackQuery, state: FSMContext, db
         await callback.answer(MESSAGES['error_general'], show_alert=True)
 
 
-async def process_subject_selection(callback: CallbackQuery, state: FSMContext, db: DatabaseManager):
+async def process_subject_selection(callback: CallbackQuery, state: FSMContext, db: DatabaseManager,
+                                    activity: ActivityTracker):
     """
     Обработка выбора предмета пользователем
     """
@@ -279,8 +326,9 @@ async def process_subject_selection(callback: CallbackQuery, state: FSMContext,
         state_data = await state.get_data()
         class_name = state_data.get('selected_class_name', f'Класс {class_id}')
         
-        # Получаем учебники для выбранного класса и предмета
-        textbooks = await db.get_textbooks(class_id, subject_id)
+        # Первая страница учебников для выбранного класса и предмета
+        page_size = BOT_CONFIG.get('textbooks_page_size', 10)
+        textbooks, has_next = await db.get_textbooks_page(class_id, subject_id, page_size=page_size)
         
         if not textbooks:
             await callback.message.edit_text(
@@ -292,28 +340,34 @@ async def process_subject_selection(callback: CallbackQuery, state: FSMContext,
         # Получаем название предмета
         subject_name = textbooks[0]['subject_name'] if textbooks else 'Неизвестный предмет'
         
-        # Отправляем список учебников
+        # Число страниц нужно только для подписи, считаем его один раз на предмет
+        total_pages = 1
+        if has_next:
+            total_pages = -(-await db.count_textbooks(class_id, subject_id) // page_size)
+        
+        # Отправляем первую страницу списка учебников
         await callback.message.edit_text(
             MESSAGES['search_select_textbook'].format(
                 subject_name=subject_name,
                 class_name=class_name
             ),
-            reply_markup=get_textbooks_keyboard(textbooks, class_id),
+            reply_markup=get_textbooks_keyboard(textbooks, class_id, 1, total_pages, has_next=has_next),
             parse_mode='HTML'
         )
         
-        # Обновляем состояние
+        # Обновляем состояние (сами учебники не храним - страницы читаются по курсору)
         await state.update_data(
+            selected_class_id=class_id,
             selected_subject_id=subject_id, 
             selected_subject_name=subject_name,
-            textbooks=textbooks
+            textbooks_total_pages=total_pages
         )
         await state.set_state(BotStates.viewing_textbooks)
         
         await callback.answer()
         
         # Обновляем активность
-        await db.update_user_activity(user.id)
+        activity.touch(user.id)
         
         logger.info(f"📚 Пользователь {user.id} выбрал предмет: {subject_name} для {class_name}")
         
@@ -322,7 +376,79 @@ async def process_subject_selection(callback: CallbackQuery, state: FSMContext,
         await callback.answer(MESSAGES['error_general'], show_alert=True)
 
 
-async def process_textbook_selection(callback: CallbackQuery, state: FSMContext, db: DatabaseManager):
+async def process_textbooks_page(callback: CallbackQuery, state: FSMContext, db: DatabaseManager,
+                                 activity: ActivityTracker):
+    """
+    Перелистывание списка учебников
+    
+    callback_data: tbp_<страница>_<a|b><id учебника> - страница после (a)
+    или перед (b) учебником; класс и предмет берутся из состояния.
+    """
+    user = callback.from_user
+    if not user:
+        return
+    
+    try:
+        _, page, cursor = callback.data.split('_', 2)
+        page = int(page)
+        backward = cursor[0] == 'b'
+        
+        state_data = await state.get_data()
+        class_id = state_data.get('selected_class_id')
+        subject_id = state_data.get('selected_subject_id')
+        if not class_id or not subject_id:
+            await callback.answer(MESSAGES['error_general'], show_alert=True)
+            return
+        
+        page_size = BOT_CONFIG.get('textbooks_page_size', 10)
+        textbooks, has_more = await db.get_textbooks_page(
+            class_id, subject_id, cursor[1:], backward, page_size
+        )
+        if not textbooks:
+            # Учебник-курсор удален - начинаем список сначала
+            page, backward = 1, False
+            textbooks, has_more = await db.get_textbooks_page(class_id, subject_id, page_size=page_size)
+            if not textbooks:
+                await callback.message.edit_text(
+                    MESSAGES['error_no_textbooks'],
+                    reply_markup=get_back_keyboard()
+                )
+                return
+        
+        # В направлении листания has_more - наличие следующей страницы в нем же,
+        # страница в обратную сторону есть всегда, кроме первой
+        if backward:
+            has_prev, has_next = has_more, True
+            if not has_prev:
+                page = 1
+        else:
+            has_prev, has_next = page > 1, has_more
+        
+        await callback.message.edit_reply_markup(
+            reply_markup=get_textbooks_keyboard(
+                textbooks, class_id, page, state_data.get('textbooks_total_pages', page),
+                has_prev=has_prev, has_next=has_next
+            )
+        )
+        await callback.answer()
+        
+        activity.touch(user.id)
+        
+    except TelegramBadRequest:
+        # Повторное нажатие: клавиатура не изменилась
+        await callback.answer()
+    except Exception as e:
+        logger.error(f"❌ Ошибка при перелистывании учебников пользователем {user.id}: {e}")
+        await callback.answer(MESSAGES['error_general'], show_alert=True)
+
+
+async def process_pagination_info(callback: CallbackQuery):
+    """Нажатие на номер страницы - ничего не делаем"""
+    await callback.answer()
+
+
+async def process_textbook_selection(callback: CallbackQuery, state: FSMContext, db: DatabaseManager,
+                                     activity: ActivityTracker):
     """
     Обработка выбора конкретного учебника
     """
@@ -341,18 +467,8 @@ async def process_textbook_selection(callback: CallbackQuery, state: FSMContext,
             await callback.answer(MESSAGES['error_file_not_found'], show_alert=True)
             return
         
-        # Форматируем размер файла
-        file_size_str = format_file_size(textbook.get('file_size', 0))
-        
         # Формируем информационное сообщение
-        info_text = MESSAGES['search_textbook_info'].format(
-            title=textbook['title'],
-            author=textbook.get('author_short_name') or textbook.get('author_name', 'Неизвестный автор'),
-            class_name=textbook.get('class_name', 'Неизвестный класс'),
-            subject_name=textbook.get('subject_name', 'Неизвестный предмет'),
-            file_size=file_size_str,
-            downloads=textbook.get('download_count', 0)
-        )
+        info_text = format_textbook_info(textbook)
         
         # Отправляем информацию с кнопкой скачивания
         await callback.message.edit_text(
@@ -368,7 +484,7 @@ async def process_textbook_selection(callback: CallbackQuery, state: FSMContext,
         await callback.answer()
         
         # Обновляем активность
-        await db.update_user_activity(user.id)
+        activity.touch(user.id)
         
         logger.info(f"📖 Пользователь {user.id} просматривает учебник: {textbook['title']}")
         
@@ -377,7 +493,8 @@ async def process_textbook_selection(callback: CallbackQuery, state: FSMContext,
         await callback.answer(MESSAGES['error_general'], show_alert=True)
 
 
-async def process_textbook_download(callback: CallbackQuery, state: FSMContext, db: DatabaseManager):
+async def process_textbook_download(callback: CallbackQuery, state: FSMContext, db: DatabaseManager,
+                                    downloads: DownloadCounters):
     """
     Обработка скачивания учебника
     """
@@ -386,50 +503,65 @@ async def process_textbook_download(callback: CallbackQuery, state: FSMContext,
         return
     
     try:
-        # Проверяем лимиты
-        if await is_rate_limited(user.id):
-            await callback.answer(MESSAGES['error_rate_limit'], show_alert=True)
-            return
-        
         # Извлекаем ID учебника
         textbook_id = callback.data.replace('download_', '')
         
         # Получаем информацию об учебнике
         textbook = await db.get_textbook(textbook_id)
         
-        if not textbook or not os.path.exists(textbook['file_path']):
+        if not textbook:
+            await callback.answer(MESSAGES['error_file_not_found'], show_alert=True)
+            return
+        
+        # file_id от предыдущей загрузки позволяет не отправлять файл повторно
+        cached_file_id = textbook.get('telegram_file_id')
+        
+        if not cached_file_id and not os.path.exists(textbook['file_path']):
             await callback.answer(MESSAGES['error_file_not_found'], show_alert=True)
             return
         
         # Уведомляем о начале скачивания
         await callback.answer(MESSAGES['success_download_started'])
         
-        # Отправляем "печатающий" статус
-        await callback.message.answer_chat_action('upload_document')
-        
         try:
-            # Отправляем файл
-            file_to_send = FSInputFile(textbook['file_path'])
+            caption = format_textbook_caption(textbook)
+            sent_message = None
             
-            await callback.message.answer_document(
-                document=file_to_send,
-                caption=f"📖 <b>{textbook['title']}</b>\n"
-                       f"👤 <b>Автор:</b> {textbook.get('author_name', 'Неизвестный автор')}\n"
-                       f"🎓 <b>Класс:</b> {textbook.get('class_name', '')}\n"
-                       f"📚 <b>Предмет:</b> {textbook.get('subject_name', '')}",
-                parse_mode='HTML'
-            )
+            if cached_file_id:
+                try:
+                    sent_message = await callback.message.answer_document(
+                        document=cached_file_id,
+                        caption=caption,
+                        parse_mode='HTML'
+                    )
+                except TelegramBadRequest as stale_error:
+                    # Telegram не принял сохраненный file_id - загружаем файл заново
+                    logger.warning(f"⚠️ file_id учебника {textbook_id} отклонен: {stale_error}")
+                    await db.clear_textbook_file_id(textbook_id)
+                    
+                    if not os.path.exists(textbook['file_path']):
+                        await callback.message.answer(MESSAGES['error_file_not_found'])
+                        return
             
-            # Увеличиваем счетчики
-            await db.increment_textbook_downloads(textbook_id)
-            await db.increment_user_downloads(user.id)
+            if sent_message is None:
+                # Отправляем "печатающий" статус
+                await callback.message.answer_chat_action('upload_document')
+                
+                # Отправляем файл
+                file_to_send = FSInputFile(textbook['file_path'])
+                
+                sent_message = await callback.message.answer_document(
+                    document=file_to_send,
+                    caption=caption,
+                    parse_mode='HTML'
+                )
+                
+                # Запоминаем file_id для следующих скачиваний
+                if sent_message.document:
+                    await db.set_textbook_file_id(textbook_id, sent_message.document.file_id)
             
-            # Логируем скачивание
-            user_data = await db.get_or_create_user(user.id)
-            await db.log_download(user_data['id'], textbook_id)
-            
-            # Логируем действие
-            await log_user_action(db, str(user.id), "textbook_downloaded", {
+            # Счетчики, запись скачивания и действие пишутся в базу пакетом
+            downloads.record(user.id, textbook_id, {
                 "textbook_id": textbook_id,
                 "textbook_title": textbook['title'],
                 "author": textbook.get('author_name'),
@@ -448,6 +580,96 @@ async def process_textbook_download(callback: CallbackQuery, state: FSMContext,
         await callback.answer(MESSAGES['error_general'], show_alert=True)
 
 
+# =============================================================================
+# INLINE-РЕЖИМ
+# =============================================================================
+
+def build_inline_result(textbook: Dict[str, Any], bot_username: str) -> InlineQueryResultUnion:
+    """
+    Результат inline-запроса для учебника
+    
+    Учебник, уже загруженный в Telegram, отправляется как документ по file_id.
+    Для остальных отправляется карточка со ссылкой на учебник в боте.
+    """
+    textbook_id = str(textbook['id'])
+    author = textbook.get('author_short_name') or textbook.get('author_name') or 'Неизвестный автор'
+    description = f"{author} • {textbook.get('class_name', '')} • {textbook.get('subject_name', '')}"
+    
+    if textbook.get('telegram_file_id'):
+        return InlineQueryResultCachedDocument(
+            id=textbook_id,
+            title=textbook['title'],
+            document_file_id=textbook['telegram_file_id'],
+            description=description,
+            caption=format_textbook_caption(textbook),
+            parse_mode='HTML'
+        )
+    
+    return InlineQueryResultArticle(
+        id=textbook_id,
+        title=textbook['title'],
+        description=description,
+        input_message_content=InputTextMessageContent(
+            message_text=format_textbook_caption(textbook),
+            parse_mode='HTML'
+        ),
+        reply_markup=get_inline_textbook_keyboard(bot_username, textbook_id)
+    )
+
+
+async def process_inline_query(inline_query: InlineQuery, db: DatabaseManager):
+    """
+    Inline-поиск учебников (@бот алгебра 8 мордкович)
+    Ответ строится по поисковому индексу в памяти, страницы - через next_offset
+    """
+    user = inline_query.from_user
+    query = inline_query.query.strip()
+    page_size = BOT_CONFIG.get('inline_page_size', 20)
+    cache_time = BOT_CONFIG.get('inline_cache_time', 300)
+    
+    try:
+        offset = max(int(inline_query.offset or 0), 0)
+    except ValueError:
+        offset = 0
+    
+    try:
+        # Блокировка проверяется по набору в памяти: запрос к базе на каждый символ не нужен
+        if not query or db.is_blocked_cached(user.id):
+            await inline_query.answer([], cache_time=cache_time, is_personal=bool(query))
+            return
+        
+        # На одну запись больше, чтобы узнать, есть ли следующая страница
+        found = await db.search_textbooks(query, limit=offset + page_size + 1)
+        page = found[offset:offset + page_size]
+        next_offset = str(offset + page_size) if len(found) > offset + page_size else ""
+        
+        bot_info = await inline_query.bot.me()
+        results = [build_inline_result(textbook, bot_info.username) for textbook in page]
+        
+        await inline_query.answer(results, cache_time=cache_time, next_offset=next_offset)
+        
+    except Exception as e:
+        logger.error(f"❌ Ошибка inline-поиска пользователя {user.id} ({query!r}): {e}")
+
+
+async def process_chosen_inline_result(chosen: ChosenInlineResult, db: DatabaseManager,
+                                       downloads: DownloadCounters):
+    """
+    Учет учебника, отправленного через inline-режим
+    (приходит, только если у бота включен inline feedback в @BotFather)
+    """
+    textbook = db.search_index.get(chosen.result_id) if db.search_index else None
+    if textbook and textbook.get('telegram_file_id'):
+        downloads.record(chosen.from_user.id, chosen.result_id, {
+            "textbook_id": chosen.result_id,
+            "textbook_title": textbook['title'],
+            "author": textbook.get('author_name'),
+            "class": textbook.get('class_name'),
+            "subject": textbook.get('subject_name'),
+            "source": "inline"
+        })
+
+
 # =============================================================================
 # НАВИГАЦИОННЫЕ ОБРАБОТЧИКИ
 # =============================================================================
@@ -520,28 +742,29 @@ async def process_back_to_menu(callback: CallbackQuery, state: FSMContext, db: D
 # ОБРАБОТКА ИНЛАЙН КНОПОК ИЗ ОСНОВНОГО МЕНЮ
 # =============================================================================
 
-async def process_inline_search(callback: CallbackQuery, state: FSMContext, db: DatabaseManager):
+async def process_inline_search(callback: CallbackQuery, state: FSMContext, db: DatabaseManager,
+                                activity: ActivityTracker):
     """Обработка кнопки 'Поиск учебников' из главного меню"""
     # Перенаправляем на обработчик команды search
     message_obj = callback.message
     message_obj.from_user = callback.from_user  # Подменяем пользователя
-    await cmd_search(message_obj, state, db)
+    await cmd_search(message_obj, state, db, activity)
     await callback.answer()
 
 
-async def process_inline_help(callback: CallbackQuery, db: DatabaseManager):
+async def process_inline_help(callback: CallbackQuery, db: DatabaseManager, activity: ActivityTracker):
     """Обработка кнопки 'Помощь' из главного меню"""
     message_obj = callback.message
     message_obj.from_user = callback.from_user
-    await cmd_help(message_obj, db)
+    await cmd_help(message_obj, db, activity)
     await callback.answer()
 
 
-async def process_inline_about(callback: CallbackQuery, db: DatabaseManager):
+async def process_inline_about(callback: CallbackQuery, db: DatabaseManager, activity: ActivityTracker):
     """Обработка кнопки 'О проекте' из главного меню"""  
     message_obj = callback.message
     message_obj.from_user = callback.from_user
-    await cmd_about(message_obj, db)
+    await cmd_about(message_obj, db, activity)
     await callback.answer()
 
 
@@ -557,6 +780,13 @@ def register_all_handlers(dp: Dispatcher):
         dp: Экземпляр Dispatcher для регистрации обработчиков
     """
     
+    # Ограничение частоты запросов до фильтров и обработчиков
+    # (скачивание и поиск дороже навигации, см. BOT_CONFIG['rate_limit_costs'])
+    rate_limit = RateLimitMiddleware()
+    dp.message.outer_middleware(rate_limit)
+    dp.callback_query.outer_middleware(rate_limit)
+    dp.inline_query.outer_middleware(rate_limit)
+    
     # Команды бота
     dp.message.register(cmd_start, Command(commands=['start']))
     dp.message.register(cmd_help, Command(commands=['help']))
@@ -566,6 +796,8 @@ def register_all_handlers(dp: Dispatcher):
     # Callback обработчики для выбора классов, предметов и учебников
     dp.callback_query.register(process_class_selection, F.data.startswith('class_'))
     dp.callback_query.register(process_subject_selection, F.data.startswith('subject_'))
+    dp.callback_query.register(process_textbooks_page, F.data.startswith('tbp_'))
+    dp.callback_query.register(process_pagination_info, F.data == 'pagination_info')
     dp.callback_query.register(process_textbook_selection, F.data.startswith('textbook_'))
     dp.callback_query.register(process_textbook_download, F.data.startswith('download_'))
     
@@ -574,6 +806,10 @@ def register_all_handlers(dp: Dispatcher):
     dp.callback_query.register(process_back_to_subjects, F.data.startswith('back_subjects_'))
     dp.callback_query.register(process_back_to_menu, F.data == 'back_menu')
     
+    # Inline-режим (@бот запрос)
+    dp.inline_query.register(process_inline_query)
+    dp.chosen_inline_result.register(process_chosen_inline_result)
+    
     # Инлайн кнопки из главного меню
     dp.callback_query.register(process_inline_search, F.data == 'inline_search')
     dp.callback_query.register(process_inline_help, F.data == 'inline_help')
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+Журнальное хранилище данных админ-панели RUУчебник
+Изменения дописываются в конец журнала (JSON Lines) вместо перезаписи
+файлов целиком; журнал периодически сворачивается в снимок
+
+Автор: Разработано для системы RUУчебник
+Версия: 1.0.0
+"""
+
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+SNAPSHOT_FILE = "snapshot.json"
+JOURNAL_FILE = "journal.jsonl"
+
+# Путь к значению внутри коллекции: ключ или список ключей вложенных словарей
+KeyPath = Union[str, int, Sequence[Union[str, int]]]
+
+
+def _path(key: KeyPath) -> List[str]:
+    """Путь ключей; ключи приводятся к строкам, как после чтения из JSON"""
+    if isinstance(key, (list, tuple)):
+        return [str(part) for part in key]
+    return [str(key)]
+
+
+def _apply(data: Dict[str, Any], record: Dict[str, Any]) -> None:
+    """Применение одной записи журнала к данным"""
+    op = record["o"]
+    name = record["c"]
+
+    if op == "put":
+        data[name] = record["v"]
+        return
+    if op == "add":
+        data[name].append(record["v"])
+        return
+
+    target = data[name]
+    path = record["k"]
+    if op == "set":
+        for part in path[:-1]:
+            target = target.setdefault(part, {})
+        target[path[-1]] = record["v"]
+    elif op == "del":
+        for part in path[:-1]:
+            target = target.get(part)
+            if not isinstance(target, dict):
+                return
+        target.pop(path[-1], None)
+    else:
+        raise ValueError(f"Неизвестная операция журнала: {op}")
+
+
+def _fsync_dir(directory: str) -> None:
+    """Сброс записи каталога (переименование файла) на диск, где это поддерживается"""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class JournalStore:
+    """
+    Хранилище коллекций (словари и списки) с журналом изменений
+
+    Каждое изменение - одна строка JSON в конце journal.jsonl, поэтому
+    запись стоит O(1) независимо от объема данных. fsync выполняется
+    фоновым потоком пачкой раз в fsync_interval секунд (групповая
+    фиксация): после сбоя теряется не больше последнего интервала.
+
+    Когда в журнале набирается compact_every записей, фоновый поток
+    сохраняет снимок всех данных (snapshot.json, атомарно через
+    временный файл и os.replace) и начинает журнал заново. Каждая запись
+    имеет порядковый номер, снимок хранит номер последней учтенной,
+    поэтому сбой между записью снимка и очисткой журнала безопасен.
+
+    При открытии загружается снимок и поверх него воспроизводится
+    журнал. Оборванная последняя строка (сбой посреди записи)
+    отбрасывается, и файл обрезается до последней целой записи.
+    """
+
+    def __init__(self, directory: str, collections: Dict[str, Callable[[], Any]],
+                 fsync_interval: float = 0.5, compact_every: int = 10000):
+        """
+        Args:
+            directory: Каталог снимка и журнала
+            collections: Коллекции и фабрики пустых значений (dict или list)
+            fsync_interval: Период сброса журнала на диск в секундах
+            compact_every: Число записей журнала, после которого делается снимок
+        """
+        self.directory = directory
+        self.collections = collections
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.journal_path = os.path.join(directory, JOURNAL_FILE)
+        self.logger = logging.getLogger(__name__)
+
+        self.data: Dict[str, Any] = {}
+        self.seq = 0
+        self._journal_records = 0
+        self._file = None
+        self._dirty = False
+
+        self._lock = threading.RLock()
+        self._wakeup = threading.Event()
+        self._closing = False
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # Открытие и восстановление
+    # ------------------------------------------------------------------
+
+    def open(self) -> Dict[str, Any]:
+        """
+        Восстановление данных из снимка и журнала, запуск фонового потока
+
+        Returns:
+            Dict[str, Any]: Коллекции по именам (живые объекты хранилища)
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        data = {name: factory() for name, factory in self.collections.items()}
+        snapshot_seq = 0
+
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            snapshot_seq = snapshot["seq"]
+            data.update(snapshot["data"])
+
+        self.seq = snapshot_seq
+        replayed = self._replay(data, snapshot_seq)
+        self.data = data
+        self._journal_records = replayed
+
+        self._file = open(self.journal_path, "a", encoding="utf-8", newline="\n")
+        self._thread = threading.Thread(target=self._run, name="journal-store", daemon=True)
+        self._thread.start()
+        self.logger.info(f"📒 Данные восстановлены: снимок #{snapshot_seq}, из журнала {replayed} записей")
+        return data
+
+    def _replay(self, data: Dict[str, Any], snapshot_seq: int) -> int:
+        """Воспроизведение журнала поверх снимка; возвращает число записей в журнале"""
+        if not os.path.exists(self.journal_path):
+            return 0
+
+        records = 0
+        good_offset = 0
+        with open(self.journal_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                good_offset += len(line)
+                records += 1
+                if record["s"] <= snapshot_seq:
+                    continue  # уже учтена в снимке
+                _apply(data, record)
+                self.seq = record["s"]
+            size = f.seek(0, os.SEEK_END)
+
+        if good_offset < size:
+            self.logger.warning(f"⚠️ Журнал оборван, отброшено байт: {size - good_offset}")
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(good_offset)
+                os.fsync(f.fileno())
+        return records
+
+    # ------------------------------------------------------------------
+    # Изменения
+    # ------------------------------------------------------------------
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        """Применение записи к данным и добавление ее в журнал"""
+        with self._lock:
+            if self._file is None:
+                raise RuntimeError("Хранилище не открыто")
+            self.seq += 1
+            record["s"] = self.seq
+            line = json.dumps(record, ensure_ascii=False, default=str)
+            _apply(self.data, json.loads(line))
+            self._file.write(line + "\n")
+            self._dirty = True
+            self._journal_records += 1
+            if self._journal_records >= self.compact_every:
+                self._wakeup.set()
+
+    def append(self, collection: str, value: Any) -> None:
+        """Добавление элемента в коллекцию-список"""
+        self._write({"o": "add", "c": collection, "v": value})
+
+    def set(self, collection: str, key: KeyPath, value: Any) -> None:
+        """Установка значения по ключу (или пути ключей) в коллекции-словаре"""
+        self._write({"o": "set", "c": collection, "k": _path(key), "v": value})
+
+    def delete(self, collection: str, key: KeyPath) -> None:
+        """Удаление значения по ключу (или пути ключей)"""
+        self._write({"o": "del", "c": collection, "k": _path(key)})
+
+    def replace(self, collection: str, value: Any) -> None:
+        """Замена коллекции целиком (импорт, массовые изменения)"""
+        self._write({"o": "put", "c": collection, "v": value})
+
+    # ------------------------------------------------------------------
+    # Сброс на диск и снимки
+    # ------------------------------------------------------------------
+
+    def sync(self) -> None:
+        """Немедленный сброс журнала на диск"""
+        with self._lock:
+            if self._file is None or not self._dirty:
+                return
+            self._file.flush()
+            self._dirty = False
+            fd = self._file.fileno()
+        # fsync вне блокировки: запись новых строк в это время не ждет
+        os.fsync(fd)
+
+    def compact(self) -> None:
+        """Сохранение снимка всех данных и очистка журнала"""
+        with self._lock:
+            if self._file is None:
+                return
+            payload = json.dumps({"seq": self.seq, "data": self.data},
+                                 ensure_ascii=False, default=str)
+            snapshot_seq = self.seq
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._dirty = False
+
+            tmp_path = self.snapshot_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            _fsync_dir(self.directory)
+
+            # Журнал до snapshot_seq учтен в снимке
+            self._file.close()
+            self._file = open(self.journal_path, "w", encoding="utf-8", newline="\n")
+            self._journal_records = 0
+
+        self.logger.info(f"📒 Снимок данных сохранен (#{snapshot_seq})")
+
+    def _run(self) -> None:
+        """Фоновый поток: групповой fsync и снимки"""
+        while not self._closing:
+            self._wakeup.wait(self.fsync_interval)
+            self._wakeup.clear()
+            try:
+                if self._journal_records >= self.compact_every:
+                    self.compact()
+                else:
+                    self.sync()
+            except Exception as e:
+                self.logger.error(f"❌ Ошибка записи журнала данных: {e}")
+
+    def close(self, compact: bool = False) -> None:
+        """
+        Остановка фонового потока и сброс журнала
+
+        Args:
+            compact: Сохранить снимок перед закрытием
+        """
+        if self._thread is not None:
+            self._closing = True
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+
+        if compact:
+            self.compact()
+        else:
+            self.sync()
+
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
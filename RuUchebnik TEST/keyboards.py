@@ -120,13 +120,19 @@ def get_subjects_keyboard(subjects: List[Dict[str, Any]], class_id: str) -> Inli
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
-def get_textbooks_keyboard(textbooks: List[Dict[str, Any]], class_id: str) -> InlineKeyboardMarkup:
+def get_textbooks_keyboard(textbooks: List[Dict[str, Any]], class_id: str,
+                           page: int = 1, total_pages: int = 1,
+                           has_prev: bool = False, has_next: bool = False) -> InlineKeyboardMarkup:
     """
     Создание клавиатуры со списком учебников
     
     Args:
-        textbooks: Список учебников из базы данных
+        textbooks: Учебники текущей страницы из базы данных
         class_id: ID класса для кнопки "Назад"
+        page: Номер текущей страницы
+        total_pages: Всего страниц
+        has_prev: Есть ли предыдущая страница
+        has_next: Есть ли следующая страница
         
     Returns:
         InlineKeyboardMarkup: Клавиатура с учебниками
@@ -151,6 +157,15 @@ def get_textbooks_keyboard(textbooks: List[Dict[str, Any]], class_id: str) -> In
         )
         keyboard.append([button])
     
+    # Перелистывание: в callback - номер страницы и крайний учебник текущей
+    if textbooks and (has_prev or has_next):
+        pagination = get_pagination_keyboard(
+            page, max(total_pages, page + int(has_next)), 'tbp',
+            prev_data=f"tbp_{page - 1}_b{textbooks[0]['id']}" if has_prev else None,
+            next_data=f"tbp_{page + 1}_a{textbooks[-1]['id']}" if has_next else None
+        )
+        keyboard.extend(pagination.inline_keyboard)
+    
     # Кнопки навигации
     navigation_row = [
         InlineKeyboardButton(
@@ -218,6 +233,29 @@ def get_back_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+def get_inline_textbook_keyboard(bot_username: str, textbook_id: str) -> InlineKeyboardMarkup:
+    """
+    Клавиатура для карточки учебника, отправленной через inline-режим
+    
+    Args:
+        bot_username: Username бота (без @)
+        textbook_id: ID учебника
+        
+    Returns:
+        InlineKeyboardMarkup: Клавиатура со ссылкой на учебник в боте
+    """
+    keyboard = [
+        [
+            InlineKeyboardButton(
+                text=KEYBOARD_TEXTS['download'],
+                url=f"https://t.me/{bot_username}?start=textbook_{textbook_id}"
+            )
+        ]
+    ]
+    
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
 def get_admin_keyboard() -> InlineKeyboardMarkup:
     """
     Создание клавиатуры для администратора
@@ -244,7 +282,9 @@ def get_admin_keyboard() -> InlineKeyboardMarkup:
 
 
 def get_pagination_keyboard(current_page: int, total_pages: int, 
-                           callback_prefix: str, additional_data: str = "") -> InlineKeyboardMarkup:
+                           callback_prefix: str, additional_data: str = "",
+                           prev_data: Optional[str] = None,
+                           next_data: Optional[str] = None) -> InlineKeyboardMarkup:
     """
     Создание клавиатуры с пагинацией
     
@@ -253,6 +293,8 @@ def get_pagination_keyboard(current_page: int, total_pages: int,
         total_pages: Общее количество страниц
         callback_prefix: Префикс для callback_data
         additional_data: Дополнительные данные для callback
+        prev_data: Готовый callback кнопки "назад" (например, с курсором страницы)
+        next_data: Готовый callback кнопки "вперед"
         
     Returns:
         InlineKeyboardMarkup: Клавиатура с кнопками пагинации
@@ -267,7 +309,7 @@ def get_pagination_keyboard(current_page: int, total_pages: int,
             pagination_row.append(
                 InlineKeyboardButton(
                     text="◀️ Пред",
-                    callback_data=f"{callback_prefix}_page_{current_page - 1}_{additional_data}"
+                    callback_data=prev_data or f"{callback_prefix}_page_{current_page - 1}_{additional_data}"
                 )
             )
         
@@ -284,7 +326,7 @@ def get_pagination_keyboard(current_page: int, total_pages: int,
             pagination_row.append(
                 InlineKeyboardButton(
                     text="След ▶️",
-                    callback_data=f"{callback_prefix}_page_{current_page + 1}_{additional_data}"
+                    callback_data=next_data or f"{callback_prefix}_page_{current_page + 1}_{additional_data}"
                 )
             )
         
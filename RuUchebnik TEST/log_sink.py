@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+Асинхронная запись журналов для Telegram бота RUУчебник
+Записи ставятся в очередь без ожидания базы и пишутся пачками через COPY
+
+Автор: Разработано для системы RUУчебник
+Версия: 1.0.0
+"""
+
+import asyncio
+import json
+import logging
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Sequence, Tuple
+
+# Политики переполнения очереди
+OVERFLOW_BLOCK = "block"              # put() ждет места в очереди
+OVERFLOW_DROP_NEW = "drop_new"        # новая запись отбрасывается
+OVERFLOW_DROP_OLDEST = "drop_oldest"  # вытесняется самая старая запись
+
+
+def json_columns(*positions: int) -> Callable[[Tuple], Tuple]:
+    """
+    Преобразование записи: значения в указанных позициях кодируются в JSON
+
+    COPY передает json/jsonb как текст, поэтому словари сериализуются
+    в фоновой задаче, а не в обработчике.
+    """
+    def prepare(record: Tuple) -> Tuple:
+        values = list(record)
+        for position in positions:
+            value = values[position]
+            if value is not None and not isinstance(value, str):
+                values[position] = json.dumps(value, ensure_ascii=False, default=str)
+        return tuple(values)
+
+    return prepare
+
+
+class LogSink:
+    """
+    Очередь записей журнала с пакетной записью в одну таблицу
+
+    Обработчик вызывает put() или submit() и сразу продолжает работу;
+    фоновая задача забирает до batch_size записей и пишет их одной
+    командой COPY (copy_records_to_table), что на порядки дешевле
+    отдельного INSERT на каждую строку.
+
+    Очередь ограничена max_queue записями. При переполнении действует
+    политика overflow: "block" - put() ждет, пока писатель освободит
+    место (обратное давление на обработчики), "drop_new" - новая запись
+    отбрасывается, "drop_oldest" - вытесняется самая старая. Отброшенные
+    записи учитываются в счетчике dropped.
+
+    Если запись пачки не удалась, она возвращается в начало очереди
+    (насколько хватает места) и повторяется через retry_delay секунд.
+    При остановке очередь дописывается полностью.
+    """
+
+    def __init__(self, pool, table: str, columns: Sequence[str],
+                 max_queue: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 0.5, overflow: str = OVERFLOW_DROP_OLDEST,
+                 prepare: Optional[Callable[[Tuple], Tuple]] = None,
+                 retry_delay: float = 5.0):
+        """
+        Args:
+            pool: Пул соединений asyncpg
+            table: Имя таблицы
+            columns: Заполняемые колонки (остальные получают значения по умолчанию)
+            max_queue: Максимальное количество записей в очереди
+            batch_size: Максимальный размер пачки для одной команды COPY
+            flush_interval: Максимальная задержка записи в секундах
+            overflow: Политика переполнения (block, drop_new, drop_oldest)
+            prepare: Преобразование записи перед COPY (выполняется в фоне)
+            retry_delay: Пауза после неудачной записи в секундах
+        """
+        if overflow not in (OVERFLOW_BLOCK, OVERFLOW_DROP_NEW, OVERFLOW_DROP_OLDEST):
+            raise ValueError(f"Неизвестная политика переполнения: {overflow}")
+
+        self.pool = pool
+        self.table = table
+        self.columns = tuple(columns)
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.prepare = prepare
+        self.retry_delay = retry_delay
+        self.logger = logging.getLogger(__name__)
+
+        self._queue: Deque[Tuple] = deque()
+        self._batch_ready = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        self.written = 0
+        self.dropped = 0
+        self.failed_batches = 0
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики очереди для мониторинга"""
+        return {
+            'table': self.table,
+            'queued': len(self._queue),
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed_batches': self.failed_batches
+        }
+
+    def submit(self, record: Tuple) -> bool:
+        """
+        Постановка записи в очередь без ожидания
+
+        При политике "block" и полной очереди запись отбрасывается -
+        для ожидания места используйте put().
+
+        Returns:
+            bool: True, если запись принята
+        """
+        queue = self._queue
+        if len(queue) >= self.max_queue:
+            if self.overflow != OVERFLOW_DROP_OLDEST:
+                self.dropped += 1
+                return False
+            queue.popleft()
+            self.dropped += 1
+
+        queue.append(record)
+        if len(queue) >= self.batch_size:
+            self._batch_ready.set()
+        if len(queue) >= self.max_queue:
+            self._space.clear()
+        return True
+
+    async def put(self, record: Tuple) -> bool:
+        """
+        Постановка записи в очередь; при политике "block" ждет места
+
+        Returns:
+            bool: True, если запись принята
+        """
+        if self.overflow == OVERFLOW_BLOCK:
+            while len(self._queue) >= self.max_queue:
+                self._batch_ready.set()
+                await self._space.wait()
+        return self.submit(record)
+
+    def _take_batch(self) -> list:
+        """Забрать из очереди до batch_size записей"""
+        queue = self._queue
+        count = min(len(queue), self.batch_size)
+        batch = [queue.popleft() for _ in range(count)]
+        if len(queue) < self.batch_size:
+            self._batch_ready.clear()
+        self._space.set()
+        return batch
+
+    def _restore_batch(self, batch: list) -> None:
+        """
+        Вернуть незаписанную пачку в начало очереди
+
+        При политике "block" принятые записи не теряются (очередь может
+        временно превысить max_queue на одну пачку), иначе возвращается
+        столько, сколько поместится.
+        """
+        room = self.max_queue - len(self._queue)
+        if room < len(batch) and self.overflow != OVERFLOW_BLOCK:
+            self.dropped += len(batch) - max(room, 0)
+            batch = batch[len(batch) - max(room, 0):]
+        self._queue.extendleft(reversed(batch))
+        if len(self._queue) >= self.max_queue:
+            self._space.clear()
+
+    async def flush(self) -> int:
+        """
+        Запись всех записей, находящихся в очереди
+
+        Returns:
+            int: Количество записанных строк
+        """
+        written = 0
+        async with self._flush_lock:
+            while self._queue:
+                batch = self._take_batch()
+                records = [self.prepare(record) for record in batch] if self.prepare else batch
+                try:
+                    async with self.pool.acquire() as connection:
+                        await connection.copy_records_to_table(
+                            self.table, records=records, columns=self.columns
+                        )
+                except asyncio.CancelledError:
+                    # Остановка во время записи - пачка допишется при финальном сбросе
+                    self._restore_batch(batch)
+                    raise
+                except Exception as e:
+                    self.failed_batches += 1
+                    self._restore_batch(batch)
+                    self.logger.error(f"❌ Ошибка записи журнала {self.table} "
+                                      f"({len(self._queue)} в очереди): {e}")
+                    raise
+                written += len(batch)
+                self.written += len(batch)
+        return written
+
+    async def _run(self) -> None:
+        """Фоновый цикл: запись по заполнению пачки или по таймеру"""
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            try:
+                await self.flush()
+            except Exception:
+                # Ошибка уже залогирована, записи остались в очереди
+                await asyncio.sleep(self.retry_delay)
+
+    def start(self) -> None:
+        """Запуск фоновой записи"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Остановка фоновой записи и запись остатка очереди"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        try:
+            await self.flush()
+        except Exception:
+            self.logger.error(f"❌ При остановке не записано в {self.table}: {len(self._queue)}")
+        if self.dropped:
+            self.logger.warning(f"⚠️ Журнал {self.table}: отброшено записей при переполнении: {self.dropped}")
@@ -19,14 +19,17 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent))
 
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 
 from config import BOT_CONFIG, MESSAGES
 from database import DatabaseManager
+from download_counters import DownloadCounters
+from activity_tracker import ActivityTracker
 from handlers import register_all_handlers
 from utils import setup_logging
+from bot_session import create_bot_session
+from fsm_storage import create_fsm_storage
 
 
 async def main():
@@ -52,18 +55,34 @@ async def main():
         logger.info("✅ Подключение к базе данных установлено")
         
         # Создание экземпляра бота с настройками по умолчанию
+        # Пулы соединений, keep-alive и таймауты Bot API - в bot_session
         bot = Bot(
             token=bot_token,
+            session=create_bot_session(),
             default=DefaultBotProperties(parse_mode=ParseMode.HTML)
         )
         
-        # Создание диспетчера с хранилищем в памяти
-        storage = MemoryStorage()
+        # Создание диспетчера с постоянным хранилищем состояний (SQLite + кеш в памяти)
+        storage = create_fsm_storage()
         dp = Dispatcher(storage=storage)
         
         # Передача экземпляра менеджера БД в диспетчер для доступа в обработчиках
         dp["db"] = db_manager
         
+        # Счетчики скачиваний пишутся в базу пакетами в фоне
+        download_counters = DownloadCounters(db_manager)
+        download_counters.start()
+        dp["downloads"] = download_counters
+        
+        # Время последней активности пользователей тоже пишется пакетами
+        activity_tracker = ActivityTracker(
+            db_manager,
+            flush_interval=BOT_CONFIG.get('activity_flush_interval', 60),
+            now_window=BOT_CONFIG.get('activity_now_window', 300)
+        )
+        await activity_tracker.start()
+        dp["activity"] = activity_tracker
+        
         # Регистрация всех обработчиков команд и сообщений
         register_all_handlers(dp)
         
@@ -111,6 +130,20 @@ async def main():
         logger.error(f"💥 Критическая ошибка при запуске бота: {e}")
         sys.exit(1)
     finally:
+        # Запись оставшихся в памяти скачиваний
+        if 'download_counters' in locals():
+            await download_counters.stop()
+            logger.info("📥 Счетчики скачиваний сохранены")
+        
+        if 'activity_tracker' in locals():
+            await activity_tracker.stop()
+            logger.info("🕐 Активность пользователей сохранена")
+        
+        # Запись несохраненных состояний FSM
+        if 'storage' in locals():
+            await storage.close()
+            logger.info("💾 Состояния пользователей сохранены")
+        
         # Закрытие подключения к базе данных
         if 'db_manager' in locals():
             await db_manager.close()
@@ -118,6 +151,7 @@ async def main():
         
         # Закрытие сессии бота
         if 'bot' in locals():
+            bot.session.log_stats()
             await bot.session.close()
             logger.info("🤖 Сессия бота закрыта")
         
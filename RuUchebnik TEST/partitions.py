@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+Помесячное секционирование таблиц журналов для Telegram бота RUУчебник
+Перевод таблицы в секционированную, создание секций наперед
+и удаление (с архивированием) секций старше срока хранения
+
+Автор: Разработано для системы RUУчебник
+Версия: 1.0.0
+"""
+
+import asyncio
+import gzip
+import logging
+import os
+import re
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from asyncpg import Connection, Pool
+
+logger = logging.getLogger(__name__)
+
+# Секция для строк вне созданных диапазонов (и с пустым ключом)
+DEFAULT_SUFFIX = "default"
+
+_MONTH_SUFFIX_RE = re.compile(r"_(\d{4})(\d{2})$")
+
+
+def month_start(day: date, shift: int = 0) -> date:
+    """Первое число месяца, сдвинутого на shift месяцев от day"""
+    month_index = day.year * 12 + day.month - 1 + shift
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(table: str, start: date) -> str:
+    """Имя месячной секции: logs_202409"""
+    return f"{table}_{start:%Y%m}"
+
+
+def _quote(identifier: str) -> str:
+    """Экранирование идентификатора PostgreSQL"""
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+async def is_partitioned(conn: Connection, table: str) -> Optional[bool]:
+    """True/False для существующей таблицы, None если таблицы нет"""
+    kind = await conn.fetchval(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass($1)", table
+    )
+    if kind is None:
+        return None
+    return kind == "p"
+
+
+async def ensure_partitions(conn: Connection, table: str, months_ahead: int = 2,
+                            since: Optional[date] = None) -> List[str]:
+    """
+    Создание месячных секций от since (по умолчанию текущий месяц)
+    до months_ahead месяцев вперед и секции по умолчанию
+
+    Returns:
+        List[str]: Имена созданных секций
+    """
+    existing = {
+        row["relname"] for row in await conn.fetch("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass($1)
+        """, table)
+    }
+
+    today = date.today()
+    start = month_start(since or today)
+    last = month_start(today, months_ahead)
+    created = []
+
+    while start <= last:
+        name = partition_name(table, start)
+        if name not in existing:
+            await conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {_quote(name)} PARTITION OF {_quote(table)} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{month_start(start, 1).isoformat()}')"
+            )
+            created.append(name)
+        start = month_start(start, 1)
+
+    default_name = f"{table}_{DEFAULT_SUFFIX}"
+    if default_name not in existing:
+        await conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {_quote(default_name)} PARTITION OF {_quote(table)} DEFAULT"
+        )
+        created.append(default_name)
+
+    if created:
+        logger.info(f"🗂 Созданы секции {table}: {', '.join(created)}")
+    return created
+
+
+async def convert_to_partitioned(conn: Connection, table: str, column: str,
+                                 months_ahead: int = 2) -> bool:
+    """
+    Перевод обычной таблицы в секционированную по месяцам значения column
+
+    Структура (колонки, значения по умолчанию, CHECK) берется из исходной
+    таблицы, данные копируются в секции, последовательности и внешние
+    ключи переносятся на новую таблицу. Первичный ключ дополняется
+    колонкой секционирования (PostgreSQL требует ее в уникальных
+    ключах), пустые значения ключа заменяются временем миграции.
+    Триггеры исходной таблицы не переносятся - их создает код схемы.
+
+    Выполняется в одной транзакции: при ошибке таблица остается прежней.
+
+    Returns:
+        bool: True, если таблица была переведена
+    """
+    if await is_partitioned(conn, table) is not False:
+        return False
+
+    legacy = f"{table}_legacy"
+    async with conn.transaction():
+        columns = [row["attname"] for row in await conn.fetch("""
+            SELECT attname FROM pg_attribute
+            WHERE attrelid = to_regclass($1) AND attnum > 0 AND NOT attisdropped
+            ORDER BY attnum
+        """, table)]
+        primary_key = [row["attname"] for row in await conn.fetch("""
+            SELECT a.attname FROM pg_index i
+            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+            WHERE i.indrelid = to_regclass($1) AND i.indisprimary
+        """, table)]
+        foreign_keys = await conn.fetch("""
+            SELECT conname, pg_get_constraintdef(oid) AS definition FROM pg_constraint
+            WHERE conrelid = to_regclass($1) AND contype = 'f'
+        """, table)
+        bounds = await conn.fetchrow(
+            f"SELECT MIN({_quote(column)})::date AS first, COUNT(*) AS total FROM {_quote(table)}"
+        )
+
+        await conn.execute(f"ALTER TABLE {_quote(table)} RENAME TO {_quote(legacy)}")
+        await conn.execute(
+            f"CREATE TABLE {_quote(table)} (LIKE {_quote(legacy)} "
+            f"INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE INCLUDING COMMENTS) "
+            f"PARTITION BY RANGE ({_quote(column)})"
+        )
+        await conn.execute(f"ALTER TABLE {_quote(table)} ALTER COLUMN {_quote(column)} SET NOT NULL")
+
+        # serial/identity-последовательности остаются у новой таблицы
+        for name in columns:
+            sequence = await conn.fetchval("SELECT pg_get_serial_sequence($1, $2)", legacy, name)
+            if sequence:
+                await conn.execute(f"ALTER SEQUENCE {sequence} OWNED BY {_quote(table)}.{_quote(name)}")
+
+        await ensure_partitions(conn, table, months_ahead, since=bounds["first"])
+
+        select_list = ", ".join(
+            f"COALESCE({_quote(name)}, NOW())" if name == column else _quote(name)
+            for name in columns
+        )
+        await conn.execute(
+            f"INSERT INTO {_quote(table)} ({', '.join(_quote(name) for name in columns)}) "
+            f"SELECT {select_list} FROM {_quote(legacy)}"
+        )
+        await conn.execute(f"DROP TABLE {_quote(legacy)}")
+
+        if primary_key:
+            key = list(primary_key) + ([column] if column not in primary_key else [])
+            await conn.execute(
+                f"ALTER TABLE {_quote(table)} ADD PRIMARY KEY ({', '.join(_quote(name) for name in key)})"
+            )
+        for foreign_key in foreign_keys:
+            await conn.execute(
+                f"ALTER TABLE {_quote(table)} ADD CONSTRAINT {_quote(foreign_key['conname'])} "
+                f"{foreign_key['definition']}"
+            )
+
+    logger.info(f"🗂 Таблица {table} секционирована по {column}, перенесено строк: {bounds['total']}")
+    return True
+
+
+async def list_partitions(conn: Connection, table: str) -> List[Tuple[str, date]]:
+    """Месячные секции таблицы: (имя, первое число месяца), по возрастанию"""
+    rows = await conn.fetch("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass($1)
+    """, table)
+    partitions = []
+    for row in rows:
+        match = _MONTH_SUFFIX_RE.search(row["relname"])
+        if match:
+            partitions.append((row["relname"], date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda item: item[1])
+
+
+async def archive_partition(conn: Connection, name: str, archive_dir: str) -> str:
+    """
+    Выгрузка секции в сжатый CSV перед удалением
+
+    Returns:
+        str: Путь к файлу архива
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    with gzip.open(path, "wb") as archive:
+        async def write(chunk: bytes) -> None:
+            archive.write(chunk)
+
+        await conn.copy_from_table(name, output=write, format="csv", header=True)
+    return path
+
+
+async def drop_expired_partitions(conn: Connection, table: str, keep_months: int,
+                                  archive_dir: Optional[str] = None) -> List[str]:
+    """
+    Удаление секций, целиком лежащих раньше срока хранения
+
+    Секция отсоединяется и удаляется - без построчного DELETE, поэтому
+    триггеры сводок не срабатывают и накопленная статистика сохраняется.
+
+    Args:
+        conn: Соединение с базой
+        table: Секционированная таблица
+        keep_months: Сколько месяцев хранить, включая текущий
+        archive_dir: Каталог для архивов (None - удалять без архива)
+
+    Returns:
+        List[str]: Имена удаленных секций
+    """
+    cutoff = month_start(date.today(), -(keep_months - 1))
+    dropped = []
+    for name, start in await list_partitions(conn, table):
+        if start >= cutoff:
+            break
+        if archive_dir:
+            path = await archive_partition(conn, name, archive_dir)
+            logger.info(f"📦 Секция {name} выгружена в {path}")
+        async with conn.transaction():
+            await conn.execute(f"ALTER TABLE {_quote(table)} DETACH PARTITION {_quote(name)}")
+            await conn.execute(f"DROP TABLE {_quote(name)}")
+        dropped.append(name)
+
+    if dropped:
+        logger.info(f"🗑 Удалены секции {table} старше {cutoff:%m.%Y}: {', '.join(dropped)}")
+    return dropped
+
+
+class PartitionMaintainer:
+    """
+    Фоновое обслуживание секционированных таблиц
+
+    Раз в interval секунд (и при запуске) создает секции на months_ahead
+    месяцев вперед и удаляет секции старше срока хранения. Срок хранения
+    задается по таблицам; None - хранить без ограничения.
+    """
+
+    def __init__(self, pool: Pool, retention: Dict[str, Optional[int]],
+                 months_ahead: int = 2, archive_dir: Optional[str] = None,
+                 interval: float = 6 * 3600):
+        """
+        Args:
+            pool: Пул соединений asyncpg
+            retention: Срок хранения в месяцах по имени таблицы
+            months_ahead: На сколько месяцев вперед создавать секции
+            archive_dir: Каталог архивов удаляемых секций (None - без архива)
+            interval: Период обслуживания в секундах
+        """
+        self.pool = pool
+        self.retention = retention
+        self.months_ahead = months_ahead
+        self.archive_dir = archive_dir
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self) -> None:
+        """Один проход обслуживания по всем таблицам"""
+        async with self.pool.acquire() as conn:
+            for table, keep_months in self.retention.items():
+                try:
+                    if not await is_partitioned(conn, table):
+                        continue
+                    await ensure_partitions(conn, table, self.months_ahead)
+                    if keep_months:
+                        await drop_expired_partitions(conn, table, keep_months, self.archive_dir)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка обслуживания секций {table}: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            await self.run_once()
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """Запуск фонового обслуживания"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Остановка фонового обслуживания"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -2,19 +2,21 @@ import sys
 import os
 import json
 import subprocess
-import shutil
 import time
 import threading
 import asyncio
 from datetime import datetime, timedelta
 from PyQt6.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QLabel, QLineEdit, QPushButton, QFileDialog, QMessageBox, QInputDialog, QTextEdit, QTabWidget
-from PyQt6.QtCore import Qt, QPropertyAnimation, QEasingCurve, QRect, QTimer, QThread, pyqtSignal
+from PyQt6.QtCore import Qt, QPropertyAnimation, QEasingCurve, QRect, QTimer
 from PyQt6.QtGui import QFont, QPalette, QColor, QPixmap
 import telegram
 from telegram.ext import Application, CallbackQueryHandler, MessageHandler, filters, ContextTypes, Update
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.error import TelegramError
 
+from journal_store import JournalStore
+from blob_store import BlobStore
+
 # Проверка версии библиотеки
 try:
     import pkg_resources
@@ -47,6 +49,9 @@ BANNED_TXT_FILE = os.path.join(BASE_DIR, "banned.txt")
 TEXTBOOKS_FILE = os.path.join(BASE_DIR, "textbooks.json")
 TEXTBOOKS_TXT_FILE = os.path.join(BASE_DIR, "textbooks.txt")
 TEXTBOOKS_DIR = os.path.join(BASE_DIR, "textbooks")
+DATA_DIR = os.path.join(BASE_DIR, "data")  # Снимок и журнал данных
+JOURNAL_FSYNC_INTERVAL = 0.5  # Период сброса журнала на диск (сек)
+JOURNAL_COMPACT_EVERY = 10000  # Записей журнала до нового снимка
 UPDATE_INTERVAL = 1000  # Ускоренный интервал обновления
 
 # Глобальные переменные
@@ -55,28 +60,45 @@ bot_status = "Stopped"
 bot_app = None
 error_logs = []
 
-# Сигналы для мгновенного сохранения
-class DataSaveThread(QThread):
-    save_signal = pyqtSignal(dict, str)
-
-    def __init__(self):
-        super().__init__()
-        self.data = {}
-        self.file = ""
-        self.txt_file = ""
-
-    def run(self):
-        save_data(self.file, self.data)
-        if self.txt_file:
-            save_txt_data(self.txt_file, self.data)
-
-    def save(self, data, file, txt_file=None):
-        self.data = data
-        self.file = file
-        self.txt_file = txt_file
-        self.start()
+# Коллекции данных панели и пустые значения для них
+DATA_COLLECTIONS = {
+    "logs": list,
+    "error_logs": list,
+    "ban_logs": list,
+    "users": dict,
+    "banned_users": dict,
+    "textbooks": dict,
+    "textbook_names": dict,  # sha256 файла учебника -> исходное имя файла
+}
+
+# JSON-файлы прежнего формата, из которых данные переносятся при первом запуске
+LEGACY_FILES = {
+    "logs": LOGS_FILE,
+    "error_logs": ERRORS_FILE,
+    "ban_logs": BAN_LOGS_FILE,
+    "users": USERS_FILE,
+    "banned_users": BANNED_FILE,
+    "textbooks": TEXTBOOKS_FILE,
+}
 
 # Функции для работы с данными
+def open_store():
+    """Открывает журнальное хранилище, при первом запуске переносит старые JSON файлы."""
+    store = JournalStore(DATA_DIR, DATA_COLLECTIONS,
+                         fsync_interval=JOURNAL_FSYNC_INTERVAL, compact_every=JOURNAL_COMPACT_EVERY)
+    store.open()
+    if store.seq == 0:
+        imported = False
+        for name, file in LEGACY_FILES.items():
+            data = load_data(file)
+            if data and isinstance(data, DATA_COLLECTIONS[name]):
+                store.replace(name, data)
+                imported = True
+        if imported:
+            store.compact()
+            print(f"Данные перенесены из JSON файлов в {DATA_DIR}")
+    return store
+
 def load_data(file):
     """Загружает данные из JSON файла с обработкой ошибок."""
     if os.path.exists(file):
@@ -89,18 +111,18 @@ def load_data(file):
     return {}
 
 def save_data(file, data):
-    """Сохраняет данные в JSON файл мгновенно."""
+    """Выгружает данные в JSON файл (экспорт из панели)."""
     os.makedirs(os.path.dirname(file) or '.', exist_ok=True)
     with open(file, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+        json.dump(data, f, ensure_ascii=False, indent=4, default=str)
 
 def save_txt_data(file, data):
-    """Сохраняет данные в TXT файл мгновенно."""
+    """Выгружает данные в TXT файл (экспорт из панели)."""
     os.makedirs(os.path.dirname(file) or '.', exist_ok=True)
     with open(file, 'w', encoding='utf-8') as f:
         if isinstance(data, dict):
             for key, value in data.items():
-                f.write(f"{key}: {json.dumps(value)}\n")
+                f.write(f"{key}: {json.dumps(value, ensure_ascii=False, default=str)}\n")
         elif isinstance(data, list):
             for item in data:
                 f.write(f"{item}\n")
@@ -121,15 +143,19 @@ class RUUchebnikAdmin(QMainWindow):
         self.setFixedSize(400, 600)
         self.setStyleSheet("background-color: #001F3F;")
 
-        # Инициализация данных
-        self.logs = load_data(LOGS_FILE)
-        self.error_logs = load_data(ERRORS_FILE)
-        self.ban_logs = load_data(BAN_LOGS_FILE)
-        self.users = load_data(USERS_FILE)
-        self.banned_users = load_data(BANNED_FILE)
-        self.textbooks = load_data(TEXTBOOKS_FILE)
+        # Инициализация данных: коллекции живут в хранилище,
+        # каждое изменение записывается через self.store одной строкой журнала
+        self.store = open_store()
+        self.logs = self.store.data["logs"]
+        self.error_logs = self.store.data["error_logs"]
+        self.ban_logs = self.store.data["ban_logs"]
+        self.users = self.store.data["users"]
+        self.banned_users = self.store.data["banned_users"]
+        self.textbooks = self.store.data["textbooks"]
+        self.textbook_names = self.store.data["textbook_names"]
+        # Файлы учебников лежат под своим sha256: одинаковые загрузки хранятся один раз
+        self.blobs = BlobStore(TEXTBOOKS_DIR)
         self.bot_running = False
-        self.save_thread = DataSaveThread()
 
         # Виджет логотипа
         self.logo_widget = QWidget(self)
@@ -179,12 +205,12 @@ class RUUchebnikAdmin(QMainWindow):
         buttons = [
             ("Запустить бота", self.start_bot),
             ("Остановить бота", self.stop_bot),
-            ("Скачать общие логи", lambda: self.download_logs_type(LOGS_FILE, LOGS_TXT_FILE, "Общие логи")),
-            ("Скачать логи ошибок", lambda: self.download_logs_type(ERRORS_FILE, ERRORS_TXT_FILE, "Логи ошибок")),
-            ("Скачать логи бана", lambda: self.download_logs_type(BAN_LOGS_FILE, BAN_LOGS_TXT_FILE, "Логи бана")),
-            ("Сохранить пользователей", lambda: self.save_data_type(USERS_FILE, USERS_TXT_FILE, "Пользователи")),
-            ("Сохранить баны", lambda: self.save_data_type(BANNED_FILE, BANNED_TXT_FILE, "Баны")),
-            ("Сохранить учебники", lambda: self.save_data_type(TEXTBOOKS_FILE, TEXTBOOKS_TXT_FILE, "Учебники")),
+            ("Скачать общие логи", lambda: self.download_logs_type("logs", "Общие логи")),
+            ("Скачать логи ошибок", lambda: self.download_logs_type("error_logs", "Логи ошибок")),
+            ("Скачать логи бана", lambda: self.download_logs_type("ban_logs", "Логи бана")),
+            ("Сохранить пользователей", lambda: self.save_data_type("users", "Пользователи")),
+            ("Сохранить баны", lambda: self.save_data_type("banned_users", "Баны")),
+            ("Сохранить учебники", lambda: self.save_data_type("textbooks", "Учебники")),
             ("Посмотреть пользователей", self.view_users),
             ("Забанить пользователя", self.ban_user),
             ("Разбанить пользователя", self.unban_user),
@@ -206,9 +232,9 @@ class RUUchebnikAdmin(QMainWindow):
         # Вкладка логов
         logs_layout = QVBoxLayout(self.logs_tab)
         self.log_download_buttons = [
-            ("Скачать общие логи", lambda: self.download_logs_type(LOGS_FILE, LOGS_TXT_FILE, "Общие логи")),
-            ("Скачать логи ошибок", lambda: self.download_logs_type(ERRORS_FILE, ERRORS_TXT_FILE, "Логи ошибок")),
-            ("Скачать логи бана", lambda: self.download_logs_type(BAN_LOGS_FILE, BAN_LOGS_TXT_FILE, "Логи бана"))
+            ("Скачать общие логи", lambda: self.download_logs_type("logs", "Общие логи")),
+            ("Скачать логи ошибок", lambda: self.download_logs_type("error_logs", "Логи ошибок")),
+            ("Скачать логи бана", lambda: self.download_logs_type("ban_logs", "Логи бана"))
         ]
         for text, func in self.log_download_buttons:
             button = QPushButton(text, self.logs_tab)
@@ -291,22 +317,19 @@ class RUUchebnikAdmin(QMainWindow):
         global bot_process, bot_app
         if bot_process is None or bot_process.poll() is None:
             if not BOT_TOKEN or 'YOUR_BOT_TOKEN' in BOT_TOKEN:
-                self.error_logs.append(f"Ошибка: Токен не настроен в {datetime.now()}")
-                self.save_all_data()
+                self.store.append("error_logs", f"Ошибка: Токен не настроен в {datetime.now()}")
                 QMessageBox.critical(self, "Ошибка", "Настройте BOT_TOKEN.")
                 return
             try:
                 bot_process = subprocess.Popen([sys.executable, os.path.join(BASE_DIR, "ru_uchebnik.py"), "--bot-only"], cwd=BASE_DIR)
-                self.logs.append(f"Бот запущен в {datetime.now()}")
-                self.save_all_data()
+                self.store.append("logs", f"Бот запущен в {datetime.now()}")
                 self.update_status()
                 QMessageBox.information(self, "Успех", "Бот запущен!")
                 bot_app = Application.builder().token(BOT_TOKEN).build()
                 self.setup_bot_handlers()
                 threading.Thread(target=self.run_bot_polling, daemon=True).start()
             except Exception as e:
-                self.error_logs.append(f"Ошибка запуска: {str(e)} в {datetime.now()}")
-                self.save_all_data()
+                self.store.append("error_logs", f"Ошибка запуска: {str(e)} в {datetime.now()}")
                 QMessageBox.critical(self, "Ошибка", f"Ошибка: {str(e)}")
         else:
             QMessageBox.warning(self, "Предупреждение", "Бот уже запущен.")
@@ -315,18 +338,16 @@ class RUUchebnikAdmin(QMainWindow):
         """Остановить бота."""
         global bot_process, bot_app
         if bot_process and bot_process.poll() is None:
-            users = load_data(USERS_FILE)
             bot = Bot(token=BOT_TOKEN)
-            for user_id in users:
+            for user_id in list(self.users):
                 try:
                     bot.send_message(chat_id=user_id, text="Бот на технических работах.")
                 except TelegramError as e:
-                    self.logs.append(f"Ошибка рассылки для {user_id}: {str(e)}")
+                    self.store.append("logs", f"Ошибка рассылки для {user_id}: {str(e)}")
             bot_process.terminate()
             bot_process = None
             bot_app = None
-            self.logs.append(f"Бот остановлен в {datetime.now()}")
-            self.save_all_data()
+            self.store.append("logs", f"Бот остановлен в {datetime.now()}")
             self.update_status()
             QMessageBox.information(self, "Успех", "Бот остановлен.")
         else:
@@ -342,9 +363,9 @@ class RUUchebnikAdmin(QMainWindow):
             pixmap.fill(QColor("red"))
         self.status_label.setPixmap(pixmap)
 
-    def download_logs_type(self, json_file, txt_file, title):
+    def download_logs_type(self, collection, title):
         """Скачать логи."""
-        data = load_data(json_file)
+        data = self.store.data[collection]
         if not data:
             QMessageBox.warning(self, "Ошибка", f"{title} пусты.")
             return
@@ -356,9 +377,9 @@ class RUUchebnikAdmin(QMainWindow):
             save_txt_data(txt_path, data)
         QMessageBox.information(self, "Успех", f"{title} сохранены.")
 
-    def save_data_type(self, json_file, txt_file, title):
+    def save_data_type(self, collection, title):
         """Сохранить данные."""
-        data = load_data(json_file)
+        data = self.store.data[collection]
         if not data:
             QMessageBox.warning(self, "Ошибка", f"{title} пусты.")
             return
@@ -387,10 +408,9 @@ class RUUchebnikAdmin(QMainWindow):
                 days, ok = QInputDialog.getInt(self, "Срок", "Дни:", 15, 1, 365)
                 if ok:
                     until = datetime.now() + timedelta(days=days)
-                    self.banned_users[user_id] = {"reason": reason, "until": str(until)}
-                    self.ban_logs.append(f"Бан {user_id} на {days} дней. Причина: {reason} в {datetime.now()}")
-                    self.logs.append(f"Бан {user_id}")
-                    self.save_all_data()
+                    self.store.set("banned_users", user_id, {"reason": reason, "until": str(until)})
+                    self.store.append("ban_logs", f"Бан {user_id} на {days} дней. Причина: {reason} в {datetime.now()}")
+                    self.store.append("logs", f"Бан {user_id}")
                     self.update_ban_list()
                     QMessageBox.information(self, "Успех", f"Бан {user_id}.")
 
@@ -401,10 +421,9 @@ class RUUchebnikAdmin(QMainWindow):
             return
         user_id, ok = QInputDialog.getText(self, "Разбан", "Введите ID:")
         if ok and user_id in self.banned_users:
-            del self.banned_users[user_id]
-            self.ban_logs.append(f"Разбан {user_id} в {datetime.now()}")
-            self.logs.append(f"Разбан {user_id}")
-            self.save_all_data()
+            self.store.delete("banned_users", user_id)
+            self.store.append("ban_logs", f"Разбан {user_id} в {datetime.now()}")
+            self.store.append("logs", f"Разбан {user_id}")
             self.update_ban_list()
             QMessageBox.information(self, "Успех", f"Разбан {user_id}.")
         else:
@@ -426,18 +445,15 @@ class RUUchebnikAdmin(QMainWindow):
                 if ok:
                     file, _ = QFileDialog.getOpenFileName(self, "PDF", "", "PDF Files (*.pdf)")
                     if file and os.path.exists(file):
-                        dest = os.path.join(TEXTBOOKS_DIR, os.path.basename(file))
-                        os.makedirs(TEXTBOOKS_DIR, exist_ok=True)
-                        shutil.copy(file, dest)
-                        if class_ not in self.textbooks:
-                            self.textbooks[class_] = {}
-                        if subject not in self.textbooks[class_]:
-                            self.textbooks[class_][subject] = {}
-                        if author not in self.textbooks[class_][subject]:
-                            self.textbooks[class_][subject][author] = []
-                        self.textbooks[class_][subject][author].append(dest)
-                        self.logs.append(f"Учебник: {class_} - {subject} - {author}")
-                        self.save_all_data()
+                        file_hash, _, dest = self.blobs.put_file(file)
+                        files = self.textbooks.get(class_, {}).get(subject, {}).get(author, [])
+                        if dest in files:
+                            QMessageBox.warning(self, "Ошибка", "Этот учебник уже добавлен.")
+                            return
+                        if file_hash not in self.textbook_names:
+                            self.store.set("textbook_names", file_hash, os.path.basename(file))
+                        self.store.set("textbooks", [class_, subject, author], files + [dest])
+                        self.store.append("logs", f"Учебник: {class_} - {subject} - {author} (sha256 {file_hash})")
                         QMessageBox.information(self, "Успех", "Учебник добавлен!")
                     else:
                         QMessageBox.warning(self, "Ошибка", "Неверный файл.")
@@ -449,9 +465,8 @@ class RUUchebnikAdmin(QMainWindow):
             if class_ in self.textbooks:
                 QMessageBox.warning(self, "Ошибка", "Класс уже существует.")
                 return
-            self.textbooks[class_] = {}
-            self.logs.append(f"Новый класс добавлен: {class_} в {datetime.now()}")
-            self.save_all_data()
+            self.store.set("textbooks", class_, {})
+            self.store.append("logs", f"Новый класс добавлен: {class_} в {datetime.now()}")
             QMessageBox.information(self, "Успех", f"Всё, я добавил класс {class_}! Теперь добавьте предметы и учебники.")
 
     def delete_class(self):
@@ -462,14 +477,13 @@ class RUUchebnikAdmin(QMainWindow):
             return
         class_, ok = QInputDialog.getItem(self, "Удалить класс", "Выберите класс:", classes, 0, False)
         if ok and class_ in self.textbooks:
-            for subject in self.textbooks[class_]:
-                for author in self.textbooks[class_][subject]:
-                    for file_path in self.textbooks[class_][subject][author]:
-                        if os.path.exists(file_path):
-                            os.remove(file_path)
-            del self.textbooks[class_]
-            self.logs.append(f"Класс {class_} удалён в {datetime.now()}")
-            self.save_all_data()
+            files = [file_path
+                     for authors in self.textbooks[class_].values()
+                     for class_files in authors.values()
+                     for file_path in class_files]
+            self.store.delete("textbooks", class_)
+            self.release_textbook_files(files)
+            self.store.append("logs", f"Класс {class_} удалён в {datetime.now()}")
             QMessageBox.information(self, "Успех", f"Класс {class_} и все связанные учебники удалены.")
 
     def add_new_subject(self):
@@ -485,9 +499,8 @@ class RUUchebnikAdmin(QMainWindow):
                 if subject in self.textbooks[class_]:
                     QMessageBox.warning(self, "Ошибка", "Предмет уже существует.")
                     return
-                self.textbooks[class_][subject] = {}
-                self.logs.append(f"Новый предмет добавлен: {class_} - {subject} в {datetime.now()}")
-                self.save_all_data()
+                self.store.set("textbooks", [class_, subject], {})
+                self.store.append("logs", f"Новый предмет добавлен: {class_} - {subject} в {datetime.now()}")
                 QMessageBox.information(self, "Успех", f"Всё, я добавил {subject}! Теперь добавьте учебник для этого предмета.")
                 # Заново открыть меню добавления учебника
                 self.add_textbook()
@@ -502,61 +515,73 @@ class RUUchebnikAdmin(QMainWindow):
         if ok and class_ in self.textbooks:
             subjects = list(self.textbooks[class_].keys())
             if not subjects:
-                del self.textbooks[class_]
-                self.save_all_data()
+                self.store.delete("textbooks", class_)
                 QMessageBox.information(self, "Успех", f"Все учебники класса {class_} удалены.")
                 return
             subject, ok = QInputDialog.getItem(self, "Предмет", "Выберите предмет:", subjects, 0, False)
             if ok and subject in self.textbooks[class_]:
                 authors = list(self.textbooks[class_][subject].keys())
                 if not authors:
-                    del self.textbooks[class_][subject]
-                    self.save_all_data()
+                    self.store.delete("textbooks", [class_, subject])
                     QMessageBox.information(self, "Успех", f"Все учебники предмета {subject} удалены.")
                     return
                 author, ok = QInputDialog.getItem(self, "Автор", "Выберите автора:", authors, 0, False)
                 if ok and author in self.textbooks[class_][subject]:
                     textbooks = self.textbooks[class_][subject][author]
                     if not textbooks:
-                        del self.textbooks[class_][subject][author]
-                        self.save_all_data()
+                        self.store.delete("textbooks", [class_, subject, author])
                         QMessageBox.information(self, "Успех", f"Все учебники автора {author} удалены.")
                         return
-                    textbook_list = [os.path.basename(f) for f in textbooks]
+                    textbook_list = [self.textbook_name(f) for f in textbooks]
                     textbook, ok = QInputDialog.getItem(self, "Учебник", "Выберите учебник для удаления:", textbook_list, 0, False)
                     if ok:
                         file_path = textbooks[textbook_list.index(textbook)]
-                        if os.path.exists(file_path):
-                            os.remove(file_path)
-                        textbooks.remove(file_path)
-                        if not textbooks:
-                            del self.textbooks[class_][subject][author]
-                        if not self.textbooks[class_][subject]:
-                            del self.textbooks[class_][subject]
-                        if not self.textbooks[class_]:
-                            del self.textbooks[class_]
-                        self.logs.append(f"Удалён учебник: {class_} - {subject} - {author} - {textbook}")
-                        self.save_all_data()
+                        remaining = [f for f in textbooks if f != file_path]
+                        if remaining:
+                            self.store.set("textbooks", [class_, subject, author], remaining)
+                        elif len(self.textbooks[class_][subject]) > 1:
+                            self.store.delete("textbooks", [class_, subject, author])
+                        elif len(self.textbooks[class_]) > 1:
+                            self.store.delete("textbooks", [class_, subject])
+                        else:
+                            self.store.delete("textbooks", class_)
+                        self.release_textbook_files([file_path])
+                        self.store.append("logs", f"Удалён учебник: {class_} - {subject} - {author} - {textbook}")
                         QMessageBox.information(self, "Успех", f"Учебник {textbook} удалён.")
 
+    def textbook_name(self, file_path):
+        """Имя учебника для показа: исходное имя файла (в хранилище файл назван по sha256)."""
+        name = os.path.basename(file_path)
+        return self.textbook_names.get(name, name)
+
+    def release_textbook_files(self, file_paths):
+        """Удаляет файлы учебников, на которые больше не ссылается ни одна запись каталога."""
+        in_use = {file_path
+                  for subjects in self.textbooks.values()
+                  for authors in subjects.values()
+                  for files in authors.values()
+                  for file_path in files}
+        for file_path in set(file_paths) - in_use:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            self.store.delete("textbook_names", os.path.basename(file_path))
+
     def send_broadcast(self):
         """Отправить рассылку."""
         message, ok = QInputDialog.getText(self, "Рассылка", "Сообщение:")
         if ok:
             file, _ = QFileDialog.getOpenFileName(self, "Медиа", "", "Images (*.jpg *.png);;All Files (*)")
             bot = Bot(token=BOT_TOKEN)
-            users = load_data(USERS_FILE)
-            for user_id in users:
+            for user_id in list(self.users):
                 try:
                     if file and os.path.exists(file):
                         with open(file, 'rb') as f:
                             bot.send_photo(chat_id=user_id, photo=f, caption=message)
                     else:
                         bot.send_message(chat_id=user_id, text=message)
-                    self.logs.append(f"Рассылка для {user_id}")
+                    self.store.append("logs", f"Рассылка для {user_id}")
                 except TelegramError as e:
-                    self.logs.append(f"Ошибка рассылки для {user_id}: {str(e)}")
-            self.save_all_data()
+                    self.store.append("logs", f"Ошибка рассылки для {user_id}: {str(e)}")
             QMessageBox.information(self, "Успех", "Рассылка завершена.")
 
     def view_stats(self):
@@ -566,26 +591,17 @@ class RUUchebnikAdmin(QMainWindow):
         stats = f"Пользователей: {total_users}\nСкачиваний: {total_downloads}"
         QMessageBox.information(self, "Статистика", stats)
 
-    def save_all_data(self):
-        """Сохранить все данные."""
-        self.save_thread.save(self.logs, LOGS_FILE, LOGS_TXT_FILE)
-        self.save_thread.save(self.error_logs, ERRORS_FILE, ERRORS_TXT_FILE)
-        self.save_thread.save(self.ban_logs, BAN_LOGS_FILE, BAN_LOGS_TXT_FILE)
-        self.save_thread.save(self.users, USERS_FILE, USERS_TXT_FILE)
-        self.save_thread.save(self.banned_users, BANNED_FILE, BANNED_TXT_FILE)
-        self.save_thread.save(self.textbooks, TEXTBOOKS_FILE, TEXTBOOKS_TXT_FILE)
-
     def close_app(self):
         """Закрыть приложение."""
         self.stop_bot()
-        self.save_all_data()
+        self.store.close(compact=True)
         QMessageBox.information(self, "Выход", "Приложение закрыто.")
         self.close()
 
     def closeEvent(self, event):
         """Обработка закрытия."""
         self.stop_bot()
-        self.save_all_data()
+        self.store.close(compact=True)
         event.accept()
 
     def setup_bot_handlers(self):
@@ -596,11 +612,10 @@ class RUUchebnikAdmin(QMainWindow):
 
         async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             user = update.effective_user
-            user_id = user.id
+            user_id = str(user.id)  # ключи пользователей - строки, как в JSON
             if user_id not in self.users:
-                self.users[user_id] = {"username": user.username, "joined": datetime.now(), "downloads": 0, "agreed": False}
-                self.logs.append(f"Новый пользователь {user.username} ({user_id}) в {datetime.now()}")
-                self.save_all_data()
+                self.store.set("users", user_id, {"username": user.username, "joined": datetime.now(), "downloads": 0, "agreed": False})
+                self.store.append("logs", f"Новый пользователь {user.username} ({user_id}) в {datetime.now()}")
             if not self.users[user_id]["agreed"]:
                 rules_text = (
                     "<b><font color='red'>Правила RUУчебник</font></b>\n\n"
@@ -616,7 +631,7 @@ class RUUchebnikAdmin(QMainWindow):
                 await self.show_main_menu(update, context)
 
         async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-            user_id = update.effective_user.id
+            user_id = str(update.effective_user.id)
             if user_id not in self.users or not self.users[user_id]["agreed"]:
                 await update.message.reply_text("Согласитесь с правилами через /start.")
                 return
@@ -624,15 +639,14 @@ class RUUchebnikAdmin(QMainWindow):
         async def button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             query = update.callback_query
             await query.answer()
-            user_id = query.from_user.id
+            user_id = str(query.from_user.id)
             if user_id not in self.users:
                 await query.edit_message_text("Начните с /start.")
                 return
             data = query.data
             if data == "agree":
-                self.users[user_id]["agreed"] = True
-                self.logs.append(f"Пользователь {user_id} согласился в {datetime.now()}")
-                self.save_all_data()
+                self.store.set("users", [user_id, "agreed"], True)
+                self.store.append("logs", f"Пользователь {user_id} согласился в {datetime.now()}")
                 msg_id = context.user_data.get(user_id, {}).get("message_id")
                 if msg_id:
                     try:
@@ -676,15 +690,15 @@ class RUUchebnikAdmin(QMainWindow):
                 if textbooks and all(os.path.exists(f) for f in textbooks):
                     waiting_msg = await query.message.reply_text("Подождите, я загружаю учебник...")
                     await asyncio.sleep(1)  # Имитация загрузки
-                    textbook_list = [os.path.basename(f) for f in textbooks]
+                    textbook_list = [self.textbook_name(f) for f in textbooks]
                     textbook, ok = await context.bot.send_poll(chat_id=user_id, question="Выберите учебник:", options=textbook_list, is_anonymous=False)
                     selected_textbook = textbook_list[0]  # По умолчанию первый, можно улучшить с обработкой ответа пользователя
                     file_path = textbooks[textbook_list.index(selected_textbook)]
                     with open(file_path, 'rb') as f:
-                        await query.message.reply_document(document=f, caption="Удачного использования RuУчебник!")
-                    self.users[user_id]["downloads"] += 1
-                    self.logs.append(f"{self.users[user_id]['username']} скачал {class_} - {subject} - {author} - {selected_textbook}")
-                    self.save_all_data()
+                        await query.message.reply_document(document=f, filename=selected_textbook,
+                                                           caption="Удачного использования RuУчебник!")
+                    self.store.set("users", [user_id, "downloads"], self.users[user_id].get("downloads", 0) + 1)
+                    self.store.append("logs", f"{self.users[user_id]['username']} скачал {class_} - {subject} - {author} - {selected_textbook}")
                     await context.bot.delete_message(chat_id=user_id, message_id=waiting_msg.message_id)
                     keyboard = [[InlineKeyboardButton("Назад", callback_data="back")]]
                     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -696,7 +710,7 @@ class RUUchebnikAdmin(QMainWindow):
                 await query.edit_message_text("Soon... 💻")
             elif data == "back":
                 await self.show_main_menu(update, context)
-            elif user_id == ADMIN_ID:
+            elif user_id == str(ADMIN_ID):
                 if data == "ban":
                     await query.edit_message_text("Введите ID для бана через сообщение.")
                     context.user_data["admin_state"] = "await_ban_id"
@@ -729,20 +743,18 @@ class RUUchebnikAdmin(QMainWindow):
                 ban_id = context.user_data["ban_user_id"]
                 days = 15  # По умолчанию
                 until = datetime.now() + timedelta(days=days)
-                self.banned_users[ban_id] = {"reason": reason, "until": str(until)}
-                self.ban_logs.append(f"Бан {ban_id} на {days} дней. Причина: {reason} в {datetime.now()}")
-                self.logs.append(f"Бан {ban_id}")
-                self.save_all_data()
+                self.store.set("banned_users", ban_id, {"reason": reason, "until": str(until)})
+                self.store.append("ban_logs", f"Бан {ban_id} на {days} дней. Причина: {reason} в {datetime.now()}")
+                self.store.append("logs", f"Бан {ban_id}")
                 await update.message.reply_text(f"Бан {ban_id} применён.")
                 del context.user_data["admin_state"]
                 del context.user_data["ban_user_id"]
             elif state == "await_unban_id":
                 unban_id = update.message.text
                 if unban_id in self.banned_users:
-                    del self.banned_users[unban_id]
-                    self.ban_logs.append(f"Разбан {unban_id} в {datetime.now()}")
-                    self.logs.append(f"Разбан {unban_id}")
-                    self.save_all_data()
+                    self.store.delete("banned_users", unban_id)
+                    self.store.append("ban_logs", f"Разбан {unban_id} в {datetime.now()}")
+                    self.store.append("logs", f"Разбан {unban_id}")
                     await update.message.reply_text(f"Разбан {unban_id}.")
                 else:
                     await update.message.reply_text("Пользователь не забанен.")
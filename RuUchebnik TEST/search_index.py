@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+Поисковый индекс учебников для Telegram бота RUУчебник
+Индекс в памяти по названию, автору, классу и предмету с нормализацией
+русского текста, поиском по префиксу и по триграммам (опечатки)
+
+Автор: Разработано для системы RUУчебник
+Версия: 1.0.0
+"""
+
+import heapq
+import re
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# Окончания, отбрасываемые при упрощенном стемминге (от длинных к коротким)
+RUSSIAN_ENDINGS = sorted([
+    "иями", "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими", "ых", "их",
+    "ой", "ей", "ий", "ый", "ая", "яя", "ое", "ее", "ую", "юю", "ов", "ев",
+    "ам", "ям", "ах", "ях", "ом", "ем", "ию", "ия", "ие", "ии",
+    "а", "я", "о", "е", "у", "ю", "ы", "и", "ь"
+], key=len, reverse=True)
+
+# Минимальная длина основы после отбрасывания окончания
+MIN_STEM_LENGTH = 3
+
+# Максимальная длина индексируемого префикса
+MAX_PREFIX_LENGTH = 10
+
+# Минимальное сходство по триграммам для нечеткого совпадения
+TRIGRAM_THRESHOLD = 0.4
+
+# Вес совпадения в зависимости от его качества
+MATCH_EXACT = 1.0
+MATCH_PREFIX = 0.8
+MATCH_FUZZY = 0.6
+
+# Вес полей учебника
+FIELD_WEIGHTS = (
+    ('title', 1.0),
+    ('author_name', 1.0),
+    ('author_short_name', 1.0),
+    ('subject_name', 0.6),
+    ('class_name', 0.6),
+)
+
+_TOKEN_RE = re.compile(r"[0-9a-zа-я]+")
+
+
+def normalize(text: Optional[str]) -> List[str]:
+    """
+    Разбиение текста на нормализованные слова
+
+    Нижний регистр, "ё" -> "е", знаки препинания и инициалы-точки
+    служат разделителями: "Мерзляк А.Г." -> ["мерзляк", "а", "г"]
+    """
+    if not text:
+        return []
+    return _TOKEN_RE.findall(str(text).lower().replace("ё", "е"))
+
+
+def stem(word: str) -> str:
+    """Упрощенный стемминг: отбрасывание типичного окончания"""
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+def trigrams(word: str) -> Set[str]:
+    """Триграммы слова с границами (как в pg_trgm)"""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TextbookSearchIndex:
+    """
+    Инвертированный индекс учебников
+
+    Слова учебников хранятся в словаре; к словарю построены три индекса:
+    по основе (морфология), по префиксам и по триграммам. Слово запроса
+    сначала сопоставляется со словарем, затем по найденным словам
+    берутся учебники, поэтому время поиска зависит от размера словаря
+    совпадений, а не от числа учебников.
+
+    Учебник попадает в выдачу, если совпали все слова запроса.
+    Сортировка - по качеству совпадения, затем по числу скачиваний.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        """Очистка индекса"""
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        self._doc_words: Dict[str, Dict[str, float]] = {}
+        self._word_docs: Dict[str, Set[str]] = defaultdict(set)
+        self._stem_words: Dict[str, Set[str]] = defaultdict(set)
+        self._prefix_words: Dict[str, Set[str]] = defaultdict(set)
+        self._trigram_words: Dict[str, Set[str]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def __contains__(self, textbook_id: Any) -> bool:
+        return str(textbook_id) in self._docs
+
+    # -------------------------------------------------------------------------
+    # Обновление индекса
+    # -------------------------------------------------------------------------
+
+    def _add_word(self, word: str) -> None:
+        """Регистрация нового слова в словаре"""
+        self._stem_words[stem(word)].add(word)
+        for length in range(1, min(len(word), MAX_PREFIX_LENGTH) + 1):
+            self._prefix_words[word[:length]].add(word)
+        for trigram in trigrams(word):
+            self._trigram_words[trigram].add(word)
+
+    def _drop_word(self, word: str) -> None:
+        """Удаление слова, которое больше не встречается ни в одном учебнике"""
+        del self._word_docs[word]
+        postings = [self._stem_words[stem(word)]]
+        postings.extend(self._prefix_words[word[:length]]
+                        for length in range(1, min(len(word), MAX_PREFIX_LENGTH) + 1))
+        postings.extend(self._trigram_words[trigram] for trigram in trigrams(word))
+        for words in postings:
+            words.discard(word)
+
+    def add(self, textbook: Dict[str, Any]) -> None:
+        """
+        Добавление или обновление учебника
+
+        Args:
+            textbook: Данные учебника (id, title, author_name, class_name, ...)
+        """
+        textbook_id = str(textbook['id'])
+        if textbook_id in self._docs:
+            self.remove(textbook_id)
+
+        weights: Dict[str, float] = {}
+        for field, weight in FIELD_WEIGHTS:
+            for word in normalize(textbook.get(field)):
+                if weights.get(word, 0.0) < weight:
+                    weights[word] = weight
+
+        self._docs[textbook_id] = dict(textbook)
+        self._doc_words[textbook_id] = weights
+        for word in weights:
+            if word not in self._word_docs:
+                self._add_word(word)
+            self._word_docs[word].add(textbook_id)
+
+    def remove(self, textbook_id: Any) -> None:
+        """Удаление учебника (например, после деактивации)"""
+        textbook_id = str(textbook_id)
+        if self._docs.pop(textbook_id, None) is None:
+            return
+        for word in self._doc_words.pop(textbook_id):
+            docs = self._word_docs[word]
+            docs.discard(textbook_id)
+            if not docs:
+                self._drop_word(word)
+
+    def rebuild(self, textbooks: Iterable[Dict[str, Any]]) -> None:
+        """Полная перестройка индекса"""
+        self.clear()
+        for textbook in textbooks:
+            self.add(textbook)
+
+    def get(self, textbook_id: Any) -> Optional[Dict[str, Any]]:
+        """Данные учебника из индекса (копия) или None"""
+        doc = self._docs.get(str(textbook_id))
+        return dict(doc) if doc is not None else None
+
+    def update_fields(self, textbook_id: Any, **fields: Any) -> None:
+        """Обновление полей учебника, не влияющих на поиск (например, file_id)"""
+        doc = self._docs.get(str(textbook_id))
+        if doc is not None:
+            doc.update(fields)
+
+    def add_downloads(self, deltas: Dict[Any, int]) -> None:
+        """Учет новых скачиваний для сортировки результатов"""
+        for textbook_id, delta in deltas.items():
+            doc = self._docs.get(str(textbook_id))
+            if doc is not None:
+                doc['download_count'] = (doc.get('download_count') or 0) + delta
+
+    # -------------------------------------------------------------------------
+    # Поиск
+    # -------------------------------------------------------------------------
+
+    def _match_words(self, query_word: str) -> Dict[str, float]:
+        """Слова словаря, подходящие к слову запроса, с качеством совпадения"""
+        matches: Dict[str, float] = {}
+
+        if query_word in self._word_docs:
+            matches[query_word] = MATCH_EXACT
+        for word in self._stem_words.get(stem(query_word), ()):
+            matches[word] = MATCH_EXACT
+
+        prefix = query_word[:MAX_PREFIX_LENGTH]
+        for word in self._prefix_words.get(prefix, ()):
+            if word not in matches and word.startswith(query_word):
+                matches[word] = MATCH_PREFIX
+
+        # Нечеткий поиск (опечатки) - только если точных совпадений нет
+        # и слово достаточно длинное
+        if not matches and len(query_word) >= 4:
+            query_trigrams = trigrams(query_word)
+            shared: Dict[str, int] = defaultdict(int)
+            for trigram in query_trigrams:
+                for word in self._trigram_words.get(trigram, ()):
+                    shared[word] += 1
+            for word, count in shared.items():
+                similarity = count / (len(query_trigrams) + len(word) + 1 - count)
+                if similarity >= TRIGRAM_THRESHOLD:
+                    matches[word] = MATCH_FUZZY * similarity
+
+        return matches
+
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Поиск учебников
+
+        Args:
+            query: Поисковый запрос
+            limit: Максимальное количество результатов
+
+        Returns:
+            List[Dict]: Найденные учебники (лучшие совпадения первыми)
+        """
+        matched_words = [self._match_words(word) for word in dict.fromkeys(normalize(query))]
+        if not matched_words or not all(matched_words):
+            return []
+
+        # Пересечение начинаем с самого редкого слова запроса: дальше
+        # проверяются только уже найденные учебники
+        matched_words.sort(key=lambda matches: sum(len(self._word_docs[word]) for word in matches))
+
+        scores: Dict[str, float] = {}
+        for word, quality in matched_words[0].items():
+            for textbook_id in self._word_docs[word]:
+                score = quality * self._doc_words[textbook_id][word]
+                if score > scores.get(textbook_id, 0.0):
+                    scores[textbook_id] = score
+
+        for matches in matched_words[1:]:
+            next_scores: Dict[str, float] = {}
+            for textbook_id, score in scores.items():
+                doc_words = self._doc_words[textbook_id]
+                best = max((quality * doc_words[word] for word, quality in matches.items()
+                            if word in doc_words), default=0.0)
+                if best:
+                    next_scores[textbook_id] = score + best
+            scores = next_scores
+            if not scores:
+                return []
+
+        ranked: List[Tuple[float, int, str, str]] = heapq.nsmallest(limit, (
+            (-score, -(self._docs[textbook_id].get('download_count') or 0),
+             self._docs[textbook_id].get('title') or "", textbook_id)
+            for textbook_id, score in scores.items()
+        ))
+        return [dict(self._docs[item[3]]) for item in ranked]
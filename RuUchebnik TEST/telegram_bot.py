@@ -2,7 +2,9 @@ import asyncio
 import logging
 import os
 import sys
-from typing import Dict, List, Optional
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, BotCommand
 from telegram.ext import (
     Application, 
@@ -12,13 +14,47 @@ from telegram.ext import (
     filters,
     ContextTypes
 )
-from telegram.error import TelegramError
+from telegram.error import TelegramError, BadRequest
 from bot.config import (
     BOT_TOKEN, ADMIN_ID, RULES_TEXT, HELP_TEXT, ABOUT_TEXT,
     ERROR_MESSAGES, SUCCESS_MESSAGES, KEYBOARD_TEXTS,
     CLASSES, SUBJECTS, ADMIN_COMMANDS
 )
 from bot.database import db
+from bot.activity_tracker import ActivityTracker
+from bot.broadcast import BroadcastEngine, MAX_ALBUM_SIZE, media_payload
+
+# Logs shown per page of /logs
+LOGS_PAGE_SIZE = 10
+
+# Album parts arrive as separate updates; wait this long for the rest
+ALBUM_COLLECT_DELAY = 1.5
+
+_EPOCH = datetime(1970, 1, 1)
+_BASE36 = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def encode_log_cursor(log: Dict) -> Optional[str]:
+    """Callback data for the page after `log`: logs_<base36 microseconds>_<uuid hex>"""
+    try:
+        key = uuid.UUID(log["id"]).hex
+    except (TypeError, ValueError):
+        return None
+    micros = (log["timestamp"] - _EPOCH) // timedelta(microseconds=1)
+    digits = ""
+    while True:
+        micros, digit = divmod(micros, 36)
+        digits = _BASE36[digit] + digits
+        if not micros:
+            break
+    # 5 + 10 + 1 + 32 bytes - within Telegram's 64-byte callback_data limit
+    return f"logs_{digits}_{key}"
+
+
+def decode_log_cursor(data: str) -> Tuple[datetime, str]:
+    """Inverse of encode_log_cursor: (timestamp, id) keyset cursor"""
+    _, digits, key = data.split("_", 2)
+    return _EPOCH + timedelta(microseconds=int(digits, 36)), str(uuid.UUID(key))
 
 # Configure logging
 logging.basicConfig(
@@ -30,13 +66,28 @@ logger = logging.getLogger(__name__)
 class RUUchebnikBot:
     def __init__(self):
         self.application = None
+        self.activity: Optional[ActivityTracker] = None
+        self.broadcasts: Optional[BroadcastEngine] = None
+        # broadcast id -> (chat id, message id) of the admin's progress message
+        self._broadcast_reports: Dict[str, Tuple[int, int]] = {}
+        # media_group_id -> parts of an album the admin is sending as a broadcast
+        self._broadcast_albums: Dict[str, Dict] = {}
     
     async def initialize(self):
         """Initialize bot and database"""
         await db.initialize()
         
+        # last_active is written in batches instead of on every update
+        self.activity = ActivityTracker(db)
+        await self.activity.start()
+        
         # Create application
-        self.application = Application.builder().token(BOT_TOKEN).build()
+        self.application = Application.builder().token(BOT_TOKEN).post_init(self.post_init).build()
+        
+        # Broadcasts run in the background with persisted per-recipient progress
+        self.broadcasts = BroadcastEngine(
+            self.application.bot, db, on_progress=self.report_broadcast_progress
+        )
         
         # Add handlers
         self.add_handlers()
@@ -46,6 +97,12 @@ class RUUchebnikBot:
         
         logger.info("Bot initialized successfully")
     
+    async def post_init(self, application: Application):
+        """Resume broadcasts interrupted by the previous shutdown"""
+        resumed = await self.broadcasts.resume_unfinished()
+        if resumed:
+            logger.info(f"Resumed {resumed} unfinished broadcast(s)")
+    
     def add_handlers(self):
         """Add all bot handlers"""
         # Command handlers
@@ -67,6 +124,9 @@ class RUUchebnikBot:
         
         # Message handler for broadcasts
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
+        self.application.add_handler(MessageHandler(
+            filters.PHOTO | filters.Document.ALL | filters.VIDEO, self.handle_broadcast_media
+        ))
     
     async def set_bot_commands(self):
         """Set bot commands in menu"""
@@ -103,7 +163,11 @@ class RUUchebnikBot:
                 user.last_name
             )
         
-        await db.update_user_activity(str(user.id))
+        self.activity.touch(user.id)
+        
+        # A user who blocked the bot and came back gets broadcasts again
+        if user_data.get("blocked_bot_at"):
+            await db.clear_bot_blocked(str(user.id))
         
         # Check if user agreed to rules
         if not user_data["agreed"]:
@@ -298,7 +362,14 @@ class RUUchebnikBot:
         user_id = str(update.effective_user.id)
         textbook = await db.get_textbook(textbook_id)
         
-        if not textbook or not os.path.exists(textbook["file_path"]):
+        if not textbook:
+            await update.callback_query.answer(ERROR_MESSAGES["file_not_found"], show_alert=True)
+            return
+        
+        # A file_id from a previous upload lets us skip streaming the PDF again
+        cached_file_id = textbook.get("telegram_file_id")
+        
+        if not cached_file_id and not os.path.exists(textbook["file_path"]):
             await update.callback_query.answer(ERROR_MESSAGES["file_not_found"], show_alert=True)
             return
         
@@ -306,14 +377,34 @@ class RUUchebnikBot:
             # Send download starting message
             await update.callback_query.answer(SUCCESS_MESSAGES["download_started"])
             
-            # Send the file
-            with open(textbook["file_path"], 'rb') as file:
-                await context.bot.send_document(
-                    chat_id=update.effective_chat.id,
-                    document=file,
-                    filename=textbook["file_name"],
-                    caption=f"📖 {textbook['title']}\n👤 {textbook['author']}"
-                )
+            caption = f"📖 {textbook['title']}\n👤 {textbook['author']}"
+            sent_message = None
+            
+            if cached_file_id:
+                try:
+                    sent_message = await context.bot.send_document(
+                        chat_id=update.effective_chat.id,
+                        document=cached_file_id,
+                        caption=caption
+                    )
+                except BadRequest as e:
+                    # Telegram rejected the stored file_id - fall back to a fresh upload
+                    logger.warning(f"Stale file_id for textbook {textbook_id}: {e}")
+                    await db.clear_textbook_file_id(textbook_id)
+            
+            if sent_message is None:
+                # Send the file
+                with open(textbook["file_path"], 'rb') as file:
+                    sent_message = await context.bot.send_document(
+                        chat_id=update.effective_chat.id,
+                        document=file,
+                        filename=textbook["file_name"],
+                        caption=caption
+                    )
+                
+                # Remember file_id for the next downloads
+                if sent_message.document:
+                    await db.set_textbook_file_id(textbook_id, sent_message.document.file_id)
             
             # Update statistics
             await db.increment_textbook_downloads(textbook_id)
@@ -385,6 +476,13 @@ class RUUchebnikBot:
                 textbook_id = data.replace("download_", "")
                 await self.download_textbook(update, context, textbook_id)
             
+            elif data.startswith("bc_") and update.effective_user.id == ADMIN_ID:
+                await self.handle_broadcast_control(update, data)
+            
+            elif data.startswith("logs_") and update.effective_user.id == ADMIN_ID:
+                text, keyboard = await self.render_logs_page(before=decode_log_cursor(data))
+                await query.edit_message_text(text, parse_mode='HTML', reply_markup=keyboard)
+            
             elif data == "solver":
                 # Removed solver functionality - show "Soon..." message
                 await query.answer(KEYBOARD_TEXTS["soon"], show_alert=True)
@@ -401,7 +499,7 @@ class RUUchebnikBot:
         user_id = str(update.effective_user.id)
         
         # Check if this is a broadcast response from admin
-        if user_id == str(ADMIN_ID) and hasattr(context.user_data, 'waiting_for_broadcast'):
+        if user_id == str(ADMIN_ID) and context.user_data.get('waiting_for_broadcast'):
             await self.handle_admin_broadcast_message(update, context)
         else:
             # Regular user message - suggest using menu
@@ -414,8 +512,11 @@ class RUUchebnikBot:
         """Check if user has access (not banned, agreed to rules)"""
         user_id = str(update.effective_user.id)
         
+        # Ban, agreement and activity update in one (cached) query
+        access = await db.check_access(user_id)
+        
         # Check if banned
-        ban_info = await db.is_user_banned(user_id)
+        ban_info = access["ban"]
         if ban_info:
             message = ERROR_MESSAGES["banned"].format(
                 reason=ban_info["reason"],
@@ -428,8 +529,7 @@ class RUUchebnikBot:
             return False
         
         # Check if agreed to rules
-        user_data = await db.get_user(user_id)
-        if not user_data or not user_data["agreed"]:
+        if not access["agreed"]:
             message = ERROR_MESSAGES["not_agreed"]
             if update.callback_query:
                 await update.callback_query.answer(message, show_alert=True)
@@ -437,8 +537,7 @@ class RUUchebnikBot:
                 await update.message.reply_text(message)
             return False
         
-        # Update activity
-        await db.update_user_activity(user_id)
+        self.activity.touch(user_id)
         return True
     
     # Admin Commands
@@ -448,13 +547,15 @@ class RUUchebnikBot:
             return
         
         stats = await db.get_stats()
+        activity = self.activity.stats()
         
         text = f"""
 📊 <b>Статистика RUУчебник</b>
 
 👥 Всего пользователей: {stats['total_users']}
 📚 Всего учебников: {stats['total_textbooks']}
-🟢 Активных сегодня: {stats['active_today']}
+🟢 Активных сегодня: {activity['active_today']}
+📶 Онлайн (5 мин): {activity['active_now']}
 📥 Всего скачиваний: {stats['total_downloads']}
 ⚡ Запросов сегодня: {stats['requests_today']}
 
@@ -470,9 +571,11 @@ class RUUchebnikBot:
         
         # For simplicity, just show stats
         stats = await db.get_stats()
+        activity = self.activity.stats()
         await update.message.reply_text(
             f"👥 Всего пользователей в системе: {stats['total_users']}\n"
-            f"🟢 Активных сегодня: {stats['active_today']}\n\n"
+            f"🟢 Активных сегодня: {activity['active_today']}\n"
+            f"📶 Онлайн (5 мин): {activity['active_now']}\n\n"
             f"Подробная информация доступна в веб-панели администратора."
         )
     
@@ -483,7 +586,9 @@ class RUUchebnikBot:
         
         context.user_data['waiting_for_broadcast'] = True
         await update.message.reply_text(
-            "📢 Введите сообщение для рассылки всем пользователям:\n\n"
+            "📢 Введите сообщение для рассылки всем пользователям.\n"
+            "Можно отправить фото, документ или альбом с подписью.\n"
+            "В тексте доступны {name}, {first_name}, {username}.\n\n"
             "Отправьте /cancel для отмены."
         )
     
@@ -494,34 +599,144 @@ class RUUchebnikBot:
             await update.message.reply_text("❌ Рассылка отменена.")
             return
         
-        message = update.message.text
-        user_ids = await db.get_all_user_ids()
-        
-        await update.message.reply_text(f"📤 Начинаю рассылку для {len(user_ids)} пользователей...")
-        
-        sent_count = 0
-        failed_count = 0
-        
-        for user_id in user_ids:
-            try:
-                await context.bot.send_message(chat_id=user_id, text=message)
-                sent_count += 1
-                await asyncio.sleep(0.1)  # Rate limiting
-            except Exception as e:
-                failed_count += 1
-                logger.warning(f"Failed to send broadcast to {user_id}: {e}")
+        context.user_data.pop('waiting_for_broadcast', None)
+        await self.start_broadcast(update.message, update.message.text)
+    
+    async def start_broadcast(self, message, text: str, media: Optional[List[Tuple[str, str]]] = None):
+        """Create a broadcast from the admin's message and start sending it"""
+        payload = media_payload(media) if media else None
+        # Recipients are fixed and stored up front; the engine sends in the background
+        broadcast = await db.create_broadcast(
+            text or "", str(message.from_user.id),
+            image_url=media[0][1] if media else None, payload=payload
+        )
+        report = await message.reply_text(
+            f"📤 Начинаю рассылку для {broadcast['total']} пользователей...",
+            reply_markup=self.broadcast_keyboard(broadcast["id"], "running")
+        )
+        self._broadcast_reports[broadcast["id"]] = (report.chat_id, report.message_id)
+        await self.broadcasts.start(broadcast["id"])
+    
+    @staticmethod
+    def _attachment(message) -> Optional[Tuple[str, str]]:
+        """(type, file_id) of a photo, document or video message"""
+        if message.photo:
+            return "photo", message.photo[-1].file_id
+        if message.video:
+            return "video", message.video.file_id
+        if message.document:
+            return "document", message.document.file_id
+        return None
+    
+    async def handle_broadcast_media(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        Photo, document or album sent by the admin as a broadcast
+        
+        The file is already on Telegram's servers, so every recipient gets
+        it by file_id - nothing is uploaded again per user. Album parts
+        arrive as separate updates and are collected by media_group_id.
+        """
+        if str(update.effective_user.id) != str(ADMIN_ID) or not context.user_data.get('waiting_for_broadcast'):
+            return
         
-        # Save broadcast record
-        await db.save_broadcast(message, sent_count, str(update.effective_user.id))
+        message = update.message
+        attachment = self._attachment(message)
+        if attachment is None:
+            return
         
-        context.user_data.pop('waiting_for_broadcast', None)
+        if not message.media_group_id:
+            context.user_data.pop('waiting_for_broadcast', None)
+            await self.start_broadcast(message, message.caption, [attachment])
+            return
         
-        await update.message.reply_text(
-            f"✅ Рассылка завершена!\n\n"
-            f"📤 Отправлено: {sent_count}\n"
-            f"❌ Ошибок: {failed_count}"
+        album = self._broadcast_albums.get(message.media_group_id)
+        if album is None:
+            album = {"message": message, "caption": None, "parts": [], "task": None}
+            self._broadcast_albums[message.media_group_id] = album
+        album["parts"].append((message.message_id, attachment))
+        if message.caption:
+            album["caption"] = message.caption
+        if album["task"] is not None:
+            album["task"].cancel()
+        album["task"] = asyncio.create_task(
+            self._finish_broadcast_album(message.media_group_id, context.user_data)
         )
     
+    async def _finish_broadcast_album(self, media_group_id: str, user_data: Dict):
+        """Start the album broadcast once no more parts arrive"""
+        await asyncio.sleep(ALBUM_COLLECT_DELAY)
+        album = self._broadcast_albums.pop(media_group_id)
+        user_data.pop('waiting_for_broadcast', None)
+        media = [attachment for _, attachment in sorted(album["parts"])][:MAX_ALBUM_SIZE]
+        try:
+            await self.start_broadcast(album["message"], album["caption"], media)
+        except Exception as e:
+            logger.error(f"Error starting album broadcast: {e}")
+    
+    @staticmethod
+    def broadcast_keyboard(broadcast_id: str, status: str) -> Optional[InlineKeyboardMarkup]:
+        """Pause/resume/cancel buttons for a broadcast progress message"""
+        if status == "running":
+            buttons = [InlineKeyboardButton("⏸ Пауза", callback_data=f"bc_pause_{broadcast_id}")]
+        elif status == "paused":
+            buttons = [InlineKeyboardButton("▶️ Продолжить", callback_data=f"bc_resume_{broadcast_id}")]
+        else:
+            return None
+        buttons.append(InlineKeyboardButton("✖️ Отменить", callback_data=f"bc_cancel_{broadcast_id}"))
+        return InlineKeyboardMarkup([buttons])
+    
+    async def report_broadcast_progress(self, stats: Dict):
+        """Show live broadcast progress to the admin (edits one message)"""
+        titles = {
+            "running": "📤 Рассылка идет",
+            "paused": "⏸ Рассылка на паузе",
+            "cancelled": "✖️ Рассылка отменена",
+            "done": "✅ Рассылка завершена!",
+        }
+        eta = ""
+        if stats["status"] == "running" and stats["eta"] is not None:
+            eta = f"\n⏳ Осталось: ~{int(stats['eta'] // 60)} мин {int(stats['eta'] % 60)} с"
+        text = (
+            f"{titles.get(stats['status'], stats['status'])}\n\n"
+            f"📊 Обработано: {stats['done']}/{stats['total']}\n"
+            f"📤 Отправлено: {stats['sent']}\n"
+            f"🚫 Заблокировали бота: {stats['blocked']}\n"
+            f"❌ Ошибок: {stats['failed']}\n"
+            f"⚡ Скорость: {stats['rate']:.1f} сообщ./с"
+            f"{eta}"
+        )
+        keyboard = self.broadcast_keyboard(stats["broadcast_id"], stats["status"])
+        
+        bot = self.application.bot
+        target = self._broadcast_reports.get(stats["broadcast_id"])
+        if target is None:
+            # Resumed after a restart: start a new progress message
+            message = await bot.send_message(chat_id=ADMIN_ID, text=text, reply_markup=keyboard)
+            self._broadcast_reports[stats["broadcast_id"]] = (message.chat_id, message.message_id)
+        else:
+            try:
+                await bot.edit_message_text(text, chat_id=target[0], message_id=target[1],
+                                            reply_markup=keyboard)
+            except BadRequest as e:
+                if "not modified" not in str(e).lower():
+                    raise
+        if stats["status"] in ("done", "cancelled"):
+            self._broadcast_reports.pop(stats["broadcast_id"], None)
+    
+    async def handle_broadcast_control(self, update: Update, data: str):
+        """Pause, resume or cancel a broadcast from its progress message"""
+        _, action, broadcast_id = data.split("_", 2)
+        query = update.callback_query
+        self._broadcast_reports[broadcast_id] = (query.message.chat_id, query.message.message_id)
+        
+        if action == "pause":
+            await self.broadcasts.pause(broadcast_id)
+        elif action == "resume":
+            await self.broadcasts.start(broadcast_id)
+        elif action == "cancel":
+            if not await self.broadcasts.cancel(broadcast_id):
+                await query.edit_message_text("✖️ Рассылка отменена.")
+    
     async def admin_ban(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Ban user command (admin only)"""
         if not await self.check_admin(update):
@@ -583,13 +798,17 @@ class RUUchebnikBot:
         if not await self.check_admin(update):
             return
         
-        logs = await db.get_recent_logs(10)
+        text, keyboard = await self.render_logs_page()
+        await update.message.reply_text(text, parse_mode='HTML', reply_markup=keyboard)
+    
+    async def render_logs_page(self, before: Optional[Tuple[datetime, str]] = None):
+        """Text and "older" button for one page of logs (keyset-paged by (timestamp, id))"""
+        logs = await db.get_recent_logs(LOGS_PAGE_SIZE, before=before)
         
         if not logs:
-            await update.message.reply_text("📝 Логи пусты")
-            return
+            return ("📝 Логи пусты" if before is None else "📝 Более старых записей нет"), None
         
-        text = "📝 <b>Последние 10 записей логов:</b>\n\n"
+        text = f"📝 <b>Записи логов ({len(logs)}):</b>\n\n"
         
         for log in logs:
             timestamp = log['timestamp'].strftime('%d.%m %H:%M')
@@ -597,7 +816,11 @@ class RUUchebnikBot:
         
         text += f"\nПодробные логи доступны в веб-панели."
         
-        await update.message.reply_text(text, parse_mode='HTML')
+        cursor = encode_log_cursor(logs[-1]) if len(logs) == LOGS_PAGE_SIZE else None
+        keyboard = None
+        if cursor:
+            keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Старше", callback_data=cursor)]])
+        return text, keyboard
     
     async def check_admin(self, update: Update) -> bool:
         """Check if user is admin"""
@@ -616,6 +839,11 @@ class RUUchebnikBot:
             logger.error(f"Bot error: {e}")
             raise
         finally:
+            if self.broadcasts:
+                # Progress is saved; running broadcasts continue on the next start
+                await self.broadcasts.shutdown()
+            if self.activity:
+                await self.activity.stop()
             await db.close()
 
 # Main execution
@@ -9,7 +9,6 @@
 
 import logging
 import asyncio
-import hashlib
 import time
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, List, Union
@@ -17,10 +16,12 @@ from pathlib import Path
 
 from config import BOT_CONFIG, LOGGING_CONFIG
 from database import DatabaseManager
+from rate_limiter import TokenBucketLimiter, default_limiter
+from blob_store import hash_file
 
 
-# Глобальное хранилище для rate limiting
-_rate_limit_storage: Dict[int, List[float]] = {}
+# Лимитеры с нестандартными параметрами (max_requests, window_seconds)
+_custom_limiters: Dict[tuple, TokenBucketLimiter] = {}
 
 # Настройка логирования
 def setup_logging():
@@ -91,32 +92,23 @@ async def is_rate_limited(user_id: int, max_requests: Optional[int] = None,
     Returns:
         bool: True если превышен лимит, False если можно продолжать
     """
-    global _rate_limit_storage
+    limiter = default_limiter
     
-    # Используем значения из конфигурации по умолчанию
-    if max_requests is None:
-        max_requests = BOT_CONFIG['rate_limit_requests']
-    if window_seconds is None:
-        window_seconds = BOT_CONFIG['rate_limit_window']
+    # Для нестандартных параметров - отдельный лимитер с теми же параметрами
+    if max_requests is not None or window_seconds is not None:
+        max_requests = max_requests or BOT_CONFIG['rate_limit_requests']
+        window_seconds = window_seconds or BOT_CONFIG['rate_limit_window']
+        key = (max_requests, window_seconds)
+        limiter = _custom_limiters.get(key)
+        if limiter is None:
+            limiter = TokenBucketLimiter(
+                rate=max_requests / window_seconds,
+                capacity=max_requests,
+                max_keys=BOT_CONFIG.get('rate_limit_max_users', 100_000)
+            )
+            _custom_limiters[key] = limiter
     
-    current_time = time.time()
-    
-    # Получаем историю запросов пользователя
-    user_requests = _rate_limit_storage.get(user_id, [])
-    
-    # Убираем старые запросы за пределами временного окна
-    cutoff_time = current_time - window_seconds
-    user_requests = [req_time for req_time in user_requests if req_time > cutoff_time]
-    
-    # Проверяем превышение лимита
-    if len(user_requests) >= max_requests:
-        return True
-    
-    # Добавляем текущий запрос
-    user_requests.append(current_time)
-    _rate_limit_storage[user_id] = user_requests
-    
-    return False
+    return limiter.is_limited(user_id)
 
 
 def get_rate_limit_reset_time(user_id: int) -> Optional[datetime]:
@@ -129,17 +121,12 @@ def get_rate_limit_reset_time(user_id: int) -> Optional[datetime]:
     Returns:
         Optional[datetime]: Время сброса лимита или None если лимит не превышен
     """
-    global _rate_limit_storage
-    
-    user_requests = _rate_limit_storage.get(user_id, [])
-    if not user_requests:
+    seconds = default_limiter.time_to_full(user_id)
+    if not seconds:
         return None
     
-    # Время сброса = время первого запроса + окно лимита
-    oldest_request = min(user_requests)
-    reset_time = datetime.fromtimestamp(oldest_request + BOT_CONFIG['rate_limit_window'])
-    
-    return reset_time if reset_time > datetime.now() else None
+    # Время, когда ведро пользователя снова станет полным
+    return datetime.now() + timedelta(seconds=seconds)
 
 
 async def log_user_action(db: DatabaseManager, user_id: str, action: str, 
@@ -210,6 +197,10 @@ def format_duration(seconds: int) -> str:
         return f"{days}д {hours}ч"
 
 
+# Посчитанные хеши: (путь, алгоритм) -> (размер, mtime в нс, хеш)
+_file_hash_cache: Dict[tuple, tuple] = {}
+
+
 def create_file_hash(file_path: Union[str, Path], algorithm: str = 'md5') -> str:
     """
     Создание хеша файла для проверки целостности
@@ -224,28 +215,28 @@ def create_file_hash(file_path: Union[str, Path], algorithm: str = 'md5') -> str
     Raises:
         FileNotFoundError: Если файл не найден
         ValueError: Если алгоритм не поддерживается
+        
+    Результат запоминается: пока размер и время изменения файла
+    те же, повторный вызов не читает файл.
     """
     file_path = Path(file_path)
     
     if not file_path.exists():
         raise FileNotFoundError(f"Файл не найден: {file_path}")
     
-    # Выбираем алгоритм хеширования
-    if algorithm == 'md5':
-        hash_obj = hashlib.md5()
-    elif algorithm == 'sha1':
-        hash_obj = hashlib.sha1()
-    elif algorithm == 'sha256':
-        hash_obj = hashlib.sha256()
-    else:
+    if algorithm not in ('md5', 'sha1', 'sha256'):
         raise ValueError(f"Неподдерживаемый алгоритм: {algorithm}")
     
-    # Читаем файл по частям для экономии памяти
-    with open(file_path, 'rb') as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            hash_obj.update(chunk)
+    stat = file_path.stat()
+    key = (str(file_path.resolve()), algorithm)
+    cached = _file_hash_cache.get(key)
+    if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+        return cached[2]
     
-    return hash_obj.hexdigest()
+    # Большие файлы хешируются через mmap, остальные - блоками по 1 МБ
+    digest, _ = hash_file(str(file_path), algorithm)
+    _file_hash_cache[key] = (stat.st_size, stat.st_mtime_ns, digest)
+    return digest
 
 
 def validate_file_type(file_path: Union[str, Path], 
@@ -301,32 +292,19 @@ def sanitize_filename(filename: str) -> str:
 
 async def cleanup_rate_limit_storage(max_age_hours: int = 24):
     """
-    Очистка устаревших записей из хранилища лимитов
+    Очистка записей лимитов пользователей, у которых ведро уже полное
     
     Args:
-        max_age_hours: Максимальный возраст записей в часах
+        max_age_hours: Не используется (оставлен для совместимости);
+            полное ведро хранить не нужно независимо от давности
     """
-    global _rate_limit_storage
-    
-    cutoff_time = time.time() - (max_age_hours * 3600)
-    
-    users_to_remove = []
-    for user_id, requests in _rate_limit_storage.items():
-        # Фильтруем старые запросы
-        recent_requests = [req_time for req_time in requests if req_time > cutoff_time]
-        
-        if recent_requests:
-            _rate_limit_storage[user_id] = recent_requests
-        else:
-            users_to_remove.append(user_id)
-    
-    # Удаляем пользователей без недавних запросов
-    for user_id in users_to_remove:
-        del _rate_limit_storage[user_id]
+    removed = default_limiter.purge_idle()
+    for limiter in _custom_limiters.values():
+        removed += limiter.purge_idle()
     
     logger = logging.getLogger(__name__)
-    if users_to_remove:
-        logger.info(f"🧹 Очищены данные лимитов для {len(users_to_remove)} пользователей")
+    if removed:
+        logger.info(f"🧹 Очищены данные лимитов для {removed} пользователей")
 
 
 def format_number(number: int, use_thousands_separator: bool = True) -> str: